@@ -0,0 +1,94 @@
+"""Cache persistente de resultados de análise, indexado pelo conteúdo dos arquivos
+
+O hash do conteúdo não depende do nome nem da pasta do arquivo: o mesmo selo copiado
+para outro lugar reaproveita a análise, e um selo editado com o mesmo nome é analisado de novo.
+Os resultados ficam em arquivos JSON em ~/.video_cutter/analise.
+
+Para vídeos de entrada (vários GB), file_sample_hash lê apenas alguns blocos do arquivo.
+"""
+import hashlib
+import json
+import os
+import threading
+
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".video_cutter", "analise")
+# Tamanho dos blocos lidos ao calcular o hash
+HASH_CHUNK_SIZE = 1024 * 1024
+# Número de blocos amostrados por file_sample_hash (distribuídos do início ao fim do arquivo)
+SAMPLE_BLOCKS = 8
+
+# Hashes já calculados nesta execução: (caminho, tamanho, mtime) -> hash
+_hash_cache = {}
+_hash_cache_lock = threading.Lock()
+
+
+def file_content_hash(path):
+    """Retorna o SHA-1 do conteúdo do arquivo (memorizado enquanto o arquivo não mudar)"""
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime)
+    with _hash_cache_lock:
+        if key in _hash_cache:
+            return _hash_cache[key]
+
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    content_hash = digest.hexdigest()
+
+    with _hash_cache_lock:
+        _hash_cache[key] = content_hash
+    return content_hash
+
+
+def file_sample_hash(path):
+    """Hash do tamanho e de SAMPLE_BLOCKS blocos do arquivo, para arquivos grandes demais para ler inteiros
+
+    Dois vídeos diferentes com o mesmo tamanho e os mesmos blocos amostrados são, na prática, impossíveis.
+    """
+    stat = os.stat(path)
+    key = ('amostra', os.path.abspath(path), stat.st_size, stat.st_mtime)
+    with _hash_cache_lock:
+        if key in _hash_cache:
+            return _hash_cache[key]
+
+    if stat.st_size <= HASH_CHUNK_SIZE * SAMPLE_BLOCKS:
+        content_hash = file_content_hash(path)
+    else:
+        digest = hashlib.sha1(str(stat.st_size).encode("ascii"))
+        step = (stat.st_size - HASH_CHUNK_SIZE) // (SAMPLE_BLOCKS - 1)
+        with open(path, "rb") as f:
+            for index in range(SAMPLE_BLOCKS):
+                f.seek(index * step)
+                digest.update(f.read(HASH_CHUNK_SIZE))
+        content_hash = "s" + digest.hexdigest()
+
+    with _hash_cache_lock:
+        _hash_cache[key] = content_hash
+    return content_hash
+
+
+def _cache_path(kind, content_hash, cache_dir):
+    return os.path.join(cache_dir or CACHE_DIR, f"{kind}_{content_hash}.json")
+
+
+def load(kind, content_hash, cache_dir=None):
+    """Retorna o resultado salvo para (tipo de análise, hash) ou None"""
+    try:
+        with open(_cache_path(kind, content_hash, cache_dir), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def store(kind, content_hash, result, cache_dir=None):
+    """Salva o resultado de uma análise; falhas de gravação apenas desativam o cache"""
+    path = _cache_path(kind, content_hash, cache_dir)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"Aviso: não foi possível salvar o cache de análise: {str(e)}")
@@ -0,0 +1,289 @@
+"""Reenquadramento automático de entradas horizontais (16:9) para a saída vertical (9:16)
+
+A entrada é decodificada uma única vez em baixa resolução e em tons de cinza (pipe rawvideo lido
+com readinto em um buffer NumPy alocado uma só vez, como em cut_planner). Para cada frame amostrado
+são calculados, de forma vetorizada:
+- movimento: diferença absoluta em relação ao frame anterior;
+- saliência: contraste local (diferença em relação à média de uma vizinhança, por somas acumuladas).
+A soma dos dois por coluna dá a "energia" de cada coluna; o centro do recorte vertical de cada
+frame é a janela de colunas com mais energia, e o peso do frame é o quanto essa janela se destaca.
+
+Para cada parte, os centros são suavizados (média ponderada pelo peso, puxada para o centro do
+quadro quando não há nada em destaque) e a velocidade da panorâmica é limitada. A suavização usa
+uma margem de PATH_MARGIN segundos antes e depois da parte e, nas bordas da entrada, só as amostras
+existentes. O caminho vira uma expressão linear por trechos no parâmetro x do filtro crop, avaliada
+a cada frame.
+
+A análise fica no cache de análise (analysis_cache) pelo hash da entrada. Sem o NumPy, o recorte
+é fixo no centro do quadro.
+
+Opção do trabalho 'reframe': True (9:16) ou {'aspect': "9:16"}.
+"""
+import math
+import threading
+import time
+
+import analysis_cache
+import ffmpeg_utils
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+REFRAME_CACHE_KIND = "enquadramento"
+# Incrementar ao mudar a análise para invalidar os resultados salvos
+REFRAME_ANALYSIS_VERSION = 1
+DEFAULT_ASPECT = "9:16"
+# Frames analisados por segundo e altura dos frames analisados (a largura mantém a proporção)
+REFRAME_ANALYSIS_FPS = 5
+REFRAME_ANALYSIS_HEIGHT = 90
+# Frames lidos do pipe por bloco
+CHUNK_FRAMES = 256
+# Lado da vizinhança usada no contraste local (pixels da análise)
+SALIENCY_RADIUS = 4
+# Peso da saliência em relação ao movimento na energia das colunas
+SALIENCY_WEIGHT = 0.5
+# Janela da média móvel do caminho (s) e peso do centro do quadro na média
+SMOOTH_SECONDS = 2.0
+CENTER_PRIOR = 0.05
+# Trecho analisado antes e depois da parte ao calcular o caminho (s)
+PATH_MARGIN = SMOOTH_SECONDS
+# Velocidade máxima da panorâmica, em frações da largura da entrada por segundo
+MAX_PAN_SPEED = 0.15
+# Intervalo entre os pontos do caminho na expressão do crop (s) e número máximo de pontos
+KNOT_INTERVAL = 1.0
+MAX_KNOTS = 150
+# A entrada só é reenquadrada se o recorte for menor que esta fração da largura
+MIN_CROP_REDUCTION = 0.9
+
+# Análises carregadas neste processo, pelo hash da entrada e a fração recortada
+_analysis_cache = {}
+_analysis_lock = threading.Lock()
+# Entradas cujo aviso de recorte fixo já foi registrado
+_warned_inputs = set()
+
+
+def require_numpy():
+    if np is None:
+        raise RuntimeError("O reenquadramento automático requer o NumPy (pip install numpy).")
+
+
+def parse_aspect(reframe):
+    """Proporção (largura / altura) da saída reenquadrada"""
+    aspect = reframe.get('aspect', DEFAULT_ASPECT) if isinstance(reframe, dict) else DEFAULT_ASPECT
+    width, height = (float(value) for value in aspect.split(":"))
+    return width / height
+
+
+def get_crop_size(input_res, aspect):
+    """Tamanho do recorte (largura par, altura da entrada), ou None se a entrada já é estreita o bastante"""
+    input_width, input_height = input_res
+    crop_width = int(input_height * aspect) // 2 * 2
+    if crop_width >= input_width * MIN_CROP_REDUCTION:
+        return None
+    return crop_width, input_height - input_height % 2
+
+
+def _box_sum(values, radius, axis):
+    """Soma móvel de 2 * radius + 1 elementos ao longo do eixo (bordas repetidas), por somas acumuladas"""
+    pad = [(0, 0)] * values.ndim
+    pad[axis] = (radius + 1, radius)
+    cumulative = np.cumsum(np.pad(values, pad, mode="edge"), axis=axis)
+    size = values.shape[axis]
+    upper = np.take(cumulative, range(2 * radius + 1, 2 * radius + 1 + size), axis=axis)
+    lower = np.take(cumulative, range(0, size), axis=axis)
+    return upper - lower
+
+
+def analyze_reframe(input_file, crop_fraction, input_res, fps=REFRAME_ANALYSIS_FPS, height=REFRAME_ANALYSIS_HEIGHT):
+    """Centro horizontal (0-1) do recorte de maior energia e peso de cada frame amostrado
+
+    Returns:
+        tuple: (centros, pesos); o frame i está no tempo i / fps
+    """
+    require_numpy()
+    width = max(2, int(round(height * input_res[0] / input_res[1] / 2)) * 2)
+    frame_size = width * height
+    window = max(1, int(round(crop_fraction * width)))
+    args = [
+        "-skip_loop_filter", "all",
+        "-i", input_file, "-an", "-sn", "-dn",
+        "-vf", f"fps={fps},scale={width}:{height}:flags=fast_bilinear",
+        "-f", "rawvideo", "-pix_fmt", "gray", "-",
+    ]
+
+    # Buffer alocado uma única vez; a linha 0 guarda o último frame do bloco anterior
+    frames = np.empty((CHUNK_FRAMES + 1, height, width), dtype=np.uint8)
+    view = memoryview(frames.reshape(-1))[frame_size:]
+    centers = []
+    weights = []
+    first = True
+
+    process = ffmpeg_utils.open_ffmpeg_pipe(args)
+    try:
+        while True:
+            read = ffmpeg_utils.read_pipe_into(process.stdout, view)
+            count = read // frame_size
+            if count == 0:
+                break
+            current = frames[1:count + 1].astype(np.float32)
+            motion = np.abs(current - frames[0:count])
+            if first:
+                motion[0] = 0.0  # O primeiro frame não tem anterior
+                first = False
+            area = (2 * SALIENCY_RADIUS + 1) ** 2
+            local_mean = _box_sum(_box_sum(current, SALIENCY_RADIUS, 1), SALIENCY_RADIUS, 2) / area
+            saliency = np.abs(current - local_mean)
+            column_energy = motion.sum(axis=1) + SALIENCY_WEIGHT * saliency.sum(axis=1)
+
+            # Energia de cada posição da janela do recorte
+            cumulative = np.concatenate([np.zeros((count, 1), dtype=np.float32),
+                                         np.cumsum(column_energy, axis=1)], axis=1)
+            window_energy = cumulative[:, window:] - cumulative[:, :-window]
+            best = window_energy.argmax(axis=1)
+            centers.append((best + window / 2.0) / width)
+            spread = window_energy.max(axis=1) - window_energy.min(axis=1)
+            weights.append(spread / (window_energy.mean(axis=1) + 1.0))
+            frames[0] = frames[count]
+            if read < len(view):
+                break
+    finally:
+        process.stdout.close()
+        process.wait()
+
+    if not centers:
+        raise RuntimeError(f"Não foi possível decodificar {input_file} para a análise de enquadramento")
+    return np.concatenate(centers).astype(np.float32), np.concatenate(weights).astype(np.float32)
+
+
+def get_reframe_analysis(input_file, crop_fraction, input_res, use_cache=True, log=print):
+    """Centros e pesos da entrada, reaproveitando a análise salva (uma única análise por processo)
+
+    Returns:
+        tuple: (centros, pesos, frames por segundo da análise)
+    """
+    require_numpy()
+    content_hash = analysis_cache.file_sample_hash(input_file)
+    key = f"{content_hash}_{crop_fraction:.4f}"
+    with _analysis_lock:
+        if key in _analysis_cache:
+            return _analysis_cache[key]
+        cached = analysis_cache.load(REFRAME_CACHE_KIND, key) if use_cache else None
+        if cached and cached.get('version') == REFRAME_ANALYSIS_VERSION:
+            result = (np.asarray(cached['centers'], dtype=np.float32),
+                      np.asarray(cached['weights'], dtype=np.float32), cached['fps'])
+        else:
+            started = time.time()
+            centers, weights = analyze_reframe(input_file, crop_fraction, input_res)
+            elapsed = time.time() - started
+            log(f"Análise de enquadramento: {len(centers) / REFRAME_ANALYSIS_FPS:.0f}s de vídeo em {elapsed:.1f}s.")
+            analysis_cache.store(REFRAME_CACHE_KIND, key, {
+                'version': REFRAME_ANALYSIS_VERSION,
+                'fps': REFRAME_ANALYSIS_FPS,
+                'centers': [round(float(center), 4) for center in centers],
+                'weights': [round(float(weight), 4) for weight in weights],
+            })
+            result = (centers, weights, REFRAME_ANALYSIS_FPS)
+        _analysis_cache[key] = result
+        return result
+
+
+def smooth_path(centers, weights, fps, crop_fraction):
+    """Caminho suavizado do centro do recorte, com a velocidade da panorâmica limitada
+
+    Perto das bordas a janela tem menos amostras; o peso do centro do quadro é proporcional ao
+    número de amostras presentes, para não puxar as pontas do caminho para o centro.
+    """
+    size = max(1, min(int(round(SMOOTH_SECONDS * fps)), len(centers)))
+    kernel = np.ones(size, dtype=np.float32)
+    samples = np.convolve(np.ones(len(centers), dtype=np.float32), kernel, mode="same")
+    weighted = np.convolve(centers * weights, kernel, mode="same") + CENTER_PRIOR * samples * 0.5
+    total = np.convolve(weights, kernel, mode="same") + CENTER_PRIOR * samples
+    path = weighted / total
+
+    max_step = MAX_PAN_SPEED / fps
+    for index in range(1, len(path)):
+        path[index] = min(max(path[index], path[index - 1] - max_step), path[index - 1] + max_step)
+    half = crop_fraction / 2.0
+    return np.clip(path, half, 1.0 - half)
+
+
+def build_crop_expression(times, positions):
+    """Expressão do x do crop: interpolação linear entre os pontos (t, x), avaliada a cada frame"""
+    terms = []
+    for index in range(len(times) - 1):
+        t0, t1 = times[index], times[index + 1]
+        x0, x1 = positions[index], positions[index + 1]
+        slope = (x1 - x0) / (t1 - t0) if t1 > t0 else 0.0
+        terms.append(f"({x0:.1f}+{slope:.3f}*(t-{t0:.2f}))*gte(t,{t0:.2f})*lt(t,{t1:.2f})")
+    terms.append(f"{positions[-1]:.1f}*gte(t,{times[-1]:.2f})")
+    return "+".join(terms)
+
+
+def get_segment_crop(job, segment, input_res, log=print):
+    """Filtro crop da parte e a resolução recortada, ou None se a opção não se aplica
+
+    O tempo t do filtro começa em 0 no início da parte (após o trim e o setpts do build_filter_complex).
+    Quando só a cabeça da parte é renderizada (cache de renderização), segment['part_duration'] é a
+    duração da parte inteira: o caminho é o mesmo da renderização completa, e a cabeça e o corpo do
+    cache se encaixam sem salto.
+    """
+    reframe = job.get('reframe')
+    if not reframe:
+        return None
+    crop_size = get_crop_size(input_res, parse_aspect(reframe))
+    if crop_size is None:
+        return None
+    crop_width, crop_height = crop_size
+    input_width = input_res[0]
+    crop_fraction = crop_width / input_width
+    centered = (input_width - crop_width) // 2
+
+    try:
+        centers, weights, fps = get_reframe_analysis(job['input_file'], crop_fraction, input_res, log=log)
+    except (RuntimeError, OSError) as e:
+        if job['input_file'] not in _warned_inputs:
+            _warned_inputs.add(job['input_file'])
+            log(f"Aviso: reenquadramento fixo no centro ({str(e)})")
+        return f"crop={crop_width}:{crop_height}:{centered}:0", crop_size
+
+    part_duration = segment.get('part_duration', segment['duration'])
+    first = int(segment['start_time'] * fps)
+    last = min(int(math.ceil((segment['start_time'] + part_duration) * fps)) + 1, len(centers))
+    if last - first < 2:
+        return f"crop={crop_width}:{crop_height}:{centered}:0", crop_size
+    # Caminho calculado com uma margem em volta da parte, para que a suavização nas suas bordas
+    # use o vídeo vizinho
+    margin = int(round(PATH_MARGIN * fps))
+    low = max(0, first - margin)
+    high = min(last + margin, len(centers))
+    path = smooth_path(centers[low:high], weights[low:high] + 1e-3, fps, crop_fraction)[first - low:last - low]
+
+    # Pontos a cada KNOT_INTERVAL segundos (mais espaçados em partes longas)
+    interval = max(KNOT_INTERVAL, part_duration / MAX_KNOTS)
+    step = max(1, int(round(interval * fps)))
+    indexes = list(range(0, len(path), step))
+    if indexes[-1] != len(path) - 1:
+        indexes.append(len(path) - 1)
+    offset = segment['start_time'] - first / fps
+    times = [max(0.0, index / fps - offset) for index in indexes]
+    positions = [min(max(float(path[index]) * input_width - crop_width / 2.0, 0.0), input_width - crop_width)
+                 for index in indexes]
+    return f"crop={crop_width}:{crop_height}:x='{build_crop_expression(times, positions)}':y=0", crop_size
+
+
+def prepare_reframe(job, input_res, log=print):
+    """Executa (ou carrega) a análise antes de as partes começarem, para que ela rode uma única vez"""
+    reframe = job.get('reframe')
+    if not reframe:
+        return
+    crop_size = get_crop_size(input_res, parse_aspect(reframe))
+    if crop_size is None:
+        log("Reenquadramento desativado: a entrada já tem a proporção da saída.")
+        return
+    try:
+        get_reframe_analysis(job['input_file'], crop_size[0] / input_res[0], input_res, log=log)
+    except (RuntimeError, OSError) as e:
+        _warned_inputs.add(job['input_file'])
+        log(f"Aviso: reenquadramento fixo no centro ({str(e)})")
@@ -0,0 +1,271 @@
+"""Ajuste da qualidade constante de cada entrada a partir de amostras codificadas
+
+Os perfis de velocidade usam valores fixos de qualidade (por exemplo -crf 23 no libx264 ou -cq 26
+no NVENC), então cenas simples e estáticas recebem muito mais bits do que precisam. Antes das
+partes, algumas amostras curtas da entrada são codificadas com o filter_complex completo em uma
+escada de valores de qualidade, a partir do valor do perfil em direção a menos bits, e cada amostra
+é comparada com uma referência sem perdas do mesmo trecho por uma métrica objetiva calculada pelo
+FFmpeg no CPU:
+
+    "ssim":  filtro ssim (padrão; meta padrão 0.98)
+    "psnr":  filtro psnr (meta padrão 40 dB)
+    "vmaf":  filtro libvmaf, quando o FFmpeg foi compilado com ele (meta padrão 93)
+
+É escolhido o valor com a menor taxa de bits em que o pior trecho ainda atinge a meta; se nem o
+valor do perfil a atinge, o perfil é mantido. As amostras são codificadas em paralelo, nas vagas do
+resource_governor, e o resultado fica salvo em ~/.video_cutter/analise (por entrada, codificador,
+perfil, métrica e meta).
+
+Opção do trabalho 'quality_target': True (SSIM com a meta padrão), um número (meta de SSIM) ou
+{'metric': "vmaf", 'target': 95}. Codificadores sem opção de qualidade constante no registro
+(AMF, QuickSync) e os pools de codificadores mantêm os parâmetros do perfil.
+
+Uso:
+    python bitrate_optimizer.py --input video.mp4 --image capa.png --selo selo.mp4 --encoder libx265 --target 0.97
+"""
+import os
+import re
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import analysis_cache
+import calibration
+import encoder_registry
+import ffmpeg_utils
+import resource_governor
+import segment_render
+
+QUALITY_CACHE_KIND = "qualidade"
+METRICS = ("ssim", "psnr", "vmaf")
+DEFAULT_TARGETS = {'ssim': 0.98, 'psnr': 40.0, 'vmaf': 93.0}
+# Valores testados, somados ao valor de qualidade do perfil (maior = menos bits)
+QUALITY_STEPS = (0, 2, 4, 6, 8)
+# Amostras por entrada e a sua duração (s)
+SAMPLE_COUNT = 3
+SAMPLE_DURATION = 8.0
+# Referência sem perdas de cada amostra
+REFERENCE_PARAMS = ["-c:v", "libx264", "-preset", "ultrafast", "-qp", "0"]
+
+METRIC_PATTERNS = {
+    'ssim': re.compile(r"SSIM .*All:([\d.]+)"),
+    'psnr': re.compile(r"PSNR .*average:([\d.]+|inf)"),
+    'vmaf': re.compile(r"VMAF score[:=]\s*([\d.]+)"),
+}
+# PSNR de amostras idênticas ("inf")
+PSNR_IDENTICAL = 100.0
+
+_vmaf_available = None
+_vmaf_lock = threading.Lock()
+
+
+def has_libvmaf():
+    """Verifica (uma vez por processo) se o FFmpeg tem o filtro libvmaf"""
+    global _vmaf_available
+    with _vmaf_lock:
+        if _vmaf_available is None:
+            ffmpeg_path = ffmpeg_utils.get_ffmpeg_path()
+            try:
+                result = ffmpeg_utils.run_hidden_command([ffmpeg_path, "-hide_banner", "-filters"]) \
+                    if ffmpeg_path else None
+                _vmaf_available = bool(result and " libvmaf " in result.stdout)
+            except OSError:
+                _vmaf_available = False
+        return _vmaf_available
+
+
+def parse_quality_target(option):
+    """Converte a opção 'quality_target' em (métrica, meta)"""
+    if option is True:
+        return "ssim", DEFAULT_TARGETS['ssim']
+    if isinstance(option, (int, float)):
+        return "ssim", float(option)
+    metric = option.get('metric', "ssim")
+    if metric not in METRICS:
+        raise ValueError(f"Métrica de qualidade inválida: {metric}")
+    return metric, float(option.get('target', DEFAULT_TARGETS[metric]))
+
+
+def score_sample(distorted_file, reference_file, metric):
+    """Compara a amostra codificada com a referência; None se o FFmpeg falhou"""
+    ffmpeg_path = ffmpeg_utils.get_ffmpeg_path()
+    if not ffmpeg_path:
+        raise FileNotFoundError("FFmpeg não encontrado no sistema ou no pacote da aplicação")
+    metric_filter = "libvmaf" if metric == "vmaf" else metric
+    cmd = [ffmpeg_path, "-hide_banner", "-nostdin", "-i", distorted_file, "-i", reference_file,
+           "-lavfi", f"[0:v][1:v]{metric_filter}", "-an", "-f", "null", "-"]
+    result = ffmpeg_utils.run_hidden_command(cmd)
+    match = METRIC_PATTERNS[metric].search(result.stderr)
+    if result.returncode != 0 or not match:
+        return None
+    return PSNR_IDENTICAL if match.group(1) == "inf" else float(match.group(1))
+
+
+def get_candidates(default_value):
+    return [default_value + step for step in QUALITY_STEPS]
+
+
+def choose_value(candidates, target):
+    """Valor com a menor taxa de bits em que o pior trecho atinge a meta, ou None"""
+    passing = [candidate for candidate in candidates if candidate['score'] >= target]
+    if not passing:
+        return None
+    return min(passing, key=lambda candidate: candidate['kbps'])['value']
+
+
+def optimize(job, encoder_name, encoder_params, metric, target, log=print, should_stop=None):
+    """Codifica e avalia as amostras em cada valor de qualidade candidato
+
+    Returns:
+        dict: 'value' (valor escolhido, ou None para manter o perfil) e 'candidates' (valor,
+        pior nota entre as amostras e taxa de bits média em kbps de cada candidato)
+    """
+    total_duration = segment_render.get_video_duration(job['input_file'])
+    if total_duration <= 0:
+        raise RuntimeError(f"Não foi possível obter a duração de {job['input_file']}")
+    sample_starts = calibration.get_sample_starts(total_duration, SAMPLE_COUNT, SAMPLE_DURATION)
+    default_value = encoder_registry.get_quality_value(encoder_name, encoder_params)
+    values = get_candidates(default_value)
+
+    governor = resource_governor.ResourceGovernor(max(1, int(job.get('parallel_count', 2))), job.get('thread_budget'))
+    work_dir = tempfile.mkdtemp(prefix="video_cutter_qualidade_")
+
+    def stopped():
+        return bool(should_stop and should_stop())
+
+    def encode(name, params, start_time, output_file):
+        if stopped():
+            return None
+        with governor.slot() as slot:
+            return calibration.encode_sample(job, start_time, SAMPLE_DURATION, name, params, output_file, slot)
+
+    def reference(index):
+        output_file = os.path.join(work_dir, f"referencia_{index}.mp4")
+        return output_file if encode("libx264", REFERENCE_PARAMS, sample_starts[index], output_file) else None
+
+    def candidate(task):
+        value, index = task
+        output_file = os.path.join(work_dir, f"amostra_{value:g}_{index}.mp4")
+        try:
+            params = encoder_registry.set_quality_value(encoder_name, encoder_params, value)
+            if encode(encoder_name, params, sample_starts[index], output_file) is None:
+                return None
+            score = score_sample(output_file, references[index], metric)
+            return None if score is None else (score, os.path.getsize(output_file))
+        finally:
+            ffmpeg_utils.remove_partial_output(output_file)
+
+    try:
+        log(f"Ajustando a qualidade de {encoder_name} com {len(sample_starts)} amostras e {len(values)} valores "
+            f"({metric}, meta {target:g})...")
+        with ThreadPoolExecutor(max_workers=governor.slot_count) as executor:
+            references = list(executor.map(reference, range(len(sample_starts))))
+            if stopped():
+                return None
+            if None in references:
+                raise RuntimeError("falha ao codificar as amostras de referência")
+            tasks = [(value, index) for value in values for index in range(len(sample_starts))]
+            scores = dict(zip(tasks, executor.map(candidate, tasks)))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    if stopped():
+        return None
+
+    candidates = []
+    for value in values:
+        results = [scores[(value, index)] for index in range(len(sample_starts))]
+        if None in results:
+            log(f"Aviso: falha ao avaliar as amostras com {value:g}; valor ignorado.")
+            continue
+        candidates.append({
+            'value': value,
+            'score': min(score for score, _ in results),
+            'kbps': sum(size for _, size in results) * 8 / (SAMPLE_DURATION * len(results)) / 1000,
+        })
+    return {'value': choose_value(candidates, target), 'candidates': candidates}
+
+
+def prepare_quality(job, log=print, should_stop=None):
+    """Ajusta (ou carrega do cache) o valor de qualidade da entrada antes de as partes começarem
+
+    Returns:
+        dict: 'encoder', 'speed_profile' e 'value' para a opção 'tuned_quality' do trabalho,
+        ou None para manter os parâmetros do perfil
+    """
+    option = job.get('quality_target')
+    if not option or job.get('proxy'):
+        return None
+    if job.get('encoder_pools'):
+        log("Ajuste de qualidade por entrada não se aplica aos pools de codificadores; perfis mantidos.")
+        return None
+    metric, target = parse_quality_target(option)
+    if metric == "vmaf" and not has_libvmaf():
+        log("Aviso: o FFmpeg não tem o filtro libvmaf; ajuste de qualidade pelo SSIM com a meta padrão.")
+        metric, target = "ssim", DEFAULT_TARGETS['ssim']
+
+    speed_profile = job.get('speed_profile', "balanced")
+    encoder_name, encoder_params = ffmpeg_utils.get_video_encoder(speed_profile, encoder=job.get('encoder'))
+    default_value = encoder_registry.get_quality_value(encoder_name, encoder_params)
+    if default_value is None:
+        log(f"Ajuste de qualidade por entrada não disponível para {encoder_name}; perfil mantido.")
+        return None
+
+    cache_key = "_".join([analysis_cache.file_sample_hash(job['input_file']),
+                          analysis_cache.file_content_hash(job['selo_file'])[:12],
+                          encoder_name, speed_profile, f"{default_value:g}", metric, f"{target:g}"])
+    result = analysis_cache.load(QUALITY_CACHE_KIND, cache_key)
+    if result is None:
+        try:
+            result = optimize(job, encoder_name, encoder_params, metric, target, log=log, should_stop=should_stop)
+        except (RuntimeError, OSError) as e:
+            log(f"Aviso: ajuste de qualidade indisponível ({str(e)}); perfil mantido.")
+            return None
+        if result is None:
+            return None
+        analysis_cache.store(QUALITY_CACHE_KIND, cache_key, result)
+
+    for candidate in result['candidates']:
+        log(f"  qualidade {candidate['value']:g}: {metric} {candidate['score']:.4g}, {candidate['kbps']:.0f} kbps")
+    value = result['value']
+    if value is None:
+        log(f"Nenhum valor atinge a meta de {metric} {target:g}; perfil mantido ({default_value:g}).")
+        return None
+    if value == default_value:
+        log(f"Qualidade do perfil mantida ({default_value:g}): valores maiores ficam abaixo da meta.")
+        return None
+    message = f"Qualidade ajustada para a entrada: {default_value:g} -> {value:g}"
+    kbps = {candidate['value']: candidate['kbps'] for candidate in result['candidates']}
+    if kbps.get(default_value):
+        message += f" ({(1.0 - kbps[value] / kbps[default_value]) * 100:.0f}% menos bits nas amostras)"
+    log(message)
+    return {'encoder': encoder_name, 'speed_profile': speed_profile, 'value': value}
+
+
+def main(argv=None):
+    import argparse
+
+    from job_service import JOB_DEFAULTS
+
+    parser = argparse.ArgumentParser(description="Ajuste da qualidade constante por entrada")
+    parser.add_argument("--input", required=True)
+    parser.add_argument("--image", required=True)
+    parser.add_argument("--selo", required=True)
+    parser.add_argument("--speed-profile", choices=["fast", "balanced", "quality"], default=JOB_DEFAULTS['speed_profile'])
+    parser.add_argument("--encoder", choices=sorted(encoder_registry.ENCODERS), default=None)
+    parser.add_argument("--metric", choices=METRICS, default="ssim")
+    parser.add_argument("--target", type=float, default=None)
+    parser.add_argument("--parallel", type=int, default=JOB_DEFAULTS['parallel_count'])
+    args = parser.parse_args(argv)
+
+    target = args.target if args.target is not None else DEFAULT_TARGETS[args.metric]
+    job = dict(JOB_DEFAULTS, input_file=args.input, image_file=args.image, selo_file=args.selo,
+               speed_profile=args.speed_profile, encoder=args.encoder, parallel_count=args.parallel,
+               quality_target={'metric': args.metric, 'target': target})
+    tuned = prepare_quality(job)
+    if tuned:
+        print(f"Recomendado: {encoder_registry.get_entry(tuned['encoder'])['quality_option']} {tuned['value']:g}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+"""Calibração antes de um trabalho grande: perfil de velocidade e número de processos para um prazo
+
+Algumas amostras curtas da própria entrada são codificadas com o filter_complex completo (capa,
+texto e selo com chroma key) para cada configuração candidata (perfil de get_encoder_params x
+número de processos simultâneos). Cada medição roda todas as vagas ao mesmo tempo, para que a
+disputa pela CPU/GPU apareça na vazão. A partir da vazão e da taxa de bits medidas, o tempo total
+do plano é previsto com a estimativa de custo por parte e a ordem do segment_scheduler (só a
+renderização é dividida pela vazão medida; a decodificação usa o custo absoluto DECODE_SECONDS,
+em segundos de relógio por segundo da entrada), e o espaço em disco pela duração planejada.
+
+Com um prazo, é escolhido o perfil de maior qualidade (quality > balanced > fast) que termina a
+tempo, com o número de processos mais rápido para esse perfil.
+
+As medições ficam salvas em ~/.video_cutter/analise (por entrada, máquina e candidatos); use
+--refresh para medir de novo.
+
+Uso:
+    python calibration.py --input video.mp4 --image capa.png --selo selo.mp4 --parallel 1,2,4 --deadline 18:30
+"""
+import datetime
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import analysis_cache
+import cut_planner
+import ffmpeg_utils
+import job_history
+import resource_governor
+import segment_render
+import segment_scheduler
+
+CALIBRATION_CACHE_KIND = "calibracao"
+# Perfis do de maior para o de menor qualidade
+PROFILES = ("quality", "balanced", "fast")
+# Amostras por medição e a sua duração (s): o selo começa aos 10s da parte, então a amostra o inclui
+SAMPLE_COUNT = 3
+SAMPLE_DURATION = 20.0
+# Posições das amostras na entrada (fração da duração)
+SAMPLE_POSITIONS = (0.2, 0.5, 0.8)
+
+
+def get_sample_starts(total_duration, count=SAMPLE_COUNT, duration=SAMPLE_DURATION):
+    """Inícios das amostras, distribuídos pela entrada"""
+    positions = SAMPLE_POSITIONS if count == len(SAMPLE_POSITIONS) else \
+        [(index + 1) / (count + 1) for index in range(count)]
+    latest = max(total_duration - duration, 0.0)
+    return [min(total_duration * position, latest) for position in positions]
+
+
+def encode_sample(job, start_time, duration, encoder_name, encoder_params, output_file, slot=None):
+    """Codifica um trecho da entrada com o filter_complex completo de uma parte
+
+    A entrada é posicionada no início do trecho antes da decodificação (-ss), então a amostra
+    mede apenas a sobreposição e a codificação.
+
+    Returns:
+        float: tempo de relógio (s), ou None se o FFmpeg falhou
+    """
+    input_res = segment_render.get_video_resolution(job['input_file']) or segment_render.DEFAULT_RESOLUTION
+    cover_res = segment_render.get_video_resolution(job['image_file']) or segment_render.DEFAULT_RESOLUTION
+    selo_res = segment_render.get_video_resolution(job['selo_file']) or segment_render.DEFAULT_RESOLUTION
+    resolution_info = segment_render.check_resolution_compatibility(input_res, cover_res, selo_res)
+    filter_complex_str = segment_render.build_filter_complex(
+        0, duration, 1, resolution_info, job.get('chroma_color', "0x00d600"),
+        job.get('similarity', 0.30), job.get('blend', 0.35))
+    cmd = segment_render.build_ffmpeg_command(
+        job['input_file'], job['image_file'], job['selo_file'], filter_complex_str,
+        encoder_name, encoder_params, output_file, ffmpeg_utils.detect_gpu_vendor(),
+        input_seek=start_time, threads=slot.threads if slot else None, resolution=input_res)
+
+    started = time.time()
+    process = ffmpeg_utils.run_ffmpeg_command(cmd, **(slot.popen_kwargs() if slot else {}))
+    if slot:
+        slot.apply(process)
+    # Consumir a saída do FFmpeg para que o pipe nunca fique cheio
+    for _ in iter(process.stdout.readline, b''):
+        pass
+    process.wait()
+    if process.returncode != 0 or not os.path.isfile(output_file):
+        return None
+    return time.time() - started
+
+
+def measure(job, speed_profile, parallel_count, sample_starts, work_dir):
+    """Mede uma configuração com parallel_count amostras simultâneas
+
+    Returns:
+        dict: 'speed' (segundos de vídeo por segundo em cada vaga) e 'bytes_per_second' da saída,
+        ou None se alguma amostra falhou
+    """
+    encoder_name, encoder_params = ffmpeg_utils.get_video_encoder(speed_profile, encoder=job.get('encoder'))
+    governor = resource_governor.ResourceGovernor(parallel_count, job.get('thread_budget'))
+    starts = [sample_starts[index % len(sample_starts)] for index in range(parallel_count)]
+
+    def run(index):
+        output_file = os.path.join(work_dir, f"amostra_{speed_profile}_{parallel_count}_{index}.mp4")
+        try:
+            with governor.slot() as slot:
+                wall_time = encode_sample(job, starts[index], SAMPLE_DURATION, encoder_name, encoder_params,
+                                          output_file, slot)
+            size = os.path.getsize(output_file) if wall_time else 0
+            return wall_time, size
+        finally:
+            ffmpeg_utils.remove_partial_output(output_file)
+
+    with ThreadPoolExecutor(max_workers=parallel_count) as executor:
+        results = list(executor.map(run, range(parallel_count)))
+    if any(wall_time is None for wall_time, _ in results):
+        return None
+    return {
+        'encoder': encoder_name,
+        'speed': sum(SAMPLE_DURATION / wall_time for wall_time, _ in results) / len(results),
+        'bytes_per_second': sum(size for _, size in results) / (SAMPLE_DURATION * len(results)),
+    }
+
+
+def predict(segments, measurement, parallel_count):
+    """Tempo total (s) e espaço em disco (bytes) previstos para o plano com uma configuração medida"""
+    slot_count = min(parallel_count, len(segments))
+    # Custos em segundos de relógio: a renderização é dividida pela vazão medida, e a decodificação
+    # até o início da parte (que não é medida) usa o custo absoluto DECODE_SECONDS do segment_scheduler
+    costs = {segment['part_number']: (segment['duration'] + segment_scheduler.PART_OVERHEAD) / measurement['speed']
+             + segment['start_time'] * segment_scheduler.DECODE_SECONDS
+             for segment in segments}
+    ordered, _ = segment_scheduler.order_segments(segments, "auto", slot_count, costs)
+    runtime = segment_scheduler.simulate_makespan(ordered, costs, slot_count)
+    disk = measurement['bytes_per_second'] * sum(segment['duration'] for segment in segments)
+    return runtime, disk
+
+
+def calibrate(job, profiles=PROFILES, parallel_counts=(1, 2, 4), use_cache=True, log=print):
+    """Mede cada configuração candidata e prevê o tempo total e o espaço em disco do plano
+
+    Returns:
+        list: dicts com 'speed_profile', 'parallel_count', 'encoder', 'speed', 'bytes_per_second',
+        'runtime' e 'disk', na ordem dos perfis (maior qualidade primeiro)
+    """
+    total_duration = segment_render.get_video_duration(job['input_file'])
+    if total_duration <= 0:
+        raise RuntimeError(f"Não foi possível obter a duração de {job['input_file']}")
+    segments = cut_planner.plan_segments(job, total_duration, log=log)
+    sample_starts = get_sample_starts(total_duration)
+
+    cache_key = None
+    cached = {}
+    if use_cache:
+        host = job_history.get_host_info()['host']
+        cache_key = "_".join([analysis_cache.file_sample_hash(job['input_file']),
+                              analysis_cache.file_content_hash(job['selo_file'])[:12], host])
+        cached = analysis_cache.load(CALIBRATION_CACHE_KIND, cache_key) or {}
+
+    work_dir = tempfile.mkdtemp(prefix="video_cutter_calibracao_")
+    results = []
+    try:
+        for speed_profile in profiles:
+            for parallel_count in parallel_counts:
+                name = f"{speed_profile}/{parallel_count}"
+                measurement = cached.get(name)
+                if measurement is None:
+                    log(f"Medindo {speed_profile} com {parallel_count} processos...")
+                    measurement = measure(job, speed_profile, parallel_count, sample_starts, work_dir)
+                    if measurement is None:
+                        log(f"Aviso: falha ao codificar as amostras de {name}; configuração ignorada.")
+                        continue
+                    cached[name] = measurement
+                runtime, disk = predict(segments, measurement, parallel_count)
+                results.append(dict(measurement, speed_profile=speed_profile, parallel_count=parallel_count,
+                                    runtime=runtime, disk=disk))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    if cache_key is not None:
+        analysis_cache.store(CALIBRATION_CACHE_KIND, cache_key, cached)
+    return results
+
+
+def choose_configuration(results, available_seconds):
+    """Perfil de maior qualidade que termina no prazo, com o número de processos mais rápido para ele
+
+    Returns:
+        dict: o resultado escolhido, ou None se nenhuma configuração termina a tempo
+    """
+    for speed_profile in PROFILES:
+        candidates = [result for result in results
+                      if result['speed_profile'] == speed_profile and result['runtime'] <= available_seconds]
+        if candidates:
+            return min(candidates, key=lambda result: result['runtime'])
+    return None
+
+
+def parse_deadline(text, now=None):
+    """Converte o prazo ("18:30", "2026-05-01 18:30" ou uma duração como "90m"/"2h") em segundos a partir de agora"""
+    now = now or datetime.datetime.now()
+    text = text.strip()
+    if text[-1:] in ("m", "h") and text[:-1].replace(".", "", 1).isdigit():
+        return float(text[:-1]) * (60 if text[-1] == "m" else 3600)
+    try:
+        deadline = datetime.datetime.fromisoformat(text)
+    except ValueError:
+        clock = datetime.datetime.strptime(text, "%H:%M").time()
+        deadline = datetime.datetime.combine(now.date(), clock)
+        if deadline <= now:
+            deadline += datetime.timedelta(days=1)
+    return (deadline - now).total_seconds()
+
+
+def format_size(size):
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size:.1f} {unit}"
+        size /= 1024
+
+
+def main(argv=None):
+    import argparse
+
+    from job_service import JOB_DEFAULTS
+
+    parser = argparse.ArgumentParser(description="Calibração do perfil de velocidade e do número de processos")
+    parser.add_argument("--input", required=True)
+    parser.add_argument("--image", required=True)
+    parser.add_argument("--selo", required=True)
+    parser.add_argument("--min-duration", type=int, default=JOB_DEFAULTS['min_duration'])
+    parser.add_argument("--max-duration", type=int, default=JOB_DEFAULTS['max_duration'])
+    parser.add_argument("--parallel", default="1,2,4", help="Números de processos candidatos (ex.: 1,2,4)")
+    parser.add_argument("--profiles", default=",".join(PROFILES))
+    parser.add_argument("--deadline", help='Prazo: "18:30", "2026-05-01 18:30" ou uma duração ("90m", "2h")')
+    parser.add_argument("--refresh", action="store_true", help="Medir de novo, ignorando as medições salvas")
+    args = parser.parse_args(argv)
+
+    job = dict(JOB_DEFAULTS, input_file=args.input, image_file=args.image, selo_file=args.selo,
+               min_duration=args.min_duration, max_duration=args.max_duration, plan_seed=1)
+    parallel_counts = [int(value) for value in args.parallel.split(",") if value.strip()]
+    profiles = [value.strip() for value in args.profiles.split(",") if value.strip()]
+    results = calibrate(job, profiles, parallel_counts, use_cache=not args.refresh)
+
+    for result in results:
+        print(f"{result['speed_profile']:<9} {result['parallel_count']:>2} processos  {result['encoder']:<11} "
+              f"{result['speed']:6.2f}x por vaga  tempo previsto {job_history.format_duration(result['runtime']):>9}  "
+              f"disco {format_size(result['disk']):>10}")
+    if args.deadline:
+        available = parse_deadline(args.deadline)
+        chosen = choose_configuration(results, available)
+        if chosen is None:
+            print(f"Nenhuma configuração termina em {job_history.format_duration(available)}.")
+            return 1
+        print(f"Recomendado: --speed-profile {chosen['speed_profile']} --parallel-count {chosen['parallel_count']} "
+              f"(previsto {job_history.format_duration(chosen['runtime'])} de {job_history.format_duration(available)} "
+              f"disponíveis, {format_size(chosen['disk'])})")
+    return 0
+
+
+if __name__ == "__main__":
+    import sys
+
+    sys.exit(main())
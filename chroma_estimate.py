@@ -0,0 +1,130 @@
+"""Estimativa automática da cor do chroma key a partir do vídeo do selo
+
+Alguns frames do selo são decodificados em baixa resolução (pipe rawvideo) e a cor de fundo
+é obtida pelo histograma das bordas do quadro, onde quase sempre só aparece o fundo.
+A partir da distância de cada pixel até essa cor (a mesma métrica do filtro colorkey)
+são propostos similaridade e suavidade, junto com a fração do selo que ficará transparente.
+
+O resultado é salvo no cache de análise pelo hash do conteúdo do selo.
+"""
+import analysis_cache
+import chroma_preview
+import segment_render
+
+np = chroma_preview.np
+
+CACHE_KIND = "chroma"
+# Incrementar ao mudar o algoritmo para invalidar os resultados salvos
+ESTIMATE_VERSION = 1
+
+# Lado maior dos frames analisados e número de frames amostrados
+ANALYSIS_LONG_SIDE = 160
+ANALYSIS_FRAMES = 8
+# Largura da faixa de borda usada como amostra do fundo (fração do menor lado)
+BORDER_FRACTION = 0.08
+# Quantização do histograma: 5 bits por canal (32 x 32 x 32 cores)
+HISTOGRAM_BITS = 5
+# Distância máxima (métrica do colorkey) para um pixel da borda ser considerado fundo
+BACKGROUND_MAX_DISTANCE = 0.25
+# Limites das propostas, compatíveis com os campos da interface
+SIMILARITY_RANGE = (0.01, 0.6)
+MAX_BLEND = 0.3
+
+
+def border_mask(height, width, fraction=BORDER_FRACTION):
+    """Máscara booleana (altura, largura) com a faixa externa do quadro"""
+    band = max(2, int(min(height, width) * fraction))
+    mask = np.zeros((height, width), dtype=bool)
+    mask[:band, :] = True
+    mask[-band:, :] = True
+    mask[:, :band] = True
+    mask[:, -band:] = True
+    return mask
+
+
+def dominant_color(pixels, bits=HISTOGRAM_BITS):
+    """Cor mais frequente de um conjunto de pixels (N, 3) via histograma quantizado
+
+    Retorna a média dos pixels que caem no bin mais populoso e a fração de pixels nesse bin.
+    """
+    shift = 8 - bits
+    quantized = (pixels >> shift).astype(np.int32)
+    index = (quantized[:, 0] << (2 * bits)) | (quantized[:, 1] << bits) | quantized[:, 2]
+    counts = np.bincount(index, minlength=1 << (3 * bits))
+    top = int(np.argmax(counts))
+    color = pixels[index == top].mean(axis=0)
+    return color, counts[top] / float(len(pixels))
+
+
+def color_distance(pixels, color):
+    """Distância normalizada até a cor, igual à usada pelo filtro colorkey do FFmpeg"""
+    delta = pixels.astype(np.float32) - np.asarray(color, dtype=np.float32)
+    return np.sqrt(np.einsum("...c,...c->...", delta, delta) / (255.0 * 255.0 * 3.0))
+
+
+def estimate_from_frames(frames):
+    """Propõe chroma_color, similarity e blend para uma lista de frames RGB (uint8)"""
+    chroma_preview.require_numpy()
+    stack = np.stack(frames)
+    _, height, width, _ = stack.shape
+    mask = border_mask(height, width)
+
+    border_pixels = stack[:, mask].reshape(-1, 3)
+    color, dominance = dominant_color(border_pixels)
+
+    border_distance = color_distance(border_pixels, color)
+    background = border_distance[border_distance <= BACKGROUND_MAX_DISTANCE]
+    # Espalhamento do fundo (sombras, ruído de compressão): o limite cobre quase todo o fundo da borda
+    spread = float(np.percentile(background, 99)) if background.size else 0.1
+    similarity = min(max(spread + 0.02, SIMILARITY_RANGE[0]), SIMILARITY_RANGE[1])
+
+    # A suavidade cobre parte do intervalo entre o fundo e os pixels do primeiro plano mais próximos
+    distance = color_distance(stack.reshape(-1, 3), color)
+    foreground = distance[distance > similarity]
+    if foreground.size:
+        foreground_edge = float(np.percentile(foreground, 1))
+        blend = min(max((foreground_edge - similarity) * 0.5, 0.0), MAX_BLEND)
+    else:
+        blend = 0.0
+
+    r, g, b = (int(round(c)) for c in color)
+    return {
+        'chroma_color': f"0x{r:02x}{g:02x}{b:02x}",
+        'similarity': round(similarity, 2),
+        'blend': round(blend, 2),
+        # Fração do selo que ficará transparente com os valores propostos
+        'coverage': round(float(np.mean(distance <= similarity)), 3),
+        # Fração da borda ocupada pela cor estimada (confiança da estimativa)
+        'border_coverage': round(float(np.mean(border_distance <= similarity)), 3),
+        'dominance': round(float(dominance), 3),
+    }
+
+
+def estimate_chroma_key(selo_file, use_cache=True):
+    """Estima os parâmetros de chroma key do selo, reaproveitando o resultado salvo quando houver"""
+    content_hash = analysis_cache.file_content_hash(selo_file)
+    if use_cache:
+        cached = analysis_cache.load(CACHE_KIND, content_hash)
+        if cached and cached.get('version') == ESTIMATE_VERSION:
+            return cached
+
+    selo_res = segment_render.get_video_resolution(selo_file) or segment_render.DEFAULT_RESOLUTION
+    size = chroma_preview.get_preview_size(selo_res, ANALYSIS_LONG_SIDE)
+    duration = segment_render.get_video_duration(selo_file)
+    frames = chroma_preview.decode_frames(selo_file, size, ANALYSIS_FRAMES,
+                                          duration=duration if duration > 0 else None)
+    if not frames:
+        raise RuntimeError(f"Não foi possível decodificar frames de {selo_file}")
+
+    result = estimate_from_frames(frames)
+    result['version'] = ESTIMATE_VERSION
+    analysis_cache.store(CACHE_KIND, content_hash, result)
+    return result
+
+
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv) != 2:
+        print("Uso: python chroma_estimate.py selo.mp4")
+        sys.exit(1)
+    print(estimate_chroma_key(sys.argv[1], use_cache=False))
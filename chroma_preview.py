@@ -0,0 +1,138 @@
+"""Prévia interativa do chroma key com frames decodificados em cache
+
+Alguns frames do selo e um frame do vídeo principal são decodificados uma única vez
+(pipe rawvideo do FFmpeg para arrays NumPy). Depois disso, cada alteração de cor,
+similaridade ou suavidade é aplicada com um equivalente vetorizado do filtro colorkey
+do FFmpeg e composta sobre o frame principal em poucos milissegundos.
+"""
+import ffmpeg_utils
+import segment_render
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Altura (lado maior) usada na prévia; os frames são reduzidos para manter a atualização rápida
+PREVIEW_LONG_SIDE = 480
+# Número de frames do selo mantidos em cache
+DEFAULT_SELO_FRAMES = 6
+
+
+def require_numpy():
+    if np is None:
+        raise RuntimeError("A prévia do chroma key requer o NumPy (pip install numpy).")
+
+
+def parse_hex_color(color):
+    """Converte "0xRRGGBB" (ou "#RRGGBB") em uma tupla (r, g, b)"""
+    value = color.strip().lower().replace("#", "").replace("0x", "")
+    if len(value) != 6:
+        raise ValueError(f"Cor inválida: {color}")
+    return int(value[0:2], 16), int(value[2:4], 16), int(value[4:6], 16)
+
+
+def get_preview_size(resolution, long_side=PREVIEW_LONG_SIDE):
+    """Reduz a resolução mantendo a proporção, com dimensões pares"""
+    width, height = resolution
+    factor = min(1.0, long_side / max(width, height))
+    return max(2, int(width * factor) // 2 * 2), max(2, int(height * factor) // 2 * 2)
+
+
+def decode_frames(video_file, size, count=1, start_time=0.0, duration=None):
+    """Decodifica count frames distribuídos em [start_time, start_time + duration] como arrays RGB
+
+    Returns:
+        list: arrays uint8 com formato (altura, largura, 3)
+    """
+    require_numpy()
+    width, height = size
+    video_filters = f"scale={width}:{height}"
+    if count > 1 and duration:
+        # Amostrar frames uniformemente ao longo da duração
+        video_filters = f"fps={count / duration:.6f}," + video_filters
+
+    args = []
+    if start_time:
+        args.extend(["-ss", f"{start_time:.3f}"])
+    args.extend(["-i", video_file, "-vf", video_filters, "-frames:v", str(count),
+                 "-f", "rawvideo", "-pix_fmt", "rgb24", "-"])
+
+    frame_size = width * height * 3
+    frames = []
+    process = ffmpeg_utils.open_ffmpeg_pipe(args)
+    try:
+        while len(frames) < count:
+            buffer = bytearray(frame_size)
+            view = memoryview(buffer)
+            read = 0
+            while read < frame_size:
+                n = process.stdout.readinto(view[read:])
+                if not n:
+                    break
+                read += n
+            if read < frame_size:
+                break
+            frames.append(np.frombuffer(buffer, dtype=np.uint8).reshape(height, width, 3))
+    finally:
+        process.stdout.close()
+        process.wait()
+    return frames
+
+
+def colorkey_alpha(rgb, color, similarity, blend):
+    """Equivalente vetorizado do filtro colorkey do FFmpeg: retorna o alfa (0.0-1.0) de cada pixel
+
+    diff = sqrt(soma((pixel - cor)^2) / (3 * 255^2)); com blend > 0 o alfa é
+    clip((diff - similarity) / blend, 0, 1), senão 1 se diff > similarity e 0 caso contrário.
+    """
+    require_numpy()
+    key = np.asarray(color, dtype=np.float32)
+    delta = rgb.astype(np.float32, copy=False) - key
+    diff = np.sqrt(np.einsum("...c,...c->...", delta, delta) / (255.0 * 255.0 * 3.0))
+    if blend > 0.0001:
+        return np.clip((diff - similarity) / blend, 0.0, 1.0)
+    return (diff > similarity).astype(np.float32)
+
+
+def composite(background, foreground, alpha):
+    """Compõe o frame do selo sobre o frame principal usando o alfa calculado"""
+    alpha = alpha[..., None]
+    result = foreground * alpha + background * (1.0 - alpha)
+    return np.clip(result, 0, 255).astype(np.uint8)
+
+
+class ChromaPreviewCache:
+    """Mantém os frames decodificados e gera a prévia para novos parâmetros de chroma key"""
+
+    def __init__(self, input_file, selo_file, selo_frames=DEFAULT_SELO_FRAMES):
+        require_numpy()
+        input_res = segment_render.get_video_resolution(input_file) or segment_render.DEFAULT_RESOLUTION
+        self.size = get_preview_size(input_res)
+
+        # Frame do vídeo principal em um ponto representativo (10% da duração)
+        input_duration = segment_render.get_video_duration(input_file)
+        main_time = input_duration * 0.1 if input_duration > 0 else 0.0
+        main_frames = decode_frames(input_file, self.size, 1, start_time=main_time)
+        if not main_frames:
+            raise RuntimeError(f"Não foi possível decodificar um frame de {input_file}")
+        self.background = main_frames[0]
+
+        # O selo é redimensionado para a resolução do vídeo na renderização, então usa o mesmo tamanho aqui
+        selo_duration = segment_render.get_video_duration(selo_file)
+        self.selo_frames = decode_frames(selo_file, self.size, selo_frames,
+                                         duration=selo_duration if selo_duration > 0 else None)
+        if not self.selo_frames:
+            raise RuntimeError(f"Não foi possível decodificar frames de {selo_file}")
+
+        # Versões em float32 guardadas para não converter os frames a cada atualização
+        self._background_float = self.background.astype(np.float32)
+        self._selo_float = [frame.astype(np.float32) for frame in self.selo_frames]
+
+    def render(self, color, similarity, blend, frame_index=0):
+        """Retorna a prévia (array RGB) para os parâmetros informados"""
+        if isinstance(color, str):
+            color = parse_hex_color(color)
+        selo = self._selo_float[frame_index % len(self._selo_float)]
+        alpha = colorkey_alpha(selo, color, similarity, blend)
+        return composite(self._background_float, selo, alpha)
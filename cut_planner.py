@@ -0,0 +1,299 @@
+"""Escolha dos pontos de corte das partes a partir de uma análise rápida da entrada
+
+Modos (opção 'cut_planner' do trabalho):
+    None ou "random": durações aleatórias entre min_duration e max_duration (segment_render.create_segments)
+    "scene": cada parte termina em uma mudança de cena dentro de [min_duration, max_duration]
+    "silence": cada parte termina no trecho mais silencioso dentro de [min_duration, max_duration]
+
+A análise de cenas decodifica a entrada uma única vez em baixa resolução e em tons de cinza
+(pipe rawvideo lido com readinto em um buffer NumPy alocado uma só vez) e calcula, de forma
+vetorizada, a diferença média entre frames consecutivos. Como quase todo codificador insere um
+quadro-chave nas mudanças de cena, os cortes também tendem a cair em quadros-chave da entrada,
+o que acelera a busca do início de cada parte.
+
+A análise de áudio lê a trilha uma única vez como PCM mono em baixa taxa de amostragem (pipe
+s16le) em blocos de tamanho fixo, então a memória usada não depende da duração da entrada, e
+calcula a energia RMS de cada janela de AUDIO_WINDOW segundos.
+
+As pontuações e a envoltória de energia ficam no cache de análise (analysis_cache) pelo hash da entrada, então replanejar
+com outros limites de duração não decodifica o vídeo de novo.
+"""
+import math
+import time
+
+import analysis_cache
+import chroma_preview
+import ffmpeg_utils
+import segment_render
+
+np = chroma_preview.np
+
+PLANNER_MODES = ("random", "scene", "silence")
+
+SCENE_CACHE_KIND = "cenas"
+# Incrementar ao mudar a análise para invalidar os resultados salvos
+SCENE_ANALYSIS_VERSION = 1
+# Frames analisados por segundo (resolução dos pontos de corte) e tamanho dos frames analisados
+SCENE_ANALYSIS_FPS = 10
+SCENE_ANALYSIS_SIZE = (64, 36)
+# Frames lidos do pipe por bloco
+CHUNK_FRAMES = 512
+# Peso da diferença dos frames vizinhos: uma mudança de cena é um pico isolado, já o movimento
+# contínuo (câmera, jogo) gera diferenças altas em vários frames seguidos
+NEIGHBOR_WEIGHT = 0.5
+AUDIO_CACHE_KIND = "audio"
+AUDIO_ANALYSIS_VERSION = 1
+# Taxa de amostragem da análise de áudio e duração de cada janela de energia (s)
+AUDIO_SAMPLE_RATE = 8000
+AUDIO_WINDOW = 0.1
+# Janelas lidas do pipe por bloco (60 s de áudio)
+CHUNK_WINDOWS = 600
+# Duração mínima da pausa procurada: a energia é suavizada nesse intervalo antes de escolher o corte
+PAUSE_DURATION = 0.5
+
+# Mesma duração mínima de parte usada por segment_render.create_segments
+MIN_SEGMENT_DURATION = 10
+
+
+def analyze_scene_changes(input_file, fps=SCENE_ANALYSIS_FPS, size=SCENE_ANALYSIS_SIZE):
+    """Diferença média absoluta (0-1) de cada frame amostrado em relação ao anterior
+
+    Returns:
+        numpy.ndarray: uma pontuação por frame; o frame i está no tempo i / fps
+    """
+    chroma_preview.require_numpy()
+    width, height = size
+    frame_size = width * height
+    args = [
+        # O filtro de deblocking não muda as diferenças entre cenas e custa boa parte da decodificação
+        "-skip_loop_filter", "all",
+        "-i", input_file, "-an", "-sn", "-dn",
+        "-vf", f"fps={fps},scale={width}:{height}:flags=fast_bilinear",
+        "-f", "rawvideo", "-pix_fmt", "gray", "-",
+    ]
+
+    # Buffers alocados uma única vez; a linha 0 guarda o último frame do bloco anterior
+    frames = np.empty((CHUNK_FRAMES + 1, height, width), dtype=np.uint8)
+    view = memoryview(frames.reshape(-1))[frame_size:]
+    difference = np.empty((CHUNK_FRAMES, frame_size), dtype=np.int16)
+    scores = []
+
+    process = ffmpeg_utils.open_ffmpeg_pipe(args)
+    try:
+        while True:
+            read = ffmpeg_utils.read_pipe_into(process.stdout, view)
+            count = read // frame_size
+            if count == 0:
+                break
+            current = frames[1:count + 1].reshape(count, frame_size)
+            previous = frames[0:count].reshape(count, frame_size)
+            np.subtract(current, previous, out=difference[:count], dtype=np.int16)
+            np.abs(difference[:count], out=difference[:count])
+            chunk_scores = difference[:count].mean(axis=1, dtype=np.float32) / 255.0
+            if not scores:
+                chunk_scores[0] = 0.0  # O primeiro frame não tem anterior
+            scores.append(chunk_scores)
+            frames[0] = frames[count]
+            if read < len(view):
+                break
+    finally:
+        process.stdout.close()
+        process.wait()
+
+    if not scores:
+        raise RuntimeError(f"Não foi possível decodificar {input_file} para a análise de cenas")
+    return np.concatenate(scores)
+
+
+def get_scene_scores(input_file, use_cache=True, log=print):
+    """Pontuações de mudança de cena da entrada, reaproveitando a análise salva
+
+    Returns:
+        tuple: (pontuações, frames por segundo da análise)
+    """
+    chroma_preview.require_numpy()
+    content_hash = analysis_cache.file_sample_hash(input_file)
+    if use_cache:
+        cached = analysis_cache.load(SCENE_CACHE_KIND, content_hash)
+        if cached and cached.get('version') == SCENE_ANALYSIS_VERSION:
+            return np.asarray(cached['scores'], dtype=np.float32), cached['fps']
+
+    started = time.time()
+    scores = analyze_scene_changes(input_file)
+    elapsed = time.time() - started
+    log(f"Análise de cenas: {len(scores) / SCENE_ANALYSIS_FPS:.0f}s de vídeo em {elapsed:.1f}s.")
+    analysis_cache.store(SCENE_CACHE_KIND, content_hash, {
+        'version': SCENE_ANALYSIS_VERSION,
+        'fps': SCENE_ANALYSIS_FPS,
+        'scores': [round(float(score), 4) for score in scores],
+    })
+    return scores, SCENE_ANALYSIS_FPS
+
+
+def analyze_audio_energy(input_file, sample_rate=AUDIO_SAMPLE_RATE, window=AUDIO_WINDOW):
+    """Energia RMS (0-1) de cada janela da trilha de áudio, lida em blocos de tamanho fixo
+
+    Returns:
+        numpy.ndarray: uma energia por janela; a janela i começa no tempo i * window
+    """
+    chroma_preview.require_numpy()
+    window_samples = int(round(sample_rate * window))
+    args = ["-i", input_file, "-vn", "-sn", "-dn", "-ac", "1", "-ar", str(sample_rate),
+            "-f", "s16le", "-acodec", "pcm_s16le", "-"]
+
+    # Buffers alocados uma única vez: a memória não cresce com a duração da entrada
+    samples = np.empty(CHUNK_WINDOWS * window_samples, dtype=np.int16)
+    view = memoryview(samples).cast("B")
+    squares = np.empty(CHUNK_WINDOWS * window_samples, dtype=np.float32)
+    energy = []
+
+    process = ffmpeg_utils.open_ffmpeg_pipe(args)
+    try:
+        while True:
+            read = ffmpeg_utils.read_pipe_into(process.stdout, view)
+            count = read // samples.itemsize
+            if count == 0:
+                break
+            # A última janela pode ficar incompleta no fim da trilha
+            windows = -(-count // window_samples)
+            if count < len(samples):
+                samples[count:windows * window_samples] = 0
+            used = windows * window_samples
+            np.multiply(samples[:used], samples[:used], out=squares[:used], dtype=np.float32)
+            chunk_energy = np.sqrt(squares[:used].reshape(windows, window_samples).mean(axis=1)) / 32768.0
+            energy.append(chunk_energy)
+            if read < len(view):
+                break
+    finally:
+        process.stdout.close()
+        process.wait()
+
+    if not energy:
+        raise RuntimeError(f"Não foi possível ler o áudio de {input_file} (o vídeo tem trilha de áudio?)")
+    return np.concatenate(energy)
+
+
+def get_audio_energy(input_file, use_cache=True, log=print):
+    """Envoltória de energia do áudio da entrada, reaproveitando a análise salva
+
+    Returns:
+        tuple: (energia por janela, duração da janela em segundos)
+    """
+    chroma_preview.require_numpy()
+    content_hash = analysis_cache.file_sample_hash(input_file)
+    if use_cache:
+        cached = analysis_cache.load(AUDIO_CACHE_KIND, content_hash)
+        if cached and cached.get('version') == AUDIO_ANALYSIS_VERSION:
+            return np.asarray(cached['energy'], dtype=np.float32), cached['window']
+
+    started = time.time()
+    energy = analyze_audio_energy(input_file)
+    elapsed = time.time() - started
+    log(f"Análise de áudio: {len(energy) * AUDIO_WINDOW:.0f}s de áudio em {elapsed:.1f}s.")
+    analysis_cache.store(AUDIO_CACHE_KIND, content_hash, {
+        'version': AUDIO_ANALYSIS_VERSION,
+        'window': AUDIO_WINDOW,
+        'energy': [round(float(value), 5) for value in energy],
+    })
+    return energy, AUDIO_WINDOW
+
+
+def silence_cut_scores(energy, window):
+    """Pontuação maior nos trechos mais silenciosos: energia suavizada na duração de uma pausa, negativa"""
+    size = max(1, int(round(PAUSE_DURATION / window)))
+    return -np.convolve(energy, np.full(size, 1.0 / size, dtype=np.float32), mode="same")
+
+
+def scene_cut_scores(scores):
+    """Realça as mudanças de cena: a diferença do frame menos parte da maior diferença vizinha"""
+    padded = np.pad(scores, 1, mode="edge")
+    neighbors = np.maximum(padded[:-2], padded[2:])
+    return scores - NEIGHBOR_WEIGHT * neighbors
+
+
+def choose_cut_points(scores, interval, total_duration, min_duration, max_duration):
+    """Escolhe, parte a parte, o corte de maior pontuação entre min_duration e max_duration
+
+    Args:
+        scores (numpy.ndarray): pontuação de um corte no tempo i * interval
+    Returns:
+        list: tempos dos cortes (sem o início e o fim do vídeo)
+    """
+    cuts = []
+    current = 0.0
+    while total_duration - current > max_duration:
+        earliest = current + min_duration
+        # A última parte também precisa ter pelo menos min_duration
+        latest = min(current + max_duration, total_duration - min_duration)
+        if latest < earliest:
+            # O restante não cabe em duas partes válidas: a última parte fica mais longa
+            break
+        first = int(math.ceil(earliest / interval))
+        window = scores[first:int(latest / interval) + 1]
+        if len(window):
+            cut = (first + int(np.argmax(window))) * interval
+        else:
+            # Análise mais curta que a duração informada pelo FFprobe
+            cut = latest
+        cuts.append(round(cut, 3))
+        current = cut
+    return cuts
+
+
+def segments_from_cuts(cuts, total_duration, start_index):
+    """Converte os cortes em segmentos no mesmo formato de segment_render.create_segments"""
+    bounds = [0.0] + list(cuts) + [round(total_duration, 3)]
+    segments = []
+    part_number = start_index
+    for start, end in zip(bounds, bounds[1:]):
+        duration = round(end - start, 3)
+        if duration < MIN_SEGMENT_DURATION and segments:
+            segments[-1]['duration'] += duration
+            continue
+        segments.append({'start_time': start, 'duration': duration, 'part_number': part_number})
+        part_number += 1
+    return segments
+
+
+def plan_segments(job, total_duration, log=print):
+    """Plano de segmentos do trabalho conforme a opção 'cut_planner'
+
+    Se a análise não puder ser feita (sem NumPy, falha do FFmpeg), usa durações aleatórias.
+    """
+    mode = job.get('cut_planner') or "random"
+    if mode not in PLANNER_MODES:
+        raise ValueError(f"Modo de corte inválido: {mode}")
+
+    def random_plan():
+        return segment_render.create_segments(total_duration, job['min_duration'], job['max_duration'],
+                                              job['start_index'], seed=job.get('plan_seed'))
+
+    if mode == "random":
+        return random_plan()
+    try:
+        if mode == "scene":
+            scores, fps = get_scene_scores(job['input_file'], log=log)
+            cut_scores, interval = scene_cut_scores(scores), 1.0 / fps
+        else:
+            energy, window = get_audio_energy(job['input_file'], log=log)
+            cut_scores, interval = silence_cut_scores(energy, window), window
+        cuts = choose_cut_points(cut_scores, interval, total_duration, job['min_duration'], job['max_duration'])
+    except (RuntimeError, OSError) as e:
+        log(f"Aviso: análise da entrada indisponível ({str(e)}); usando durações aleatórias.")
+        return random_plan()
+    log(f"Partes cortadas em {len(cuts)} {'mudanças de cena' if mode == 'scene' else 'pausas do áudio'}.")
+    return segments_from_cuts(cuts, total_duration, job['start_index'])
+
+
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv) not in (4, 5):
+        print("Uso: python cut_planner.py entrada.mp4 DURACAO_MIN DURACAO_MAX [scene|silence]")
+        sys.exit(1)
+    input_file = sys.argv[1]
+    mode = sys.argv[4] if len(sys.argv) == 5 else "scene"
+    plan = plan_segments({'input_file': input_file, 'cut_planner': mode, 'min_duration': int(sys.argv[2]),
+                          'max_duration': int(sys.argv[3]), 'start_index': 1},
+                         segment_render.get_video_duration(input_file))
+    for segment in plan:
+        print(f"Parte {segment['part_number']}: {segment['start_time']:.2f}s (+{segment['duration']:.2f}s)")
@@ -0,0 +1,501 @@
+"""Renderização distribuída através de uma fila de trabalho em diretório compartilhado
+
+O plano de segmentos de um trabalho é publicado em um diretório compartilhado (por exemplo,
+um ponto de montagem NFS). Qualquer número de workers sem interface, em qualquer máquina,
+reivindica partes com arquivos de trava atômicos e arrendamentos (leases), renderiza as
+partes e as marca como concluídas. Arrendamentos abandonados são recuperados após o timeout.
+
+Estrutura de um trabalho dentro do diretório compartilhado:
+
+    <share>/<job_id>/job.json            configuração do trabalho
+    <share>/<job_id>/parts/<parte>.json  um arquivo por segmento do plano
+    <share>/<job_id>/locks/<parte>.lock  trava/arrendamento do worker que renderiza a parte
+    <share>/<job_id>/done/<parte>.json   marcador de parte concluída
+    <share>/<job_id>/failed/<parte>.json contagem de tentativas que falharam
+
+Uso:
+    python distributed_queue.py publish --share DIR --input IN --image CAPA --selo SELO [...]
+    python distributed_queue.py worker --share DIR [--processes N] [--scratch DIR_LOCAL]
+    python distributed_queue.py status --share DIR
+"""
+import argparse
+import functools
+import json
+import multiprocessing
+import os
+import socket
+import sys
+import threading
+import time
+import uuid
+
+import cut_planner
+import ffmpeg_utils
+import output_verifier
+import resource_governor
+import scratch_staging
+import segment_render
+
+# Tempo (s) sem renovação após o qual um arrendamento é considerado abandonado
+DEFAULT_LEASE_TIMEOUT = 120
+# Número máximo de tentativas antes de uma parte ser marcada como falha definitiva
+DEFAULT_MAX_ATTEMPTS = 3
+
+
+def _write_json_atomic(path, data):
+    """Grava um JSON de forma atômica (arquivo temporário + rename)"""
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def _read_json(path, default=None):
+    """Lê um JSON, retornando default se o arquivo não existir ou estiver incompleto"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+class WorkQueue:
+    """Fila de partes de um trabalho publicada em um diretório compartilhado"""
+
+    def __init__(self, share_dir, job_id, lease_timeout=DEFAULT_LEASE_TIMEOUT,
+                 max_attempts=DEFAULT_MAX_ATTEMPTS):
+        self.job_dir = os.path.join(share_dir, job_id)
+        self.job_id = job_id
+        self.lease_timeout = lease_timeout
+        self.max_attempts = max_attempts
+        self.parts_dir = os.path.join(self.job_dir, "parts")
+        self.locks_dir = os.path.join(self.job_dir, "locks")
+        self.done_dir = os.path.join(self.job_dir, "done")
+        self.failed_dir = os.path.join(self.job_dir, "failed")
+
+    @classmethod
+    def publish(cls, share_dir, job, segments, job_id=None, **kwargs):
+        """Publica a configuração e o plano de segmentos de um trabalho"""
+        job_id = job_id or time.strftime("%Y%m%d-%H%M%S-") + uuid.uuid4().hex[:6]
+        work_queue = cls(share_dir, job_id, **kwargs)
+        for directory in (work_queue.parts_dir, work_queue.locks_dir, work_queue.done_dir, work_queue.failed_dir):
+            os.makedirs(directory, exist_ok=True)
+
+        for segment in segments:
+            _write_json_atomic(work_queue._part_path(segment['part_number']), segment)
+        # job.json é gravado por último: os workers só consideram trabalhos completos
+        _write_json_atomic(os.path.join(work_queue.job_dir, "job.json"), job)
+        return work_queue
+
+    @classmethod
+    def list_jobs(cls, share_dir, **kwargs):
+        """Lista os trabalhos publicados no diretório compartilhado"""
+        if not os.path.isdir(share_dir):
+            return []
+        return [cls(share_dir, name, **kwargs) for name in sorted(os.listdir(share_dir))
+                if os.path.isfile(os.path.join(share_dir, name, "job.json"))]
+
+    def _part_path(self, part_number):
+        return os.path.join(self.parts_dir, f"{part_number}.json")
+
+    def _lock_path(self, part_number):
+        return os.path.join(self.locks_dir, f"{part_number}.lock")
+
+    def _done_path(self, part_number):
+        return os.path.join(self.done_dir, f"{part_number}.json")
+
+    def _failed_path(self, part_number):
+        return os.path.join(self.failed_dir, f"{part_number}.json")
+
+    def load_job(self):
+        return _read_json(os.path.join(self.job_dir, "job.json"))
+
+    def load_segments(self):
+        """Retorna os segmentos do plano ordenados pelo número da parte"""
+        segments = []
+        for name in os.listdir(self.parts_dir):
+            if name.endswith(".json"):
+                segment = _read_json(os.path.join(self.parts_dir, name))
+                if segment:
+                    segments.append(segment)
+        return sorted(segments, key=lambda s: s['part_number'])
+
+    def attempts(self, part_number):
+        return (_read_json(self._failed_path(part_number)) or {}).get('attempts', 0)
+
+    def is_finished(self, part_number):
+        """Uma parte está finalizada se foi concluída ou esgotou as tentativas"""
+        return os.path.exists(self._done_path(part_number)) or self.attempts(part_number) >= self.max_attempts
+
+    def try_claim(self, part_number, worker_id):
+        """Tenta reivindicar uma parte; retorna True se a trava foi obtida"""
+        if self.is_finished(part_number):
+            return False
+
+        lock_path = self._lock_path(part_number)
+        if self._create_lock(lock_path, worker_id):
+            # Conferir novamente: a parte pode ter sido concluída entre a verificação e a trava
+            if self.is_finished(part_number):
+                self.release(part_number, worker_id)
+                return False
+            return True
+
+        # A trava existe: recuperar o arrendamento se ele estiver abandonado
+        expired = self._expired_lease(lock_path)
+        if expired is None:
+            return False
+        stale_path = f"{lock_path}.{uuid.uuid4().hex}.stale"
+        try:
+            # rename é atômico: apenas um worker consegue mover a trava
+            os.rename(lock_path, stale_path)
+        except OSError:
+            return False
+        # Entre a verificação e o rename, o dono pode ter renovado a trava ou outro worker pode
+        # tê-la recuperado e criado uma nova: só a trava julgada abandonada pode ser descartada
+        if self._lease_snapshot(stale_path) != expired:
+            self._restore_lock(stale_path, lock_path)
+            return False
+        print(f"Recuperando arrendamento abandonado da parte {part_number} (worker {expired[0] or '?'})")
+        try:
+            os.remove(stale_path)
+        except OSError:
+            pass
+        return self._create_lock(lock_path, worker_id) and not self.is_finished(part_number)
+
+    def _create_lock(self, lock_path, worker_id):
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({'worker_id': worker_id, 'host': socket.gethostname(), 'pid': os.getpid(),
+                       'claimed_at': time.time()}, f)
+        return True
+
+    def _lease_snapshot(self, lock_path):
+        """(worker, início, mtime) da trava, ou None se ela não existir"""
+        try:
+            mtime = os.stat(lock_path).st_mtime
+        except OSError:
+            return None
+        lock = _read_json(lock_path, {})
+        return lock.get('worker_id'), lock.get('claimed_at'), mtime
+
+    def _expired_lease(self, lock_path):
+        """Estado da trava se o arrendamento estiver abandonado, ou None
+
+        O mtime é gravado pelo servidor de arquivos, mas é comparado com o relógio deste host: a
+        diferença entre os relógios soma-se ao prazo (ou o encurta). Os hosts e o servidor devem estar
+        sincronizados (NTP), e lease_timeout deve ter folga bem maior que a diferença esperada.
+        """
+        snapshot = self._lease_snapshot(lock_path)
+        if snapshot is None or time.time() - snapshot[2] <= self.lease_timeout:
+            return None
+        return snapshot
+
+    @staticmethod
+    def _restore_lock(stale_path, lock_path):
+        """Devolve a trava movida por engano; link falha se já existir outra trava no lugar"""
+        try:
+            os.link(stale_path, lock_path)
+        except FileExistsError:
+            pass
+        except OSError:
+            # Sistema de arquivos sem links: rename, conferindo antes que não há outra trava
+            if not os.path.exists(lock_path):
+                try:
+                    os.rename(stale_path, lock_path)
+                except OSError:
+                    pass
+        try:
+            os.remove(stale_path)
+        except OSError:
+            pass
+
+    def owns_lock(self, part_number, worker_id):
+        return (_read_json(self._lock_path(part_number)) or {}).get('worker_id') == worker_id
+
+    def renew(self, part_number, worker_id):
+        """Renova o arrendamento de uma parte (retorna False se a trava foi perdida)"""
+        if not self.owns_lock(part_number, worker_id):
+            return False
+        try:
+            os.utime(self._lock_path(part_number))
+            return True
+        except OSError:
+            return False
+
+    def release(self, part_number, worker_id):
+        if self.owns_lock(part_number, worker_id):
+            try:
+                os.remove(self._lock_path(part_number))
+            except OSError:
+                pass
+
+    def mark_done(self, part_number, worker_id, output_file):
+        _write_json_atomic(self._done_path(part_number), {
+            'worker_id': worker_id, 'host': socket.gethostname(),
+            'output_file': output_file, 'finished_at': time.time()
+        })
+        self.release(part_number, worker_id)
+
+    def mark_failed(self, part_number, worker_id):
+        attempts = self.attempts(part_number) + 1
+        _write_json_atomic(self._failed_path(part_number), {'attempts': attempts, 'last_worker_id': worker_id})
+        self.release(part_number, worker_id)
+        return attempts
+
+    def status(self):
+        """Retorna a contagem de partes por estado"""
+        counts = {'total': 0, 'done': 0, 'failed': 0, 'running': 0, 'pending': 0}
+        for segment in self.load_segments():
+            part_number = segment['part_number']
+            counts['total'] += 1
+            if os.path.exists(self._done_path(part_number)):
+                counts['done'] += 1
+            elif self.attempts(part_number) >= self.max_attempts:
+                counts['failed'] += 1
+            elif os.path.exists(self._lock_path(part_number)):
+                counts['running'] += 1
+            else:
+                counts['pending'] += 1
+        return counts
+
+
+class LeaseKeeper(threading.Thread):
+    """Thread que renova periodicamente o arrendamento de uma parte em processamento"""
+
+    def __init__(self, work_queue, part_number, worker_id):
+        super().__init__(daemon=True)
+        self.work_queue = work_queue
+        self.part_number = part_number
+        self.worker_id = worker_id
+        self.stop_event = threading.Event()
+        self.lost = False
+
+    def run(self):
+        interval = max(self.work_queue.lease_timeout / 4, 1)
+        while not self.stop_event.wait(interval):
+            if not self.work_queue.renew(self.part_number, self.worker_id):
+                print(f"Arrendamento da parte {self.part_number} perdido pelo worker {self.worker_id}")
+                self.lost = True
+                return
+
+    def stop(self):
+        self.stop_event.set()
+        self.join()
+
+
+def render_part(job, segment, worker_id, should_stop, slot=None, scratch_dir=None):
+    """Renderiza uma parte em um arquivo temporário e o move para o nome final ao terminar
+
+    Com scratch_dir, o arquivo temporário fica no disco local do worker e só a parte
+    verificada é copiada para o diretório compartilhado.
+    """
+    output_file = segment_render.get_output_file(segment_render.get_job_output_directory(job), job['output_prefix'], segment['part_number'])
+    # Gravar em um nome temporário para que partes incompletas nunca apareçam com o nome final
+    tmp_file = f"{os.path.splitext(output_file)[0]}.{worker_id}.tmp.mp4"
+    if scratch_dir:
+        tmp_file = os.path.join(scratch_dir, os.path.basename(tmp_file))
+    # Versões adicionais (opção 'renditions') seguem os mesmos nomes, com o sufixo de cada versão
+    tmp_files = segment_render.get_output_files(tmp_file, job)
+    output_files = segment_render.get_output_files(output_file, job)
+    # Saídas auxiliares (opção 'side_outputs'): miniatura, clipe curto e forma de onda
+    tmp_side_files = list(segment_render.get_side_output_files(tmp_file, job).values())
+    side_files = list(segment_render.get_side_output_files(output_file, job).values())
+    try:
+        if not segment_render.render_segment(job, segment, output_file=tmp_file, should_stop=should_stop, slot=slot):
+            return None
+        for path in tmp_files:
+            errors = output_verifier.verify_output(path, segment['duration'])
+            if errors:
+                print(f"Parte {segment['part_number']} ({os.path.basename(path)}) falhou na verificação: {'; '.join(errors)}")
+                return None
+        errors = segment_render.check_side_outputs(tmp_file, job)
+        if errors:
+            print(f"Parte {segment['part_number']} falhou na verificação: {'; '.join(errors)}")
+            return None
+        for path, final_path in zip(tmp_files + tmp_side_files, output_files + side_files):
+            if scratch_dir:
+                scratch_staging.copy_file(path, final_path)
+            else:
+                os.replace(path, final_path)
+        return output_file
+    finally:
+        for path in tmp_files + tmp_side_files:
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def run_worker(share_dir, lease_timeout=DEFAULT_LEASE_TIMEOUT, max_attempts=DEFAULT_MAX_ATTEMPTS,
+               poll_interval=5, wait=False, render_func=render_part, slot=None):
+    """Loop principal de um worker: reivindica, renderiza e conclui partes até esvaziar a fila
+
+    slot (resource_governor.Slot) define a cota de threads, os núcleos e a prioridade do FFmpeg deste worker.
+    """
+    worker_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+    print(f"Worker {worker_id} iniciado em {share_dir}" + (f" ({slot.describe()})" if slot else ""))
+
+    while True:
+        claimed_any = False
+        pending_any = False
+
+        for work_queue in WorkQueue.list_jobs(share_dir, lease_timeout=lease_timeout, max_attempts=max_attempts):
+            job = work_queue.load_job()
+            for segment in work_queue.load_segments():
+                part_number = segment['part_number']
+                if work_queue.is_finished(part_number):
+                    continue
+                pending_any = True
+                if not work_queue.try_claim(part_number, worker_id):
+                    continue
+
+                claimed_any = True
+                print(f"Worker {worker_id} processando parte {part_number} do trabalho {work_queue.job_id}")
+                keeper = LeaseKeeper(work_queue, part_number, worker_id)
+                keeper.start()
+                try:
+                    output_file = render_func(job, segment, worker_id, lambda: keeper.lost, slot)
+                except Exception as e:
+                    print(f"Erro ao processar parte {part_number}: {str(e)}")
+                    output_file = None
+                except KeyboardInterrupt:
+                    # O FFmpeg já foi encerrado por render_segment; devolver a parte para a fila
+                    keeper.stop()
+                    work_queue.release(part_number, worker_id)
+                    raise
+                finally:
+                    keeper.stop()
+
+                if keeper.lost:
+                    # Outro worker recuperou a parte; descartar o resultado deste worker
+                    continue
+                if output_file:
+                    work_queue.mark_done(part_number, worker_id, output_file)
+                else:
+                    attempts = work_queue.mark_failed(part_number, worker_id)
+                    print(f"Parte {part_number} falhou (tentativa {attempts} de {max_attempts})")
+
+        if not claimed_any:
+            if not pending_any and not wait:
+                print(f"Worker {worker_id}: nenhuma parte pendente, encerrando.")
+                return
+            # Aguardar arrendamentos de outros workers expirarem ou novos trabalhos serem publicados
+            time.sleep(poll_interval)
+
+
+def _worker_process(share_dir, lease_timeout, max_attempts, poll_interval, wait, slot=None, scratch_dir=None):
+    render_func = render_part
+    if scratch_dir:
+        os.makedirs(scratch_dir, exist_ok=True)
+        render_func = functools.partial(render_part, scratch_dir=scratch_dir)
+    # SIGTERM (e o Ctrl+C) interrompem a parte atual, encerrando o FFmpeg, e devolvem a parte para a fila
+    ffmpeg_utils.handle_termination_signal()
+    try:
+        run_worker(share_dir, lease_timeout, max_attempts, poll_interval, wait, render_func=render_func, slot=slot)
+    except KeyboardInterrupt:
+        print(f"Worker {os.getpid()} interrompido.")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fila de renderização distribuída em diretório compartilhado")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    publish_parser = subparsers.add_parser("publish", help="Publica o plano de segmentos de um trabalho")
+    publish_parser.add_argument("--share", required=True, help="Diretório compartilhado (ex.: montagem NFS)")
+    publish_parser.add_argument("--input", required=True, help="Vídeo de entrada")
+    publish_parser.add_argument("--image", required=True, help="Imagem de capa")
+    publish_parser.add_argument("--selo", required=True, help="Vídeo do selo")
+    publish_parser.add_argument("--prefix", default="Prefixo Parte ", help="Prefixo de saída")
+    publish_parser.add_argument("--start-index", type=int, default=1)
+    publish_parser.add_argument("--min-duration", type=int, default=90)
+    publish_parser.add_argument("--max-duration", type=int, default=130)
+    publish_parser.add_argument("--output-dir", default="")
+    publish_parser.add_argument("--chroma-color", default="0x00d600")
+    publish_parser.add_argument("--similarity", type=float, default=0.30)
+    publish_parser.add_argument("--blend", type=float, default=0.35)
+    publish_parser.add_argument("--speed-profile", choices=["fast", "balanced", "quality"], default="balanced")
+    publish_parser.add_argument("--job-id", default=None)
+    publish_parser.add_argument("--cut-planner", choices=cut_planner.PLANNER_MODES, default="random",
+                                help="Pontos de corte: durações aleatórias, mudanças de cena ou pausas do áudio")
+    publish_parser.add_argument("--renditions", action="store_true",
+                                help="Gerar também as versões adicionais padrão (ex.: 720p) de cada parte")
+
+    worker_parser = subparsers.add_parser("worker", help="Executa um ou mais workers sem interface")
+    worker_parser.add_argument("--share", required=True)
+    worker_parser.add_argument("--processes", type=int, default=1, help="Número de processos worker locais")
+    worker_parser.add_argument("--lease-timeout", type=float, default=DEFAULT_LEASE_TIMEOUT)
+    worker_parser.add_argument("--max-attempts", type=int, default=DEFAULT_MAX_ATTEMPTS)
+    worker_parser.add_argument("--poll-interval", type=float, default=5)
+    worker_parser.add_argument("--wait", action="store_true", help="Continuar aguardando novos trabalhos")
+    worker_parser.add_argument("--thread-budget", type=int, default=None,
+                               help="Total de threads dividido entre os processos (padrão: núcleos disponíveis)")
+    worker_parser.add_argument("--pin-cores", action="store_true", help="Fixar cada processo em núcleos exclusivos")
+    worker_parser.add_argument("--background", action="store_true", help="Rodar o FFmpeg em baixa prioridade")
+    worker_parser.add_argument("--scratch", default=None,
+                               help="Pasta local onde as partes são gravadas antes de irem para o compartilhamento")
+
+    status_parser = subparsers.add_parser("status", help="Mostra o estado dos trabalhos publicados")
+    status_parser.add_argument("--share", required=True)
+
+    args = parser.parse_args(argv)
+
+    if args.command == "publish":
+        total_duration = segment_render.get_video_duration(args.input)
+        if total_duration <= 0:
+            print("Não foi possível obter a duração do vídeo.")
+            return 1
+        segments = cut_planner.plan_segments(
+            {'input_file': args.input, 'cut_planner': args.cut_planner, 'min_duration': args.min_duration,
+             'max_duration': args.max_duration, 'start_index': args.start_index}, total_duration)
+        prefix = args.prefix if args.prefix.endswith(" ") else args.prefix + " "
+        # Caminhos absolutos: os workers podem estar em outros diretórios de trabalho
+        job = {
+            'input_file': os.path.abspath(args.input),
+            'image_file': os.path.abspath(args.image),
+            'selo_file': os.path.abspath(args.selo),
+            'output_prefix': prefix,
+            'output_directory': os.path.abspath(args.output_dir) if args.output_dir else "",
+            'chroma_color': args.chroma_color,
+            'similarity': args.similarity,
+            'blend': args.blend,
+            'speed_profile': args.speed_profile,
+            'renditions': segment_render.DEFAULT_RENDITIONS if args.renditions else None,
+        }
+        work_queue = WorkQueue.publish(args.share, job, segments, job_id=args.job_id)
+        print(f"Trabalho {work_queue.job_id} publicado com {len(segments)} partes em {work_queue.job_dir}")
+        return 0
+
+    if args.command == "worker":
+        worker_args = (args.share, args.lease_timeout, args.max_attempts, args.poll_interval, args.wait)
+        # Cada processo worker recebe uma vaga fixa do governador (threads, núcleos e prioridade)
+        governor = resource_governor.ResourceGovernor(max(1, args.processes), args.thread_budget,
+                                                      pin_cores=args.pin_cores, background=args.background)
+        if args.processes <= 1:
+            _worker_process(*worker_args, governor.acquire(), args.scratch)
+            return 0
+        processes = [multiprocessing.Process(target=_worker_process, args=worker_args + (governor.acquire(), args.scratch))
+                     for _ in range(args.processes)]
+        for process in processes:
+            process.start()
+        ffmpeg_utils.handle_termination_signal()
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            # Cada worker trata o SIGTERM encerrando o seu FFmpeg antes de sair
+            for process in processes:
+                process.terminate()
+            for process in processes:
+                process.join()
+        return 0
+
+    for work_queue in WorkQueue.list_jobs(args.share):
+        counts = work_queue.status()
+        print(f"{work_queue.job_id}: {counts['done']}/{counts['total']} concluídas, {counts['running']} em andamento, "
+              f"{counts['pending']} pendentes, {counts['failed']} com falha")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
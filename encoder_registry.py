@@ -0,0 +1,431 @@
+"""Registro declarativo dos codificadores de vídeo
+
+Cada codificador é uma entrada de ENCODERS com:
+    'label':       nome exibido
+    'codec':       formato de vídeo gerado (h264, hevc, av1)
+    'hardware':    True para codificadores de GPU (sem cota de threads)
+    'vendor':      fabricante da GPU preferido na escolha automática
+    'check':       verificação de disponibilidade em ffmpeg_utils (padrão: codificar um quadro de teste)
+    'hwaccel':     decodificação acelerada usada junto com o codificador
+    'presets':     presets candidatos por perfil, testados em ordem (substituem "{preset}" nos parâmetros)
+    'profiles':    parâmetros do FFmpeg por perfil de velocidade (fast, balanced, quality)
+    'rate_control': "crf" (qualidade constante, o limite de taxa usa -maxrate) ou "vbr" (alvo em -b:v)
+    'quality_option': opção de qualidade constante ajustada por entrada (bitrate_optimizer), ou None
+    'threading':   como a cota de threads da vaga é aplicada: "ffmpeg" (-threads), "x265" (pools e
+                   frame-threads), "svtav1" (lp e tiles) ou None (hardware)
+    'auto':        participa da escolha automática (os codificadores HEVC/AV1 mudam o formato da
+                   saída e só são usados quando pedidos pela opção 'encoder' do trabalho)
+
+As dicas por resolução (RESOLUTION_HINTS) limitam as threads úteis de cada codificador por software:
+acima delas o ganho de velocidade é pequeno e a eficiência de compressão cai. O SVT-AV1 também recebe
+colunas/linhas de tiles pela largura/altura da saída.
+
+Uso:
+    python encoder_registry.py list
+    python encoder_registry.py benchmark --input video.mp4 --image capa.png --selo selo.mp4 \\
+        --encoders libx264,libx265,libsvtav1 --profiles fast,balanced
+"""
+import threading
+
+import ffmpeg_utils
+
+SPEED_PROFILES = ("fast", "balanced", "quality")
+
+ENCODERS = {
+    "h264_nvenc": {
+        'label': "NVIDIA NVENC",
+        'codec': "h264",
+        'hardware': True,
+        'vendor': "nvidia",
+        'check': "has_nvenc",
+        'hwaccel': ["-hwaccel", "cuda"],
+        'presets': {
+            'fast': ("p2", "p3", "fast", "default"),
+            'balanced': ("p4", "p3", "medium", "default"),
+            'quality': ("p7", "p6", "slow", "default"),
+        },
+        'profiles': {
+            # Otimizado para máxima velocidade
+            'fast': ["-c:v", "h264_nvenc", "-preset", "{preset}", "-rc:v", "vbr", "-cq", "32",
+                     "-b:v", "6M", "-profile:v", "high", "-level:v", "4.2",
+                     "-spatial-aq", "0", "-temporal-aq", "0", "-refs", "1", "-b_ref_mode", "0"],
+            # Equilíbrio entre velocidade e qualidade, mas priorizando velocidade
+            'balanced': ["-c:v", "h264_nvenc", "-preset", "{preset}", "-rc:v", "vbr", "-cq", "26",
+                         "-b:v", "8M", "-profile:v", "high", "-level:v", "4.2",
+                         "-spatial-aq", "0", "-temporal-aq", "0", "-refs", "2", "-b_ref_mode", "0"],
+            # Alta qualidade, mas ainda mantendo boa velocidade
+            'quality': ["-c:v", "h264_nvenc", "-preset", "{preset}", "-rc:v", "vbr", "-cq", "20",
+                        "-b:v", "12M", "-profile:v", "high", "-level:v", "4.2",
+                        "-spatial-aq", "1", "-temporal-aq", "1", "-refs", "3", "-b_ref_mode", "1"],
+        },
+        'rate_control': "vbr",
+        'quality_option': "-cq",
+        'threading': None,
+        'auto': True,
+    },
+    "h264_amf": {
+        'label': "AMD AMF",
+        'codec': "h264",
+        'hardware': True,
+        'vendor': "amd",
+        'check': "has_amf",
+        'hwaccel': ["-hwaccel", "d3d11va"],
+        'profiles': {
+            'fast': ["-c:v", "h264_amf", "-quality", "speed", "-rc", "vbr_peak", "-qp_i", "26", "-qp_p", "28",
+                     "-b:v", "8M", "-profile:v", "high"],
+            'balanced': ["-c:v", "h264_amf", "-quality", "balanced", "-rc", "vbr_peak", "-qp_i", "22", "-qp_p", "24",
+                         "-b:v", "10M", "-profile:v", "high"],
+            'quality': ["-c:v", "h264_amf", "-quality", "quality", "-rc", "vbr_peak", "-qp_i", "18", "-qp_p", "20",
+                        "-b:v", "15M", "-profile:v", "high"],
+        },
+        'rate_control': "vbr",
+        'quality_option': None,
+        'threading': None,
+        'auto': True,
+    },
+    "h264_qsv": {
+        'label': "Intel QuickSync",
+        'codec': "h264",
+        'hardware': True,
+        'vendor': "intel",
+        'check': "has_qsv",
+        'hwaccel': ["-hwaccel", "qsv"],
+        'profiles': {
+            'fast': ["-c:v", "h264_qsv", "-preset", "faster", "-b:v", "8M", "-profile:v", "high"],
+            'balanced': ["-c:v", "h264_qsv", "-preset", "medium", "-b:v", "10M", "-profile:v", "high"],
+            'quality': ["-c:v", "h264_qsv", "-preset", "slower", "-b:v", "15M", "-profile:v", "high"],
+        },
+        'rate_control': "vbr",
+        'quality_option': None,
+        'threading': None,
+        'auto': True,
+    },
+    "libx264": {
+        'label': "x264 (H.264, software)",
+        'codec': "h264",
+        'hardware': False,
+        'profiles': {
+            'fast': ["-c:v", "libx264", "-preset", "veryfast", "-crf", "28", "-profile:v", "high", "-level:v", "4.1"],
+            'balanced': ["-c:v", "libx264", "-preset", "medium", "-crf", "23", "-profile:v", "high", "-level:v", "4.1"],
+            'quality': ["-c:v", "libx264", "-preset", "slow", "-crf", "18", "-profile:v", "high", "-level:v", "4.1"],
+        },
+        'rate_control': "crf",
+        'quality_option': "-crf",
+        'threading': "ffmpeg",
+        'auto': True,
+    },
+    "libx265": {
+        'label': "x265 (HEVC, software)",
+        'codec': "hevc",
+        'hardware': False,
+        # O CRF do x265 é cerca de 5 pontos acima do x264 para a mesma qualidade visual;
+        # hvc1 permite a reprodução do MP4 nos players da Apple
+        'profiles': {
+            'fast': ["-c:v", "libx265", "-preset", "veryfast", "-crf", "32", "-pix_fmt", "yuv420p", "-tag:v", "hvc1"],
+            'balanced': ["-c:v", "libx265", "-preset", "medium", "-crf", "28", "-pix_fmt", "yuv420p", "-tag:v", "hvc1"],
+            'quality': ["-c:v", "libx265", "-preset", "slow", "-crf", "23", "-pix_fmt", "yuv420p", "-tag:v", "hvc1"],
+        },
+        'rate_control': "crf",
+        'quality_option': "-crf",
+        'threading': "x265",
+        'auto': False,
+    },
+    "libsvtav1": {
+        'label': "SVT-AV1 (AV1, software)",
+        'codec': "av1",
+        'hardware': False,
+        # Presets do SVT-AV1: 0 (mais lento) a 13 (mais rápido)
+        'profiles': {
+            'fast': ["-c:v", "libsvtav1", "-preset", "10", "-crf", "38", "-pix_fmt", "yuv420p"],
+            'balanced': ["-c:v", "libsvtav1", "-preset", "8", "-crf", "34", "-pix_fmt", "yuv420p"],
+            'quality': ["-c:v", "libsvtav1", "-preset", "6", "-crf", "30", "-pix_fmt", "yuv420p"],
+        },
+        'rate_control': "crf",
+        'quality_option': "-crf",
+        'threading': "svtav1",
+        'auto': False,
+    },
+}
+
+# Ordem da escolha automática quando o fabricante da GPU não tem codificador disponível
+AUTO_ORDER = ("h264_amf", "h264_nvenc", "h264_qsv", "libx264")
+
+# Dicas por resolução, pelo número de pixels da saída:
+# (pixels até, threads úteis do codificador, frame-threads do x265)
+RESOLUTION_HINTS = (
+    (640 * 360, 4, 1),
+    (1280 * 720, 8, 2),
+    (1920 * 1080, 16, 3),
+    (None, 32, 4),
+)
+# Tiles do SVT-AV1 (log2 do número de colunas/linhas) pela largura/altura da saída
+TILE_THRESHOLDS = ((3840, 2), (1920, 1))
+
+_availability = {}
+_availability_lock = threading.Lock()
+
+
+def get_entry(encoder_name):
+    """Entrada do registro, ou None para codificadores desconhecidos (como "copy")"""
+    return ENCODERS.get(encoder_name)
+
+
+def is_hardware(encoder_name):
+    entry = get_entry(encoder_name)
+    return bool(entry and entry['hardware'])
+
+
+def uses_crf(encoder_name):
+    """True se o codificador usa qualidade constante (o alvo de taxa não vai em -b:v)"""
+    entry = get_entry(encoder_name)
+    return bool(entry and entry['rate_control'] == "crf")
+
+
+def get_quality_value(encoder_name, encoder_params):
+    """Valor da opção de qualidade constante nos parâmetros, ou None se o codificador não a tem"""
+    entry = get_entry(encoder_name)
+    option = entry and entry['quality_option']
+    if not option or option not in encoder_params:
+        return None
+    return float(encoder_params[encoder_params.index(option) + 1])
+
+
+def set_quality_value(encoder_name, encoder_params, value):
+    """Cópia dos parâmetros com outro valor de qualidade constante (sem mudança se não houver a opção)"""
+    params = list(encoder_params)
+    entry = get_entry(encoder_name)
+    option = entry and entry['quality_option']
+    if option and option in params:
+        params[params.index(option) + 1] = f"{value:g}"
+    return params
+
+
+def get_hwaccel_args(encoder_name):
+    entry = get_entry(encoder_name)
+    return list(entry.get('hwaccel', [])) if entry else []
+
+
+def test_encode(encoder_name, extra_args=()):
+    """Codifica um quadro de teste com o codificador; True se o FFmpeg terminou sem erro"""
+    ffmpeg_path = ffmpeg_utils.get_ffmpeg_path()
+    if not ffmpeg_path:
+        return False
+    cmd = [ffmpeg_path, "-f", "lavfi", "-i", "color=c=black:s=64x64:d=0.1",
+           "-c:v", encoder_name] + list(extra_args) + ["-f", "null", "-"]
+    try:
+        return ffmpeg_utils.run_hidden_command(cmd).returncode == 0
+    except Exception:
+        return False
+
+
+def is_available(encoder_name):
+    """Verifica (uma vez por processo) se o FFmpeg consegue usar o codificador"""
+    entry = get_entry(encoder_name)
+    if entry is None:
+        return False
+    with _availability_lock:
+        if encoder_name not in _availability:
+            check = entry.get('check')
+            _availability[encoder_name] = getattr(ffmpeg_utils, check)() if check else test_encode(encoder_name)
+        return _availability[encoder_name]
+
+
+def _resolve_preset(encoder_name, candidates):
+    for preset in candidates[:-1]:
+        if test_encode(encoder_name, ["-preset", preset]):
+            return preset
+    # O último candidato é o mais compatível
+    return candidates[-1]
+
+
+def get_encoder_params(encoder_name, speed_profile="balanced"):
+    """Parâmetros do FFmpeg do codificador para o perfil de velocidade ("-c:v copy" se desconhecido)"""
+    entry = get_entry(encoder_name)
+    if entry is None:
+        return ["-c:v", "copy"]
+    if speed_profile not in ("fast", "balanced"):
+        speed_profile = "quality"
+    params = list(entry['profiles'][speed_profile])
+    if "{preset}" in params:
+        preset = _resolve_preset(encoder_name, entry['presets'][speed_profile])
+        print(f"Usando preset {entry['label']}: {preset} para o perfil {speed_profile}")
+        params[params.index("{preset}")] = preset
+    return params
+
+
+def get_resolution_hints(resolution):
+    """Threads úteis e frame-threads do x265 para a resolução da saída (None = sem limite)"""
+    if not resolution:
+        return None, None
+    pixels = resolution[0] * resolution[1]
+    for max_pixels, max_threads, frame_threads in RESOLUTION_HINTS:
+        if max_pixels is None or pixels <= max_pixels:
+            return max_threads, frame_threads
+
+
+def _tile_log2(size):
+    for threshold, tiles in TILE_THRESHOLDS:
+        if size >= threshold:
+            return tiles
+    return 0
+
+
+def get_thread_args(encoder_name, threads, resolution=None):
+    """Parâmetros do codificador para a cota de threads da vaga e a resolução da saída"""
+    entry = get_entry(encoder_name)
+    if not threads or entry is None or not entry['threading']:
+        return []
+    max_threads, frame_threads = get_resolution_hints(resolution)
+    if max_threads:
+        threads = min(threads, max_threads)
+    if entry['threading'] == "x265":
+        params = f"pools={threads}"
+        if frame_threads:
+            params += f":frame-threads={min(frame_threads, threads)}"
+        return ["-x265-params", params]
+    if entry['threading'] == "svtav1":
+        params = f"lp={threads}"
+        if resolution:
+            params += f":tile-columns={_tile_log2(resolution[0])}:tile-rows={_tile_log2(resolution[1])}"
+        return ["-svtav1-params", params]
+    return ["-threads", str(threads)]
+
+
+def select_encoder(encoder=None):
+    """Escolhe o codificador: o pedido (se disponível) ou o melhor H.264 pelo fabricante da GPU
+
+    Returns:
+        str: nome do codificador, ou "copy" se nenhum estiver disponível
+    """
+    if encoder:
+        if get_entry(encoder) is None:
+            print(f"Aviso: codificador desconhecido: {encoder}; usando a escolha automática.")
+        elif is_available(encoder):
+            print(f"Usando codificador {get_entry(encoder)['label']}")
+            return encoder
+        else:
+            print(f"Aviso: o FFmpeg não oferece o codificador {encoder}; usando a escolha automática.")
+
+    # Detectar o fabricante da GPU
+    gpu_vendor = ffmpeg_utils.detect_gpu_vendor()
+    print(f"Fabricante da GPU detectado: {gpu_vendor}")
+    hardware = [name for name in AUTO_ORDER if ENCODERS[name]['hardware']]
+    available = {name: is_available(name) for name in hardware}
+    print("Codificadores disponíveis - " + ", ".join(
+        f"{ENCODERS[name]['label']}: {available[name]}" for name in hardware))
+
+    # Priorizar o codificador do fabricante da GPU; depois qualquer outro, na ordem do registro
+    candidates = [name for name in hardware if ENCODERS[name]['vendor'] == gpu_vendor] + list(AUTO_ORDER)
+    for name in candidates:
+        if ENCODERS[name]['auto'] and is_available(name):
+            print(f"Usando codificador {ENCODERS[name]['label']}{' (hardware)' if ENCODERS[name]['hardware'] else ''}")
+            return name
+
+    # Fallback para cópia (sem recodificação)
+    print("Nenhum codificador disponível, usando cópia direta")
+    return "copy"
+
+
+def _measure_encoder(job, encoder_name, speed_profile, sample_starts, sample_duration, governor, work_dir):
+    """Codifica as amostras em sequência; velocidade (x tempo real) e taxa de bits, ou None se falhou"""
+    import os
+
+    import calibration
+
+    encoder_params = get_encoder_params(encoder_name, speed_profile)
+    wall_time = 0.0
+    size = 0
+    for index, start_time in enumerate(sample_starts):
+        output_file = os.path.join(work_dir, f"{encoder_name}_{speed_profile}_{index}.mp4")
+        try:
+            with governor.slot() as slot:
+                elapsed = calibration.encode_sample(job, start_time, sample_duration, encoder_name,
+                                                    encoder_params, output_file, slot)
+            if elapsed is None:
+                return None
+            wall_time += elapsed
+            size += os.path.getsize(output_file)
+        finally:
+            ffmpeg_utils.remove_partial_output(output_file)
+    encoded = sample_duration * len(sample_starts)
+    return {'speed': encoded / wall_time, 'kbps': size * 8 / encoded / 1000}
+
+
+def run_benchmark(job, encoders, profiles, sample_count=3, sample_duration=20.0):
+    """Codifica as mesmas amostras com cada codificador e perfil: velocidade e tamanho da saída
+
+    O tamanho é comparado ao do libx264 no mesmo perfil (quando medido).
+    """
+    import shutil
+    import tempfile
+
+    import calibration
+    import resource_governor
+    import segment_render
+
+    total_duration = segment_render.get_video_duration(job['input_file'])
+    if total_duration <= 0:
+        raise RuntimeError(f"Não foi possível obter a duração de {job['input_file']}")
+    sample_starts = calibration.get_sample_starts(total_duration, sample_count, sample_duration)
+    # Uma vaga com todos os núcleos, para aplicar as dicas de threads de cada codificador
+    governor = resource_governor.ResourceGovernor(1, job.get('thread_budget'))
+
+    work_dir = tempfile.mkdtemp(prefix="video_cutter_codificadores_")
+    results = {}
+    try:
+        for encoder_name in encoders:
+            if not is_available(encoder_name):
+                print(f"{encoder_name:<11} indisponível neste FFmpeg")
+                continue
+            for speed_profile in profiles:
+                measurement = _measure_encoder(job, encoder_name, speed_profile, sample_starts, sample_duration,
+                                               governor, work_dir)
+                if measurement is None:
+                    print(f"{encoder_name:<11} {speed_profile:<9} falha ao codificar as amostras")
+                    continue
+                results[(encoder_name, speed_profile)] = measurement
+                line = (f"{encoder_name:<11} {speed_profile:<9} {measurement['speed']:6.2f}x tempo real  "
+                        f"{measurement['kbps']:8.0f} kbps")
+                reference = results.get(("libx264", speed_profile))
+                if reference and encoder_name != "libx264":
+                    line += f"  tamanho {(measurement['kbps'] / reference['kbps'] - 1.0) * 100:+.0f}% sobre libx264"
+                print(line)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+
+def main(argv=None):
+    import argparse
+
+    from job_service import JOB_DEFAULTS
+
+    parser = argparse.ArgumentParser(description="Registro de codificadores de vídeo")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("list", help="Lista os codificadores do registro e a disponibilidade no FFmpeg")
+    bench_parser = subparsers.add_parser("benchmark", help="Compara a velocidade e o tamanho de cada codificador")
+    bench_parser.add_argument("--input", required=True)
+    bench_parser.add_argument("--image", required=True)
+    bench_parser.add_argument("--selo", required=True)
+    bench_parser.add_argument("--encoders", default="libx264,libx265,libsvtav1")
+    bench_parser.add_argument("--profiles", default=",".join(SPEED_PROFILES))
+    bench_parser.add_argument("--samples", type=int, default=3)
+    bench_parser.add_argument("--sample-duration", type=float, default=20.0)
+    args = parser.parse_args(argv)
+
+    if args.command == "list":
+        for name, entry in ENCODERS.items():
+            status = "disponível" if is_available(name) else "indisponível"
+            print(f"{name:<11} {entry['codec']:<5} {entry['label']:<24} {status}")
+        return
+
+    job = dict(JOB_DEFAULTS, input_file=args.input, image_file=args.image, selo_file=args.selo)
+    encoders = [value.strip() for value in args.encoders.split(",") if value.strip()]
+    # libx264 primeiro, como referência de tamanho
+    encoders.sort(key=lambda name: name != "libx264")
+    profiles = [value.strip() for value in args.profiles.split(",") if value.strip()]
+    run_benchmark(job, encoders, profiles, args.samples, args.sample_duration)
+
+
+if __name__ == "__main__":
+    main()
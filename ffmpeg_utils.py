@@ -5,6 +5,8 @@ import shutil
 import tempfile
 import re
 import platform
+import signal
+import time
 
 def get_base_dir():
     """Retorna o diretório base da aplicação, considerando se estamos em um executável PyInstaller ou não"""
@@ -203,31 +205,6 @@ def has_qsv():
         print(f"Erro ao verificar QSV: {str(e)}")
         return False
 
-def test_nvenc_preset(preset):
-    """Testa se um preset específico do NVENC é suportado"""
-    ffmpeg_path = get_ffmpeg_path()
-    if not ffmpeg_path:
-        return False
-
-    try:
-        # Configurar startupinfo para esconder a janela do console
-        startupinfo = None
-        if os.name == 'nt':  # Windows
-            startupinfo = subprocess.STARTUPINFO()
-            startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-            startupinfo.wShowWindow = subprocess.SW_HIDE
-
-        # Teste rápido para verificar se o preset é suportado
-        test_cmd = [
-            ffmpeg_path,
-            "-f", "lavfi", "-i", "color=c=black:s=64x64:d=0.1",
-            "-c:v", "h264_nvenc", "-preset", preset, "-f", "null", "-"
-        ]
-        result = subprocess.run(test_cmd, capture_output=True, text=True, startupinfo=startupinfo)
-        return result.returncode == 0
-    except Exception:
-        return False
-
 def get_encoder_params(encoder_name, speed_profile="balanced"):
     """Retorna os parâmetros de codificação com base no codificador e no perfil de velocidade
 
@@ -235,176 +212,48 @@ def get_encoder_params(encoder_name, speed_profile="balanced"):
     - 'fast': Prioriza velocidade sobre qualidade
     - 'balanced': Equilíbrio entre velocidade e qualidade
     - 'quality': Prioriza qualidade sobre velocidade
+
+    Os parâmetros de cada codificador ficam no registro declarativo (encoder_registry).
     """
-    # Definir parâmetros para cada codificador e perfil de velocidade
-    if encoder_name == "h264_nvenc":  # NVIDIA
-        if speed_profile == "fast":
-            # Testar diferentes presets em ordem de preferência
-            preset = "p2"  # Primeira opção
-            if not test_nvenc_preset("p2"):
-                # Se p2 não for suportado, tentar p3
-                if test_nvenc_preset("p3"):
-                    preset = "p3"
-                # Se nenhum preset p* for suportado, usar preset nomeado
-                elif test_nvenc_preset("fast"):
-                    preset = "fast"
-                else:
-                    # Fallback para o preset mais compatível
-                    preset = "default"
-
-            print(f"Usando preset NVENC: {preset} para perfil rápido")
-            # Otimizado para máxima velocidade
-            return ["-c:v", "h264_nvenc", "-preset", preset, "-rc:v", "vbr", "-cq", "32",
-                    "-b:v", "6M", "-profile:v", "high", "-level:v", "4.2",
-                    "-spatial-aq", "0", "-temporal-aq", "0", "-refs", "1", "-b_ref_mode", "0"]
-        elif speed_profile == "balanced":
-            # Testar diferentes presets em ordem de preferência
-            preset = "p4"  # Primeira opção
-            if not test_nvenc_preset("p4"):
-                # Se p4 não for suportado, tentar p3
-                if test_nvenc_preset("p3"):
-                    preset = "p3"
-                # Se nenhum preset p* for suportado, usar preset nomeado
-                elif test_nvenc_preset("medium"):
-                    preset = "medium"
-                else:
-                    # Fallback para o preset mais compatível
-                    preset = "default"
-
-            print(f"Usando preset NVENC: {preset} para perfil balanceado")
-            # Otimizado para equilíbrio entre velocidade e qualidade, mas priorizando velocidade
-            return ["-c:v", "h264_nvenc", "-preset", preset, "-rc:v", "vbr", "-cq", "26",
-                    "-b:v", "8M", "-profile:v", "high", "-level:v", "4.2",
-                    "-spatial-aq", "0", "-temporal-aq", "0", "-refs", "2", "-b_ref_mode", "0"]
-        else:  # quality
-            # Testar diferentes presets em ordem de preferência
-            preset = "p7"  # Primeira opção
-            if not test_nvenc_preset("p7"):
-                # Se p7 não for suportado, tentar p6
-                if test_nvenc_preset("p6"):
-                    preset = "p6"
-                # Se nenhum preset p* for suportado, usar preset nomeado
-                elif test_nvenc_preset("slow"):
-                    preset = "slow"
-                else:
-                    # Fallback para o preset mais compatível
-                    preset = "default"
-
-            print(f"Usando preset NVENC: {preset} para perfil de alta qualidade")
-            # Otimizado para alta qualidade, mas ainda mantendo boa velocidade
-            return ["-c:v", "h264_nvenc", "-preset", preset, "-rc:v", "vbr", "-cq", "20",
-                    "-b:v", "12M", "-profile:v", "high", "-level:v", "4.2",
-                    "-spatial-aq", "1", "-temporal-aq", "1", "-refs", "3", "-b_ref_mode", "1"]
-
-    elif encoder_name == "h264_amf":  # AMD
-        if speed_profile == "fast":
-            return ["-c:v", "h264_amf", "-quality", "speed", "-rc", "vbr_peak", "-qp_i", "26", "-qp_p", "28",
-                    "-b:v", "8M", "-profile:v", "high"]
-        elif speed_profile == "balanced":
-            return ["-c:v", "h264_amf", "-quality", "balanced", "-rc", "vbr_peak", "-qp_i", "22", "-qp_p", "24",
-                    "-b:v", "10M", "-profile:v", "high"]
-        else:  # quality
-            return ["-c:v", "h264_amf", "-quality", "quality", "-rc", "vbr_peak", "-qp_i", "18", "-qp_p", "20",
-                    "-b:v", "15M", "-profile:v", "high"]
-
-    elif encoder_name == "h264_qsv":  # Intel
-        if speed_profile == "fast":
-            return ["-c:v", "h264_qsv", "-preset", "faster", "-b:v", "8M", "-profile:v", "high"]
-        elif speed_profile == "balanced":
-            return ["-c:v", "h264_qsv", "-preset", "medium", "-b:v", "10M", "-profile:v", "high"]
-        else:  # quality
-            return ["-c:v", "h264_qsv", "-preset", "slower", "-b:v", "15M", "-profile:v", "high"]
-
-    elif encoder_name == "libx264":  # Software
-        if speed_profile == "fast":
-            return ["-c:v", "libx264", "-preset", "veryfast", "-crf", "28",
-                    "-profile:v", "high", "-level:v", "4.1"]
-        elif speed_profile == "balanced":
-            return ["-c:v", "libx264", "-preset", "medium", "-crf", "23",
-                    "-profile:v", "high", "-level:v", "4.1"]
-        else:  # quality
-            return ["-c:v", "libx264", "-preset", "slow", "-crf", "18",
-                    "-profile:v", "high", "-level:v", "4.1"]
-
-    else:  # copy
-        return ["-c:v", "copy"]
-
-def get_video_encoder(speed_profile="balanced"):
+    import encoder_registry
+
+    return encoder_registry.get_encoder_params(encoder_name, speed_profile)
+
+# Cache do codificador escolhido por perfil de velocidade (e codificador pedido)
+# A detecção executa vários testes de codificação, então é feita apenas uma vez por processo
+_encoder_cache = {}
+
+def get_video_encoder(speed_profile="balanced", use_cache=True, encoder=None):
     """Retorna o melhor codificador de vídeo disponível
 
     Args:
         speed_profile (str): Perfil de velocidade ('fast', 'balanced', 'quality')
+        use_cache (bool): Reutilizar o resultado de uma detecção anterior
+        encoder (str): Codificador pedido pelo trabalho (opção 'encoder', ex.: "libx265");
+            None para a escolha automática pelo fabricante da GPU
     """
-    # Detectar o fabricante da GPU
-    gpu_vendor = detect_gpu_vendor()
-    print(f"Fabricante da GPU detectado: {gpu_vendor}")
-
-    # Verificar quais aceleradores de hardware estão disponíveis
-    nvenc_available = has_nvenc()  # NVIDIA
-    amf_available = has_amf()      # AMD
-    qsv_available = has_qsv()      # Intel
+    import encoder_registry
 
-    print(f"Codificadores disponíveis - NVIDIA: {nvenc_available}, AMD: {amf_available}, Intel: {qsv_available}")
+    cache_key = (speed_profile, encoder)
+    if use_cache and cache_key in _encoder_cache:
+        encoder_name, encoder_params = _encoder_cache[cache_key]
+        return encoder_name, list(encoder_params)
 
-    # Verificar se o libx264 está disponível (codificador por software)
-    ffmpeg_path = get_ffmpeg_path()
-    libx264_available = False
-
-    if ffmpeg_path:
-        try:
-            # Configurar startupinfo para esconder a janela do console
-            startupinfo = None
-            if os.name == 'nt':  # Windows
-                startupinfo = subprocess.STARTUPINFO()
-                startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-                startupinfo.wShowWindow = subprocess.SW_HIDE
-
-            # Teste rápido para verificar se libx264 está disponível
-            test_cmd = [
-                ffmpeg_path,
-                "-f", "lavfi", "-i", "color=c=black:s=64x64:d=0.1",
-                "-c:v", "libx264", "-f", "null", "-"
-            ]
-            result = subprocess.run(test_cmd, capture_output=True, text=True, startupinfo=startupinfo)
-            libx264_available = (result.returncode == 0)
-        except Exception:
-            libx264_available = False
-
-    # Priorizar o codificador com base no fabricante da GPU
-    if gpu_vendor == "amd" and amf_available:
-        print("Usando codificador AMD AMF (hardware)")
-        encoder_name = "h264_amf"
-    elif gpu_vendor == "nvidia" and nvenc_available:
-        print("Usando codificador NVIDIA NVENC (hardware)")
-        encoder_name = "h264_nvenc"
-    elif gpu_vendor == "intel" and qsv_available:
-        print("Usando codificador Intel QuickSync (hardware)")
-        encoder_name = "h264_qsv"
-    # Fallback para qualquer acelerador disponível se o fabricante não for detectado
-    elif amf_available:
-        print("Usando codificador AMD AMF (hardware)")
-        encoder_name = "h264_amf"
-    elif nvenc_available:
-        print("Usando codificador NVIDIA NVENC (hardware)")
-        encoder_name = "h264_nvenc"
-    elif qsv_available:
-        print("Usando codificador Intel QuickSync (hardware)")
-        encoder_name = "h264_qsv"
-    elif libx264_available:
-        print("Usando codificador libx264 (software)")
-        encoder_name = "libx264"
-    else:
-        # Fallback para cópia (sem recodificação)
-        print("Nenhum codificador disponível, usando cópia direta")
-        encoder_name = "copy"
+    encoder_name = encoder_registry.select_encoder(encoder)
 
     # Obter os parâmetros de codificação com base no perfil de velocidade
     encoder_params = get_encoder_params(encoder_name, speed_profile)
+    _encoder_cache[cache_key] = (encoder_name, list(encoder_params))
 
     return encoder_name, encoder_params
 
-def run_ffmpeg_command(cmd):
-    """Executa um comando FFmpeg, substituindo 'ffmpeg' pelo caminho correto"""
+def run_ffmpeg_command(cmd, **popen_kwargs):
+    """Executa um comando FFmpeg, substituindo 'ffmpeg' pelo caminho correto
+
+    popen_kwargs são repassados ao subprocess.Popen (ex.: creationflags
+    de uma vaga do resource_governor). O FFmpeg é iniciado em um grupo de processos próprio,
+    para que kill_process_trees possa encerrá-lo junto com todos os processos filhos.
+    """
     ffmpeg_path = get_ffmpeg_path()
     if not ffmpeg_path:
         raise FileNotFoundError("FFmpeg não encontrado no sistema ou no pacote da aplicação")
@@ -427,15 +276,85 @@ def run_ffmpeg_command(cmd):
     # Usar -loglevel verbose para garantir que todas as informações sejam exibidas
     cmd.extend(["-loglevel", "verbose", "-stats", "-progress", "pipe:1"])
 
+    # Grupo de processos próprio (nova sessão no Linux/macOS, novo grupo de console no Windows)
+    if os.name == 'nt':
+        popen_kwargs['creationflags'] = popen_kwargs.get('creationflags', 0) | subprocess.CREATE_NEW_PROCESS_GROUP
+    else:
+        popen_kwargs['start_new_session'] = True
+
     return subprocess.Popen(
         cmd,
         stdout=subprocess.PIPE,
         stderr=subprocess.STDOUT,  # Redirecionar stderr para stdout
         universal_newlines=False,  # Usar bytes para evitar problemas de codificação
         startupinfo=startupinfo,
-        bufsize=0  # Sem buffering para garantir saída em tempo real
+        bufsize=0,  # Sem buffering para garantir saída em tempo real
+        **popen_kwargs
     )
 
+def _signal_process_tree(process, force):
+    """Envia o sinal de término (ou de encerramento forçado) para o grupo de processos do FFmpeg"""
+    try:
+        if os.name == 'nt':
+            if force:
+                # /T encerra também os processos filhos
+                run_hidden_command(["taskkill", "/F", "/T", "/PID", str(process.pid)])
+            else:
+                process.send_signal(signal.CTRL_BREAK_EVENT)
+        else:
+            os.killpg(process.pid, signal.SIGKILL if force else signal.SIGTERM)
+    except (OSError, ValueError):
+        # Processo (ou grupo) já terminou
+        pass
+
+def _raise_keyboard_interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+def handle_termination_signal():
+    """Trata o SIGTERM como o Ctrl+C (KeyboardInterrupt) na thread principal
+
+    O FFmpeg roda em uma sessão própria e não recebe os sinais do terminal nem os enviados ao
+    processo Python: os programas sem interface chamam esta função e, ao receber KeyboardInterrupt,
+    encerram os seus processos FFmpeg com kill_process_trees (ou ParallelJob.stop) antes de sair.
+    """
+    if hasattr(signal, 'SIGTERM'):
+        signal.signal(signal.SIGTERM, _raise_keyboard_interrupt)
+
+def kill_process_trees(processes, grace_period=0.3):
+    """Encerra os processos FFmpeg e seus filhos, com um curto período para terminarem sozinhos
+
+    Todos recebem o sinal de término ao mesmo tempo; os que ainda estiverem rodando após
+    grace_period segundos são encerrados à força. Retorna em no máximo ~grace_period + 0.2s.
+    """
+    running = [process for process in processes if process is not None and process.poll() is None]
+    for process in running:
+        _signal_process_tree(process, force=False)
+
+    deadline = time.time() + grace_period
+    while running and time.time() < deadline:
+        running = [process for process in running if process.poll() is None]
+        if running:
+            time.sleep(0.02)
+
+    for process in running:
+        _signal_process_tree(process, force=True)
+    deadline = time.time() + 0.2
+    for process in running:
+        try:
+            process.wait(timeout=max(0.0, deadline - time.time()))
+        except subprocess.TimeoutExpired:
+            pass
+
+def remove_partial_output(path):
+    """Remove um arquivo de saída incompleto, se existir"""
+    if not path:
+        return False
+    try:
+        os.remove(path)
+        return True
+    except OSError:
+        return False
+
 def run_ffprobe_command(cmd):
     """Executa um comando FFprobe, substituindo 'ffprobe' pelo caminho correto"""
     ffprobe_path = get_ffprobe_path()
@@ -459,3 +378,51 @@ def run_ffprobe_command(cmd):
         text=True,
         startupinfo=startupinfo
     )
+
+def run_hidden_command(cmd, text=True):
+    """Executa um comando auxiliar (FFmpeg/FFprobe com caminho completo) sem abrir janela de console"""
+    startupinfo = None
+    if os.name == 'nt':  # Windows
+        startupinfo = subprocess.STARTUPINFO()
+        startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+        startupinfo.wShowWindow = subprocess.SW_HIDE
+
+    return subprocess.run(
+        cmd,
+        capture_output=True,
+        text=text,
+        startupinfo=startupinfo
+    )
+
+def open_ffmpeg_pipe(args):
+    """Inicia o FFmpeg com a saída (stdout) em um pipe binário, para ler frames ou áudio brutos
+
+    Args:
+        args (list): Argumentos do FFmpeg sem o executável (a saída deve ser "-" / "pipe:1")
+    """
+    ffmpeg_path = get_ffmpeg_path()
+    if not ffmpeg_path:
+        raise FileNotFoundError("FFmpeg não encontrado no sistema ou no pacote da aplicação")
+
+    startupinfo = None
+    if os.name == 'nt':  # Windows
+        startupinfo = subprocess.STARTUPINFO()
+        startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+        startupinfo.wShowWindow = subprocess.SW_HIDE
+
+    return subprocess.Popen(
+        [ffmpeg_path, "-v", "error", "-nostdin"] + list(args),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        startupinfo=startupinfo
+    )
+
+def read_pipe_into(stream, view):
+    """Preenche o memoryview com dados do pipe; retorna o número de bytes lidos (menor no fim)"""
+    read = 0
+    while read < len(view):
+        n = stream.readinto(view[read:])
+        if not n:
+            break
+        read += n
+    return read
@@ -0,0 +1,179 @@
+"""Saída em HLS ou CMAF gerada diretamente durante a codificação
+
+Com a opção 'packaging' do trabalho, cada parte é gravada como uma apresentação segmentada
+em vez de um MP4 único, pelo próprio processo FFmpeg que codifica a parte (sem segunda passagem):
+
+    {output_prefix}{parte}/index.m3u8         playlist da parte
+    {output_prefix}{parte}/index_000.ts       segmentos (HLS/MPEG-TS)
+    {output_prefix}{parte}/index_000.m4s      segmentos (CMAF/fMP4), com index_init.mp4
+    {output_prefix}{parte}/master.m3u8        playlist mestre da parte, com as suas versões
+    {output_prefix}index.json                 índice do trabalho (não HLS), com as partes
+
+Cada parte é um vídeo independente, então cada uma tem a sua playlist mestre: as variantes de
+uma playlist mestre são tratadas pelo player como versões do mesmo conteúdo e alternadas
+conforme a banda, e por isso nunca listam partes diferentes.
+
+Os quadros-chave são forçados nos limites dos segmentos, então todos os segmentos têm a
+duração configurada e começam com um quadro-chave.
+
+Opção do trabalho:
+    'packaging': {'format': "hls" ou "cmaf", 'segment_duration': 4}
+"""
+import json
+import os
+import re
+from urllib.parse import quote, unquote
+
+PACKAGING_DEFAULTS = {'format': "hls", 'segment_duration': 4}
+PACKAGING_FORMATS = ("hls", "cmaf")
+PLAYLIST_NAME = "index.m3u8"
+MASTER_PLAYLIST_NAME = "master.m3u8"
+JOB_INDEX_SUFFIX = "index.json"
+
+
+def get_packaging(job):
+    """Configuração de empacotamento do trabalho com os valores padrão, ou None para MP4"""
+    packaging = job.get('packaging')
+    if not packaging or job.get('proxy'):
+        return None
+    packaging = dict(PACKAGING_DEFAULTS, **packaging)
+    if packaging['format'] not in PACKAGING_FORMATS:
+        raise ValueError(f"Formato de empacotamento inválido: {packaging['format']}")
+    return packaging
+
+
+def get_part_playlist(output_directory, output_prefix, part_number):
+    """Playlist de uma parte, dentro da pasta da parte"""
+    return os.path.join(output_directory, f"{output_prefix}{part_number}", PLAYLIST_NAME)
+
+
+def get_part_directory(playlist):
+    return os.path.dirname(playlist)
+
+
+def get_output_args(packaging, playlist):
+    """Opções de saída do FFmpeg que gravam a parte diretamente como HLS ou CMAF"""
+    segment_duration = packaging['segment_duration']
+    stem = os.path.splitext(os.path.basename(playlist))[0]
+    directory = os.path.dirname(playlist)
+    cmaf = packaging['format'] == "cmaf"
+
+    args = [
+        # Quadro-chave no início de cada segmento
+        "-force_key_frames", f"expr:gte(t,n_forced*{segment_duration})",
+        "-f", "hls",
+        "-hls_time", str(segment_duration),
+        "-hls_playlist_type", "vod",
+        "-hls_flags", "independent_segments",
+        "-hls_segment_filename", os.path.join(directory, f"{stem}_%03d.{'m4s' if cmaf else 'ts'}"),
+    ]
+    if cmaf:
+        args.extend(["-hls_segment_type", "fmp4", "-hls_fmp4_init_filename", f"{stem}_init.mp4"])
+    args.append(playlist)
+    return args
+
+
+def get_master_playlist(part_playlist):
+    """Playlist mestre de uma parte, ao lado da playlist principal da parte"""
+    return os.path.join(get_part_directory(part_playlist), MASTER_PLAYLIST_NAME)
+
+
+def get_job_index(output_directory, output_prefix):
+    return os.path.join(output_directory, f"{output_prefix}{JOB_INDEX_SUFFIX}")
+
+
+def _read_segments(playlist):
+    """(duração do EXTINF, caminho) de cada segmento e a EXT-X-TARGETDURATION da playlist"""
+    directory = os.path.dirname(playlist)
+    segments = []
+    target_duration = None
+    extinf = None
+    with open(playlist, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith("#EXT-X-TARGETDURATION:"):
+                target_duration = float(line.split(":", 1)[1])
+            elif line.startswith("#EXTINF:"):
+                extinf = float(line.split(":", 1)[1].split(",", 1)[0])
+            elif line and not line.startswith("#") and extinf is not None:
+                segments.append((extinf, os.path.join(directory, unquote(line))))
+                extinf = None
+    return segments, target_duration
+
+
+def _measure_bandwidth(playlist, duration):
+    """Taxa de pico e taxa média (bits/s) de uma playlist a partir dos seus segmentos
+
+    O pico segue a RFC 8216: a maior taxa entre os conjuntos contíguos de segmentos com duração
+    total entre 0,5 e 1,5 vez a EXT-X-TARGETDURATION. A média é o tamanho total (com o segmento
+    de inicialização do CMAF) dividido pela duração da parte.
+    """
+    segments, target_duration = _read_segments(playlist)
+    sizes = [os.path.getsize(path) if os.path.isfile(path) else 0 for _, path in segments]
+    stem = os.path.splitext(os.path.basename(playlist))[0]
+    init_file = os.path.join(os.path.dirname(playlist), f"{stem}_init.mp4")
+    init_bytes = os.path.getsize(init_file) if os.path.isfile(init_file) else 0
+    average = int((sum(sizes) + init_bytes) * 8 / duration) if duration > 0 else 0
+
+    peak = 0
+    target_duration = target_duration or max((extinf for extinf, _ in segments), default=0)
+    for first in range(len(segments)):
+        total_duration = 0.0
+        total_bytes = 0
+        for index in range(first, len(segments)):
+            total_duration += segments[index][0]
+            total_bytes += sizes[index]
+            if total_duration > 1.5 * target_duration:
+                break
+            if total_duration >= 0.5 * target_duration and total_duration > 0:
+                peak = max(peak, int(total_bytes * 8 / total_duration))
+    return max(peak, average), average
+
+
+def _write_atomic(path, text):
+    tmp_file = f"{path}.tmp"
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_file, path)
+
+
+def write_master_playlist(master_file, entries, duration):
+    """Grava a playlist mestre de uma parte
+
+    Args:
+        entries (list): (caminho da playlist, (largura, altura)) da saída principal e de cada
+            versão adicional da mesma parte
+        duration (float): duração da parte, para a taxa média (AVERAGE-BANDWIDTH) de cada versão
+
+    Returns:
+        str: o caminho da playlist mestre, ou None se nenhuma playlist da parte existe
+    """
+    master_directory = os.path.dirname(master_file)
+    lines = ["#EXTM3U", "#EXT-X-VERSION:7", "#EXT-X-INDEPENDENT-SEGMENTS"]
+    for playlist, resolution in entries:
+        if not os.path.isfile(playlist):
+            continue
+        width, height = resolution
+        bandwidth, average_bandwidth = _measure_bandwidth(playlist, duration)
+        lines.append(f"#EXT-X-STREAM-INF:BANDWIDTH={bandwidth},AVERAGE-BANDWIDTH={average_bandwidth},"
+                     f"RESOLUTION={width}x{height}")
+        # URI relativa à playlist mestre
+        lines.append(quote(os.path.relpath(playlist, master_directory).replace(os.sep, "/")))
+    if len(lines) == 3:
+        return None
+    _write_atomic(master_file, "\n".join(lines) + "\n")
+    return master_file
+
+
+def write_job_index(index_file, parts):
+    """Grava o índice do trabalho: a playlist mestre de cada parte, na ordem do plano
+
+    Args:
+        parts (list): (número da parte, duração, caminho da playlist mestre) por parte gerada
+    """
+    index_directory = os.path.dirname(index_file)
+    index = {'parts': [{'part': part_number, 'duration': round(duration, 3),
+                        'master': os.path.relpath(master_file, index_directory).replace(os.sep, "/")}
+                       for part_number, duration, master_file in parts]}
+    _write_atomic(index_file, json.dumps(index, ensure_ascii=False, indent=2) + "\n")
+    return index_file
@@ -0,0 +1,214 @@
+"""Reempacotamento único de entradas sem índice de busca
+
+Gravações do OBS em MKV ou TS muitas vezes não têm índice (Cues do Matroska, ausentes quando a
+gravação é interrompida; o MPEG-TS nunca tem) nem duração no cabeçalho. Cada parte abre a entrada e
+busca o seu trecho, então sem índice cada busca percorre o arquivo, e a duração informada pelo
+FFprobe pode estar errada.
+
+Antes do plano, a entrada é verificada e, se necessário, reempacotada uma única vez (-c copy, na
+velocidade do disco) em um MP4 indexado na área temporária local; todas as partes leem esse arquivo.
+O MP4 fica em cache pelo hash amostrado da entrada, então a prévia e o corte completo do mesmo
+vídeo reempacotam uma só vez. Cada trabalho que lê um arquivo reempacotado o mantém referenciado até
+terminar (release_input); apenas os REMUX_KEEP arquivos usados mais recentemente são mantidos, e um
+arquivo ainda referenciado por um trabalho em andamento nunca é removido.
+
+Opção do trabalho 'remux_input': "auto" (verificar a entrada), True (sempre) ou False (nunca).
+"""
+import json
+import os
+import tempfile
+import threading
+import uuid
+
+import analysis_cache
+import ffmpeg_utils
+
+REMUX_SUBFOLDER = "video_cutter_remux"
+# Número de entradas reempacotadas mantidas na área temporária
+REMUX_KEEP = 3
+# Contêineres sem índice de busca
+UNINDEXED_FORMATS = ("mpegts", "flv")
+# Bytes do início do MKV onde o SeekHead (que aponta para as Cues) é procurado
+MATROSKA_HEAD_SIZE = 1024 * 1024
+# ID do elemento Cues do Matroska
+MATROSKA_CUES_ID = b"\x1c\x53\xbb\x6b"
+
+# Trabalhos em andamento que leem cada arquivo reempacotado (caminho -> contagem)
+_in_use = {}
+_in_use_lock = threading.Lock()
+
+
+def _probe_format(input_file):
+    cmd = ["ffprobe", "-v", "error", "-show_entries", "format=format_name,duration", "-of", "json", input_file]
+    result = ffmpeg_utils.run_ffprobe_command(cmd)
+    if result.returncode != 0:
+        return None
+    try:
+        return json.loads(result.stdout).get('format', {})
+    except ValueError:
+        return None
+
+
+def _matroska_has_cues(input_file):
+    """O SeekHead no início do arquivo referencia as Cues quando a gravação foi finalizada"""
+    with open(input_file, "rb") as f:
+        return MATROSKA_CUES_ID in f.read(MATROSKA_HEAD_SIZE)
+
+
+def needs_remux(input_file):
+    """Motivo para reempacotar a entrada, ou None se ela já tem índice e duração"""
+    probe = _probe_format(input_file)
+    if probe is None:
+        return None
+    format_names = probe.get('format_name', "").split(",")
+    if any(name in UNINDEXED_FORMATS for name in format_names):
+        return f"contêiner {probe['format_name']} sem índice de busca"
+    try:
+        if float(probe.get('duration', "")) <= 0:
+            raise ValueError
+    except ValueError:
+        return "duração ausente no cabeçalho"
+    if "matroska" in format_names and not _matroska_has_cues(input_file):
+        return "MKV sem índice (Cues)"
+    return None
+
+
+def get_remux_dir(job):
+    """Pasta local dos arquivos reempacotados: a área temporária do trabalho ou a do sistema"""
+    scratch_dir = job.get('scratch_dir')
+    base_dir = tempfile.gettempdir() if not scratch_dir or scratch_dir == "auto" else scratch_dir
+    return os.path.join(base_dir, REMUX_SUBFOLDER)
+
+
+def _run_remux(input_file, output_file, should_stop=None):
+    cmd = ["ffmpeg", "-y", "-fflags", "+genpts", "-i", input_file, "-map", "0:v", "-map", "0:a?",
+           "-c", "copy", "-movflags", "+faststart", output_file]
+    process = ffmpeg_utils.run_ffmpeg_command(cmd)
+    for _ in iter(process.stdout.readline, b''):
+        if should_stop and should_stop():
+            ffmpeg_utils.kill_process_trees([process])
+            break
+    process.wait()
+    return process.returncode == 0 and not (should_stop and should_stop())
+
+
+def _evict(remux_dir, keep):
+    """Remove os arquivos menos usados além de keep, exceto os referenciados por trabalhos em andamento
+
+    Deve ser chamada com _in_use_lock adquirido.
+    """
+    entries = sorted((os.path.getmtime(os.path.join(remux_dir, name)), name) for name in os.listdir(remux_dir)
+                     if name.endswith((".mp4", ".mkv")) and ".tmp." not in name)
+    for _, name in entries[:-keep] if keep else entries:
+        path = os.path.join(remux_dir, name)
+        if _in_use.get(os.path.abspath(path)):
+            continue
+        ffmpeg_utils.remove_partial_output(path)
+
+
+def _acquire(path):
+    key = os.path.abspath(path)
+    _in_use[key] = _in_use.get(key, 0) + 1
+
+
+def release_input(remuxed):
+    """Libera o arquivo reempacotado ao fim do trabalho e remove os que não são mais usados"""
+    key = os.path.abspath(remuxed)
+    with _in_use_lock:
+        count = _in_use.get(key, 0) - 1
+        if count > 0:
+            _in_use[key] = count
+        else:
+            _in_use.pop(key, None)
+        try:
+            _evict(os.path.dirname(key), REMUX_KEEP)
+        except OSError:
+            pass
+
+
+def remux_input(input_file, remux_dir, log=print, should_stop=None):
+    """Reempacota a entrada em um arquivo indexado (reaproveitado se já existir)
+
+    O arquivo devolvido fica referenciado e não é removido até release_input ser chamada.
+
+    Returns:
+        str: caminho do arquivo reempacotado, ou None em caso de erro
+    """
+    os.makedirs(remux_dir, exist_ok=True)
+    content_hash = analysis_cache.file_sample_hash(input_file)
+    # MP4 primeiro; o Matroska (com índice) aceita os codecs que o MP4 não aceita, como PCM
+    for extension in (".mp4", ".mkv"):
+        remuxed = os.path.join(remux_dir, content_hash + extension)
+        with _in_use_lock:
+            if os.path.isfile(remuxed):
+                os.utime(remuxed)
+                _acquire(remuxed)
+                return remuxed
+    for extension in (".mp4", ".mkv"):
+        remuxed = os.path.join(remux_dir, content_hash + extension)
+        tmp_file = os.path.join(remux_dir, f"{content_hash}.{uuid.uuid4().hex[:6]}.tmp{extension}")
+        try:
+            ok = _run_remux(input_file, tmp_file, should_stop)
+        except OSError as e:
+            log(f"Aviso: não foi possível reempacotar a entrada: {str(e)}")
+            ok = False
+        if ok:
+            with _in_use_lock:
+                os.replace(tmp_file, remuxed)
+                _acquire(remuxed)
+                _evict(remux_dir, REMUX_KEEP)
+            return remuxed
+        ffmpeg_utils.remove_partial_output(tmp_file)
+        if should_stop and should_stop():
+            return None
+    return None
+
+
+def prepare_input(job, log=print, should_stop=None):
+    """Verifica a entrada do trabalho e a reempacota se necessário
+
+    Returns:
+        str: caminho do arquivo a ser lido pelas partes (liberar com release_input ao fim do
+        trabalho), ou None para usar a entrada original
+    """
+    mode = job.get('remux_input', "auto")
+    if not mode or job.get('proxy'):
+        # A prévia busca direto no início de cada parte e não justifica copiar a entrada inteira
+        return None
+    input_file = job['input_file']
+    try:
+        reason = "reempacotamento solicitado pelo trabalho" if mode is True else needs_remux(input_file)
+    except (OSError, FileNotFoundError) as e:
+        log(f"Aviso: não foi possível verificar o índice da entrada: {str(e)}")
+        return None
+    if reason is None:
+        return None
+    log(f"Reempacotando a entrada uma vez, sem recodificar, para um arquivo indexado ({reason})...")
+    remuxed = remux_input(input_file, get_remux_dir(job), log=log, should_stop=should_stop)
+    if remuxed is None:
+        log("Aviso: falha ao reempacotar a entrada; as partes lerão o arquivo original.")
+    else:
+        log(f"As partes lerão a entrada reempacotada {remuxed}")
+    return remuxed
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Verifica o índice de busca de um vídeo e o reempacota se necessário")
+    parser.add_argument("input")
+    parser.add_argument("--remux", action="store_true", help="Reempacotar mesmo que a entrada tenha índice")
+    parser.add_argument("--dir", default=None, help="Pasta dos arquivos reempacotados")
+    args = parser.parse_args(argv)
+
+    reason = needs_remux(args.input)
+    print(f"Índice: {reason or 'ok'}")
+    if reason or args.remux:
+        remuxed = remux_input(args.input, args.dir or get_remux_dir({}))
+        print(remuxed)
+        if remuxed:
+            release_input(remuxed)
+
+
+if __name__ == "__main__":
+    main()
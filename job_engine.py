@@ -0,0 +1,446 @@
+"""Motor de processamento paralelo sem interface gráfica
+
+Executa o mesmo plano de segmentos do ParallelProcessor, mas usando threads comuns e
+eventos em forma de dicionário, para ser usado por processos sem Qt (como o serviço local).
+"""
+import os
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+import auto_reframe
+import bitrate_optimizer
+import cut_planner
+import ffmpeg_utils
+import hls_packaging
+import input_remux
+import job_history
+import output_verifier
+import render_cache
+import resource_governor
+import scratch_staging
+import segment_render
+import segment_scheduler
+
+# Número de vezes que uma parte reprovada na verificação é renderizada novamente
+MAX_VERIFICATION_RETRIES = 2
+
+
+class ParallelJob:
+    """Processa todas as partes de um trabalho com até parallel_count processos FFmpeg simultâneos
+
+    Os eventos são entregues para on_event como dicionários com a chave 'type':
+    'log', 'progress', 'part_done', 'part_failed', 'finished', 'cancelled' ou 'error'.
+    Os eventos 'progress' trazem também 'eta', o tempo restante estimado em segundos (ou None),
+    e 'processed', os segundos de vídeo já processados. Para métricas (metrics_exporter) também são
+    emitidos 'planned' (número de partes), 'render_started' e 'render_finished' (uma vez por processo
+    FFmpeg, com a vaga, o resultado e o fps médio).
+    """
+
+    def __init__(self, job, on_event=None, slot_pool=None):
+        self.job = job
+        self.on_event = on_event or (lambda event: None)
+        # Governador opcional compartilhado entre trabalhos (resource_governor.ResourceGovernor):
+        # limita o total de processos FFmpeg e divide as threads entre eles.
+        # Sem ele, o trabalho cria o seu próprio governador com parallel_count vagas
+        self.slot_pool = slot_pool
+        self.is_running = True
+        self.total_duration = 0
+        self.planned_duration = 0
+        self.segments = []
+        self.parts_completed = 0
+        self.parts_failed = 0
+        self.part_progress = {}  # part_number -> segundos já processados
+        self.lock = threading.Lock()
+        self.verifier = None
+        self.processes = {}  # part_number -> Popen do FFmpeg em execução
+        self.stager = None  # Área temporária local (opção 'scratch_dir' do trabalho)
+        self.render_cache = None  # Cache de partes renderizadas (opção 'render_cache' do trabalho)
+        self.render_job = job  # Trabalho com os caminhos usados na renderização (locais, com a área temporária)
+        self.recorder = None  # Histórico do trabalho e previsão do tempo restante (opção 'record_history')
+        self.part_stats = {}  # part_number -> fps e velocidade médios informados pelo FFmpeg
+        self.executor = None  # Threads de codificação (parallel_count)
+        self.pending_tasks = 0  # Renderizações e verificações agendadas e ainda não concluídas
+        self.tasks_done = threading.Condition(self.lock)
+
+    def emit(self, event_type, **data):
+        event = {'type': event_type, 'time': time.time()}
+        event.update(data)
+        self.on_event(event)
+
+    def log(self, message):
+        self.emit('log', message=message)
+
+    def run(self):
+        remuxed = None
+        try:
+            for key, label in (('input_file', "entrada"), ('image_file', "imagem"), ('selo_file', "selo")):
+                if not os.path.isfile(self.job[key]):
+                    self.emit('error', message=f"Arquivo de {label} não encontrado: {self.job[key]}")
+                    return False
+
+            # Entrada sem índice de busca: reempacotada uma vez e lida por todas as partes
+            remuxed = input_remux.prepare_input(self.job, log=self.log, should_stop=lambda: not self.is_running)
+            if not self.is_running:
+                self.emit('cancelled', message="Processamento cancelado.")
+                return False
+            base_job = dict(self.job, input_file=remuxed) if remuxed else self.job
+
+            self.total_duration = segment_render.get_video_duration(base_job['input_file'])
+            if self.total_duration <= 0:
+                self.emit('error', message="Não foi possível obter a duração do vídeo.")
+                return False
+
+            self.segments = cut_planner.plan_segments(self.job, self.total_duration, log=self.log)
+            if not self.segments:
+                self.emit('error', message="Não foi possível dividir o vídeo em segmentos.")
+                return False
+
+            self.log(f"Vídeo dividido em {len(self.segments)} segmentos para processamento paralelo.")
+            # Análise do reenquadramento feita uma única vez, antes de as partes começarem
+            auto_reframe.prepare_reframe(base_job, segment_render.get_video_resolution(base_job['input_file'])
+                                         or segment_render.DEFAULT_RESOLUTION, log=self.log)
+            # Qualidade ajustada à entrada por amostras codificadas, antes de as partes começarem
+            tuned = bitrate_optimizer.prepare_quality(base_job, log=self.log, should_stop=lambda: not self.is_running)
+            if not self.is_running:
+                self.emit('cancelled', message="Processamento cancelado.")
+                return False
+            if tuned:
+                self.job = dict(self.job, tuned_quality=tuned)
+                base_job = dict(base_job, tuned_quality=tuned)
+
+            proxy = self.job.get('proxy')
+            if proxy and proxy.get('parts'):
+                # Prévia de apenas algumas partes do plano
+                selected = set(proxy['parts'])
+                self.segments = [segment for segment in self.segments if segment['part_number'] in selected]
+                self.log(f"Prévia de {len(self.segments)} partes selecionadas.")
+                if not self.segments:
+                    self.emit('error', message="Nenhuma das partes selecionadas existe no plano.")
+                    return False
+            # Progresso calculado sobre a duração das partes que serão realmente processadas
+            self.planned_duration = sum(segment['duration'] for segment in self.segments)
+            self.emit('planned', parts=len(self.segments), planned_duration=self.planned_duration)
+            eta = None
+            if self.job.get('record_history', True):
+                self.recorder = job_history.JobRecorder(self.job)
+                eta = self.recorder.start(self.planned_duration, len(self.segments))
+                self.log(self.recorder.describe_prediction())
+            self.emit('progress', value=0.0, eta=eta, processed=0.0)
+
+            # Com pools de codificadores, o número de processos é a soma das vagas dos pools
+            parallel_count = resource_governor.get_slot_count(self.job, max(1, int(self.job.get('parallel_count', 2))))
+            if self.slot_pool is None:
+                self.slot_pool = resource_governor.create_governor(self.job, min(parallel_count, len(self.segments)))
+                self.log(f"Recursos: {self.slot_pool.describe()}")
+            scratch_dir = scratch_staging.resolve_scratch_dir(self.job.get('scratch_dir'))
+            if scratch_dir:
+                max_movers = self.job.get('max_movers', scratch_staging.DEFAULT_MAX_MOVERS)
+                self.stager = scratch_staging.ScratchStager(scratch_dir, max_movers, log=self.log)
+                # A entrada reempacotada já está no disco local
+                self.render_job = self.stager.stage_job(base_job, prefetch=remuxed is None)
+                self.log(f"Usando a área temporária local {self.stager.work_dir}")
+            else:
+                self.render_job = base_job
+            self.render_cache = render_cache.create_render_cache(self.job, log=self.log)
+            if self.render_cache is not None:
+                self.log(f"Usando o cache de renderização em {self.render_cache.cache_dir}")
+
+            # O executor entrega as partes às vagas na ordem de submissão
+            ordered, strategy = segment_scheduler.order_segments(
+                self.segments, self.job.get('schedule') or "auto", min(parallel_count, len(self.segments)))
+            self.log(segment_scheduler.describe_order(ordered, strategy, min(parallel_count, len(self.segments)),
+                                                      plan_segments=self.segments))
+
+            self.verifier = output_verifier.OutputVerifier(max_workers=2)
+            self.executor = ThreadPoolExecutor(max_workers=parallel_count)
+            try:
+                for segment in ordered:
+                    self._submit(self._process_segment, segment)
+                # Uma verificação reprovada agenda uma nova renderização, então o trabalho só
+                # termina quando não resta renderização nem verificação pendente
+                with self.tasks_done:
+                    while self.pending_tasks:
+                        self.tasks_done.wait()
+            finally:
+                self.executor.shutdown()
+                self.verifier.shutdown()
+                if self.stager is not None:
+                    # Aguardar as últimas partes chegarem à pasta de saída
+                    self.stager.close(wait=self.is_running)
+
+            if not self.is_running:
+                self._finish_history("cancelled")
+                self.emit('cancelled', message="Processo cancelado pelo usuário.")
+                return False
+
+            for line in self.verifier.report_lines():
+                self.log(line)
+            if hls_packaging.get_packaging(self.job):
+                index_file = segment_render.write_master_playlists(self.job, self.segments)
+                self.log(f"Playlist mestre gravada na pasta de cada parte; índice do trabalho em {index_file}")
+            self._finish_history("finished" if self.parts_failed == 0 else "failed")
+            self.emit('progress', value=100.0, eta=0.0, processed=self.planned_duration)
+            self.emit('finished', message=f"Processamento concluído! {self.parts_completed} vídeos gerados, {self.parts_failed} com erro.",
+                      parts_completed=self.parts_completed, parts_failed=self.parts_failed,
+                      verification_failures=self.verifier.failures())
+            return self.parts_failed == 0
+        except Exception as e:
+            traceback.print_exc()
+            self._finish_history("failed")
+            self.emit('error', message=f"Erro durante o processamento: {str(e)}")
+            return False
+        finally:
+            # Só depois de todas as partes o arquivo reempacotado pode ser removido
+            if remuxed:
+                input_remux.release_input(remuxed)
+
+    def _finish_history(self, state):
+        if self.recorder is not None:
+            self.recorder.finish(state)
+
+    def _task_started(self):
+        with self.lock:
+            self.pending_tasks += 1
+
+    def _task_done(self):
+        with self.tasks_done:
+            self.pending_tasks -= 1
+            self.tasks_done.notify_all()
+
+    def _submit(self, fn, *args):
+        """Agenda fn nas threads de codificação, contando-a como tarefa pendente do trabalho"""
+        def task():
+            try:
+                fn(*args)
+            except Exception:
+                traceback.print_exc()
+            finally:
+                self._task_done()
+        self._task_started()
+        self.executor.submit(task)
+
+    def _process_segment(self, segment):
+        part_number = segment['part_number']
+        output_directory = segment_render.get_job_output_directory(self.job)
+        if self.job.get('proxy'):
+            output_directory = os.path.join(output_directory, segment_render.PROXY_SUBFOLDER)
+        output_file = segment_render.get_part_output_file(self.job, output_directory, part_number)
+        packaged = hls_packaging.get_packaging(self.job) is not None
+        # Com a área temporária, a parte é gravada e verificada no disco local e depois transferida
+        if self.stager is None:
+            render_file = output_file
+        elif packaged:
+            # Parte empacotada: a pasta da parte inteira é gravada localmente
+            part_directory = self.stager.local_output(hls_packaging.get_part_directory(output_file))
+            render_file = os.path.join(part_directory, os.path.basename(output_file))
+        else:
+            render_file = self.stager.local_output(output_file)
+
+        cache_keys = None
+        if self.render_cache is not None:
+            try:
+                cache_keys = self.render_cache.get_keys(self.job, segment)
+            except OSError as e:
+                self.log(f"Aviso: parte {part_number} sem cache de renderização: {str(e)}")
+
+        part = {
+            'segment': segment,
+            'output_file': output_file,
+            'render_file': render_file,
+            'packaged': packaged,
+            # Versões adicionais da parte (opção 'renditions'), geradas no mesmo processo FFmpeg
+            'extra_files': segment_render.get_output_files(render_file, self.job)[1:],
+            # Saídas auxiliares (miniatura, clipe curto, forma de onda), geradas no mesmo processo FFmpeg
+            'side_files': list(segment_render.get_side_output_files(render_file, self.job).values()),
+            'cache_keys': cache_keys,
+            'from_cache': False,
+        }
+        if self.recorder is not None:
+            # Tempo de relógio da parte contado a partir da primeira tentativa
+            self.recorder.part_started(part_number)
+        self._render_attempt(part, 0)
+
+    def _render_attempt(self, part, attempt):
+        """Renderiza a parte e agenda a sua verificação; a thread de codificação volta logo para a
+        próxima parte, e o resultado da verificação é tratado em _on_verified"""
+        if not self.is_running:
+            return
+        segment = part['segment']
+        render_file = part['render_file']
+        cache_keys = part['cache_keys']
+        # Parte idêntica já renderizada: reaproveitada sem ocupar uma vaga de codificação
+        part['from_cache'] = attempt == 0 and cache_keys is not None and self.render_cache.fetch(cache_keys, render_file)
+        if part['from_cache']:
+            self.log(f"Parte {segment['part_number']} reaproveitada do cache de renderização.")
+        # Nas novas tentativas a parte é codificada inteira, sem o corpo do cache
+        elif not self._render_with_fallback(segment, render_file, cache_keys, use_cached_body=attempt == 0):
+            self._complete_part(part, False)
+            return
+
+        def on_verified(verified_segment, verified_file, errors):
+            try:
+                self._on_verified(part, attempt, errors)
+            except Exception:
+                traceback.print_exc()
+            finally:
+                self._task_done()
+
+        # A verificação roda no pool do verificador, liberando a vaga de codificação
+        self._task_started()
+        self.verifier.submit(segment, render_file, on_verified, extra_files=part['extra_files'])
+
+    def _on_verified(self, part, attempt, errors):
+        """Chamado no pool do verificador: conclui a parte ou agenda uma nova renderização"""
+        segment = part['segment']
+        part_number = segment['part_number']
+        errors = errors + segment_render.check_side_outputs(part['render_file'], self.job)
+        if not errors:
+            self._complete_part(part, True)
+            return
+        self.log(f"Parte {part_number} falhou na verificação: {'; '.join(errors)}")
+        if attempt >= MAX_VERIFICATION_RETRIES:
+            self._complete_part(part, False)
+            return
+        if not self.is_running:
+            return
+        self.log(f"Renderizando a parte {part_number} novamente (nova tentativa {attempt + 1} de {MAX_VERIFICATION_RETRIES})")
+        segment_render.remove_part_outputs(part['render_file'], self.job)
+        self._submit(self._render_attempt, part, attempt + 1)
+
+    def _complete_part(self, part, ok):
+        """Guarda a parte válida no cache, transfere-a para a pasta de saída e a conta como concluída"""
+        segment = part['segment']
+        render_file = part['render_file']
+        output_file = part['output_file']
+        extra_files = part['extra_files']
+        side_files = part['side_files']
+        if ok and part['cache_keys'] is not None and not part['from_cache']:
+            self.render_cache.store(part['cache_keys'], render_file)
+
+        if ok and self.stager is not None:
+            # A transferência roda no pool do stager; a parte só conta como concluída quando
+            # todos os seus arquivos chegarem à pasta de saída
+            if part['packaged']:
+                transfers = [(hls_packaging.get_part_directory(render_file), hls_packaging.get_part_directory(output_file))]
+            else:
+                transfers = list(zip([render_file] + extra_files + side_files,
+                                     segment_render.get_output_files(output_file, self.job) +
+                                     list(segment_render.get_side_output_files(output_file, self.job).values())))
+            results = []
+
+            def on_moved(moved):
+                with self.lock:
+                    results.append(moved)
+                    done = len(results) == len(transfers)
+                if done:
+                    self._finish_segment(segment, all(results), [final_file for _, final_file in transfers])
+
+            for local_file, final_file in transfers:
+                self.stager.commit(local_file, final_file, on_moved)
+            return
+        if part['packaged']:
+            self._finish_segment(segment, ok, [hls_packaging.get_part_directory(render_file)])
+        else:
+            self._finish_segment(segment, ok, [render_file] + extra_files + side_files)
+
+    def _render_with_fallback(self, segment, render_file, cache_keys=None, use_cached_body=True):
+        """Renderiza a parte em uma vaga livre; com pools de codificadores, uma falha é repetida
+        em uma vaga de outro pool até não restar pool que ainda não tenha sido tentado"""
+        failed_pools = set()
+        while True:
+            slot = self.slot_pool.acquire(exclude_pools=failed_pools)
+            if slot is None:
+                return False
+            try:
+                ok = self._render_segment(segment, render_file, slot, cache_keys, use_cached_body)
+            finally:
+                self.slot_pool.release(slot)
+            if ok or not self.is_running or slot.pool is None:
+                return ok
+            failed_pools.add(slot.pool.name)
+            if not self.slot_pool.has_pool(failed_pools):
+                return False
+            self.log(f"Parte {segment['part_number']}: falha no codificador {slot.pool.name} ({slot.pool.encoder}); "
+                     f"renderizando novamente em outro pool.")
+
+    def _finish_segment(self, segment, ok, output_files=()):
+        part_number = segment['part_number']
+        if self.recorder is not None:
+            with self.lock:
+                processed = segment['duration'] if ok else self.part_progress.get(part_number, 0.0)
+                stats = self.part_stats.pop(part_number, None)
+            self.recorder.part_finished(segment, processed, ok, output_files if ok else (), stats)
+        with self.lock:
+            if ok:
+                self.parts_completed += 1
+                self.part_progress[part_number] = segment['duration']
+            else:
+                self.parts_failed += 1
+                self.part_progress.pop(part_number, None)
+        self.emit('part_done' if ok else 'part_failed', part_number=part_number)
+        self._emit_progress()
+
+    def _render_segment(self, segment, output_file, slot=None, cache_keys=None, use_cached_body=True):
+        part_number = segment['part_number']
+
+        def on_progress(seconds):
+            with self.lock:
+                self.part_progress[part_number] = min(seconds, segment['duration'])
+            self._emit_progress()
+
+        def on_process(process):
+            with self.lock:
+                if process is None:
+                    self.processes.pop(part_number, None)
+                else:
+                    self.processes[part_number] = process
+            if process is not None and not self.is_running:
+                # Cancelado enquanto o processo iniciava
+                ffmpeg_utils.kill_process_trees([process])
+
+        stats = {}
+        with self.lock:
+            self.part_stats[part_number] = stats
+        slot_number = slot.index + 1 if slot else None
+        encoder_pool = slot.pool.name if slot and slot.pool else None
+        started_at = time.time()
+        self.emit('render_started', part_number=part_number, slot=slot_number, pool=encoder_pool)
+        ok = False
+        try:
+            # Com a área temporária, cada parte lê a cópia local da entrada se a pré-carga já terminou
+            job = dict(self.render_job, input_file=self.stager.input_path()) if self.stager else self.render_job
+
+            def render(render_segment, render_file, force_keyframe):
+                return segment_render.render_segment(job, render_segment, output_file=render_file, log=self.log,
+                                                     progress=on_progress, should_stop=lambda: not self.is_running,
+                                                     slot=slot, on_process=on_process, stats=stats,
+                                                     force_keyframe=force_keyframe)
+
+            if cache_keys is not None:
+                ok = self.render_cache.render(cache_keys, segment, output_file, render, use_body=use_cached_body,
+                                              should_stop=lambda: not self.is_running)
+            else:
+                ok = render(segment, output_file, None)
+        except Exception as e:
+            self.log(f"Erro ao processar parte {part_number}: {str(e)}")
+        self.emit('render_finished', part_number=part_number, slot=slot_number, pool=encoder_pool, ok=ok,
+                  cancelled=not self.is_running, wall_time=time.time() - started_at,
+                  fps=stats.get('fps'), speed=stats.get('speed'))
+        return ok
+
+    def _emit_progress(self):
+        with self.lock:
+            processed = sum(self.part_progress.values())
+        value = min((processed / self.planned_duration) * 100, 99.9)
+        eta = self.recorder.eta(processed) if self.recorder is not None else None
+        self.emit('progress', value=value, eta=eta, processed=processed)
+
+    def stop(self):
+        """Cancela o trabalho: os processos FFmpeg em andamento (e seus filhos) são encerrados
+        imediatamente e as partes incompletas são removidas pelas threads de cada parte"""
+        self.is_running = False
+        with self.lock:
+            processes = list(self.processes.values())
+        ffmpeg_utils.kill_process_trees(processes)
@@ -0,0 +1,329 @@
+"""Histórico local de trabalhos e partes (SQLite) e previsão do tempo restante
+
+Cada trabalho e cada parte processada são gravados em ~/.video_cutter/historico.sqlite3 com
+a duração planejada e a realmente processada, o tempo de relógio, fps e velocidade médios
+informados pelo FFmpeg, codificador e preset, bytes gravados e informações da máquina.
+
+A vazão (segundos de vídeo por segundo de relógio) dos trabalhos anteriores com o mesmo perfil
+(máquina, resolução, perfil de velocidade, codificador, preset e número de processos paralelos)
+fornece a estimativa inicial do tempo restante. Durante o trabalho, a estimativa é refinada
+com a vazão observada, que ganha peso à medida que o trabalho avança.
+
+Uso:
+    recorder = JobRecorder(job)
+    eta = recorder.start(planned_duration, len(segments))
+    recorder.part_started(part_number)
+    recorder.part_finished(segment, processed_seconds, ok, output_files, stats)
+    eta = recorder.eta(processed_seconds)
+    recorder.finish("finished")
+
+Relatório da vazão por máquina:
+    python job_history.py report [--weeks 8]
+"""
+import os
+import platform
+import sqlite3
+import threading
+import time
+
+import ffmpeg_utils
+import segment_render
+
+HISTORY_FILE = os.path.join(os.path.expanduser("~"), ".video_cutter", "historico.sqlite3")
+# Número de trabalhos recentes considerados na previsão
+HISTORY_WINDOW = 20
+# Campos do perfil do trabalho, do mais específico ao mais genérico: sem histórico exato,
+# a previsão usa trabalhos que coincidem em menos campos
+PROFILE_FIELDS = ('host', 'resolution', 'speed_profile', 'encoder', 'preset', 'parallel_count')
+PROFILE_FALLBACKS = (
+    PROFILE_FIELDS,
+    ('host', 'resolution', 'speed_profile', 'encoder', 'preset'),
+    ('host', 'speed_profile', 'encoder'),
+    ('host',),
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    host TEXT, cpu_count INTEGER, platform TEXT,
+    input_file TEXT, resolution TEXT, speed_profile TEXT, encoder TEXT, preset TEXT,
+    parallel_count INTEGER, part_count INTEGER,
+    planned_duration REAL, actual_duration REAL,
+    started_at REAL, finished_at REAL, wall_time REAL,
+    parts_done INTEGER DEFAULT 0, parts_failed INTEGER DEFAULT 0,
+    output_bytes INTEGER DEFAULT 0, predicted_wall_time REAL, state TEXT
+);
+CREATE TABLE IF NOT EXISTS parts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id INTEGER REFERENCES jobs(id), part_number INTEGER,
+    planned_duration REAL, actual_duration REAL,
+    started_at REAL, wall_time REAL, fps REAL, speed REAL,
+    output_bytes INTEGER, ok INTEGER
+);
+CREATE INDEX IF NOT EXISTS jobs_profile ON jobs (host, resolution, speed_profile, encoder, preset, parallel_count);
+"""
+
+
+def get_host_info():
+    """Identificação da máquina gravada em cada trabalho"""
+    return {'host': platform.node() or "desconhecido", 'cpu_count': os.cpu_count() or 1,
+            'platform': platform.platform()}
+
+
+def get_encoder_preset(encoder_params):
+    """Valor de -preset (ou -quality, no AMF) nos parâmetros do codificador"""
+    for option in ("-preset", "-quality"):
+        if option in encoder_params:
+            index = encoder_params.index(option)
+            if index + 1 < len(encoder_params):
+                return encoder_params[index + 1]
+    return ""
+
+
+def get_job_profile(job):
+    """Perfil do trabalho usado para comparar com o histórico"""
+    input_res = segment_render.get_video_resolution(job['input_file'])
+    if job.get('proxy'):
+        speed_profile = "proxy"
+        encoder_name, encoder_params = "libx264", segment_render.get_proxy_encoder_params()
+    else:
+        speed_profile = job.get('speed_profile', "balanced")
+        encoder_name, encoder_params = ffmpeg_utils.get_video_encoder(speed_profile, encoder=job.get('encoder'))
+    profile = get_host_info()
+    profile.update({
+        'resolution': f"{input_res[0]}x{input_res[1]}" if input_res else "",
+        'speed_profile': speed_profile,
+        'encoder': encoder_name,
+        'preset': get_encoder_preset(encoder_params),
+        'parallel_count': max(1, int(job.get('parallel_count', 2))),
+    })
+    return profile
+
+
+def format_duration(seconds):
+    seconds = int(round(seconds))
+    hours, remainder = divmod(seconds, 3600)
+    minutes, seconds = divmod(remainder, 60)
+    return f"{hours}h{minutes:02d}m{seconds:02d}s" if hours else f"{minutes}m{seconds:02d}s"
+
+
+class JobHistory:
+    """Acesso ao banco do histórico; cada operação usa a sua própria conexão (seguro entre threads)"""
+
+    def __init__(self, path=None):
+        self.path = path or HISTORY_FILE
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=10)
+
+    def _execute(self, sql, params=()):
+        conn = self._connect()
+        try:
+            with conn:
+                cursor = conn.execute(sql, params)
+                return cursor.lastrowid, cursor.fetchall()
+        finally:
+            conn.close()
+
+    def add_job(self, profile, input_file, part_count, planned_duration, predicted_wall_time):
+        row_id, _ = self._execute(
+            "INSERT INTO jobs (host, cpu_count, platform, input_file, resolution, speed_profile, encoder, preset, "
+            "parallel_count, part_count, planned_duration, actual_duration, started_at, predicted_wall_time, state) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 0, ?, ?, 'running')",
+            (profile['host'], profile['cpu_count'], profile['platform'], input_file, profile['resolution'],
+             profile['speed_profile'], profile['encoder'], profile['preset'], profile['parallel_count'],
+             part_count, planned_duration, time.time(), predicted_wall_time))
+        return row_id
+
+    def add_part(self, job_id, part_number, planned_duration, actual_duration, started_at, wall_time,
+                 fps, speed, output_bytes, ok):
+        self._execute(
+            "INSERT INTO parts (job_id, part_number, planned_duration, actual_duration, started_at, wall_time, "
+            "fps, speed, output_bytes, ok) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (job_id, part_number, planned_duration, actual_duration, started_at, wall_time,
+             fps, speed, output_bytes, int(ok)))
+
+    def finish_job(self, job_id, state):
+        """Fecha o trabalho com os totais das partes gravadas"""
+        finished_at = time.time()
+        self._execute(
+            "UPDATE jobs SET state = ?, finished_at = ?, wall_time = ? - started_at, "
+            "actual_duration = (SELECT COALESCE(SUM(actual_duration), 0) FROM parts WHERE job_id = jobs.id AND ok = 1), "
+            "parts_done = (SELECT COUNT(*) FROM parts WHERE job_id = jobs.id AND ok = 1), "
+            "parts_failed = (SELECT COUNT(*) FROM parts WHERE job_id = jobs.id AND ok = 0), "
+            "output_bytes = (SELECT COALESCE(SUM(output_bytes), 0) FROM parts WHERE job_id = jobs.id AND ok = 1) "
+            "WHERE id = ?",
+            (state, finished_at, finished_at, job_id))
+
+    def predict_throughput(self, profile):
+        """Vazão esperada (s de vídeo / s de relógio) para o perfil, ou None sem histórico
+
+        Returns:
+            tuple: (vazão, número de trabalhos usados, campos do perfil que coincidiram) ou None
+        """
+        for fields in PROFILE_FALLBACKS:
+            where = " AND ".join(f"{field} = ?" for field in fields)
+            _, rows = self._execute(
+                f"SELECT actual_duration, wall_time FROM jobs WHERE state = 'finished' AND wall_time > 0 "
+                f"AND actual_duration > 0 AND {where} ORDER BY finished_at DESC LIMIT ?",
+                tuple(profile[field] for field in fields) + (HISTORY_WINDOW,))
+            if rows:
+                media_seconds = sum(row[0] for row in rows)
+                wall_seconds = sum(row[1] for row in rows)
+                return media_seconds / wall_seconds, len(rows), fields
+        return None
+
+    def throughput_report(self, weeks=8):
+        """Vazão por máquina, codificador e semana (mais recentes primeiro)"""
+        since = time.time() - weeks * 7 * 86400
+        _, rows = self._execute(
+            "SELECT host, strftime('%Y-%W', started_at, 'unixepoch', 'localtime') AS week, encoder, preset, "
+            "resolution, parallel_count, COUNT(*), SUM(actual_duration) / SUM(wall_time), AVG(part_stats.fps) "
+            "FROM jobs LEFT JOIN (SELECT job_id, AVG(fps) AS fps FROM parts WHERE ok = 1 GROUP BY job_id) "
+            "AS part_stats ON part_stats.job_id = jobs.id "
+            "WHERE state = 'finished' AND wall_time > 0 AND started_at >= ? "
+            "GROUP BY host, week, encoder, preset, resolution, parallel_count "
+            "ORDER BY host, week DESC, encoder",
+            (since,))
+        return rows
+
+
+class JobRecorder:
+    """Grava um trabalho no histórico e estima o tempo restante
+
+    Falhas do banco (disco cheio, banco bloqueado) apenas desativam o histórico do trabalho.
+    """
+
+    def __init__(self, job, history=None):
+        self.job = job
+        self.history = history
+        self.job_id = None
+        self.profile = None
+        self.prior_throughput = None
+        self.planned_duration = 0
+        self.started_at = None
+        self.part_started_at = {}
+        self.lock = threading.Lock()
+
+    def _warn(self, e):
+        print(f"Aviso: histórico de trabalhos desativado: {str(e)}")
+        self.history = None
+
+    def start(self, planned_duration, part_count):
+        """Registra o início do trabalho e retorna a estimativa inicial (s) ou None sem histórico"""
+        self.planned_duration = planned_duration
+        self.started_at = time.time()
+        try:
+            if self.history is None:
+                self.history = JobHistory()
+            self.profile = get_job_profile(self.job)
+            prediction = self.history.predict_throughput(self.profile)
+            if prediction:
+                self.prior_throughput = prediction[0]
+            self.job_id = self.history.add_job(self.profile, self.job['input_file'], part_count, planned_duration,
+                                               self.eta(0.0))
+        except (sqlite3.Error, OSError) as e:
+            self._warn(e)
+        return self.eta(0.0)
+
+    def describe_prediction(self):
+        if self.prior_throughput is None:
+            return "Sem histórico para este perfil; o tempo restante será estimado durante o processamento."
+        eta = self.planned_duration / self.prior_throughput
+        return (f"Tempo estimado pelo histórico: {format_duration(eta)} "
+                f"({self.prior_throughput:.2f} s de vídeo/s em {self.profile['host']})")
+
+    def part_started(self, part_number):
+        with self.lock:
+            self.part_started_at[part_number] = time.time()
+
+    def part_finished(self, segment, processed_seconds, ok, output_files=(), stats=None):
+        """Grava uma parte concluída ou com erro
+
+        Args:
+            segment (dict): Segmento planejado
+            processed_seconds (float): Tempo de vídeo realmente processado
+            output_files (list): Arquivos ou pastas gerados pela parte (para somar os bytes)
+            stats (dict): 'fps' e 'speed' médios informados pelo FFmpeg
+        """
+        now = time.time()
+        with self.lock:
+            started_at = self.part_started_at.pop(segment['part_number'], now)
+        if self.history is None or self.job_id is None:
+            return
+        stats = stats or {}
+        try:
+            self.history.add_part(self.job_id, segment['part_number'], segment['duration'], processed_seconds,
+                                  started_at, now - started_at, stats.get('fps'), stats.get('speed'),
+                                  sum(_path_size(path) for path in output_files), ok)
+        except sqlite3.Error as e:
+            self._warn(e)
+
+    def eta(self, processed_seconds):
+        """Tempo restante estimado (s), ou None enquanto não houver base para a estimativa
+
+        A vazão do histórico é combinada com a vazão observada neste trabalho; o peso da
+        observada cresce com a fração já processada.
+        """
+        if self.started_at is None or self.planned_duration <= 0:
+            return None
+        elapsed = time.time() - self.started_at
+        fraction = min(processed_seconds / self.planned_duration, 1.0)
+        observed = processed_seconds / elapsed if processed_seconds > 0 and elapsed > 0 else None
+        if observed is not None and self.prior_throughput is not None:
+            throughput = (1.0 - fraction) * self.prior_throughput + fraction * observed
+        else:
+            throughput = observed if observed is not None else self.prior_throughput
+        if not throughput:
+            return None
+        return max(self.planned_duration - processed_seconds, 0.0) / throughput
+
+    def finish(self, state):
+        if self.history is None or self.job_id is None:
+            return
+        try:
+            self.history.finish_job(self.job_id, state)
+        except sqlite3.Error as e:
+            self._warn(e)
+
+
+def _path_size(path):
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(root, name))
+                   for root, _, names in os.walk(path) for name in names)
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Histórico de trabalhos do Video Cutter")
+    parser.add_argument("--db", default=HISTORY_FILE)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    report_parser = subparsers.add_parser("report", help="Vazão por máquina e semana")
+    report_parser.add_argument("--weeks", type=int, default=8)
+    args = parser.parse_args(argv)
+
+    rows = JobHistory(args.db).throughput_report(args.weeks)
+    if not rows:
+        print("Nenhum trabalho concluído no período.")
+        return
+    current_host = None
+    for host, week, encoder, preset, resolution, parallel_count, jobs, throughput, fps in rows:
+        if host != current_host:
+            current_host = host
+            print(f"\n{host}")
+            print(f"  {'semana':<8} {'codificador':<12} {'preset':<8} {'resolução':<10} {'par.':>4} "
+                  f"{'trab.':>5} {'vídeo/s':>8} {'fps':>7}")
+        print(f"  {week:<8} {encoder:<12} {preset:<8} {resolution:<10} {parallel_count:>4} {jobs:>5} "
+              f"{throughput:>8.2f} {fps or 0:>7.1f}")
+
+
+if __name__ == "__main__":
+    main()
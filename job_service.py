@@ -0,0 +1,486 @@
+"""Serviço local de trabalhos via HTTP
+
+Mantém um processo de longa duração que aceita trabalhos em localhost, executa-os em fila
+(um após o outro) com o motor paralelo e transmite o progresso como server-sent events.
+Como o processo continua vivo entre trabalhos, os caches de sondagem (FFprobe) e de
+codificador permanecem carregados, e fechar a interface não interrompe o trabalho.
+
+Endpoints:
+    POST /jobs                  envia um trabalho (JSON) e retorna {"job_id": ...}
+    GET  /jobs                  lista os trabalhos e seus estados
+    GET  /jobs/<id>             detalhes de um trabalho
+    GET  /jobs/<id>/events      eventos do trabalho (text/event-stream)
+    POST /jobs/<id>/cancel      cancela um trabalho na fila ou em execução
+
+Os POST exigem Content-Type application/json e são recusados quando vêm de outra origem (cabeçalho
+Origin de uma página que não é o próprio serviço), para que um site aberto no navegador não possa
+enviar trabalhos. Cada trabalho guarda apenas os últimos MAX_EVENTS eventos.
+
+Uso:
+    python job_service.py serve [--port 8765] [--metrics-port 9464] [--metrics-textfile arquivo.prom]
+    python job_service.py submit --input IN --image CAPA --selo SELO [...]
+    python job_service.py list
+"""
+import argparse
+import collections
+import itertools
+import json
+import os
+import queue
+import sys
+import threading
+import time
+import urllib.request
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import encoder_registry
+import ffmpeg_utils
+import job_history
+import metrics_exporter
+import segment_scheduler
+from job_engine import ParallelJob
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+# Eventos guardados por trabalho; os mais antigos são descartados (clientes anexados depois não os recebem)
+MAX_EVENTS = 2000
+# Hosts aceitos no cabeçalho Origin das requisições POST
+ALLOWED_ORIGIN_HOSTS = ("127.0.0.1", "localhost", "[::1]")
+
+# Valores padrão para campos opcionais de um trabalho (mesmos padrões da interface)
+JOB_DEFAULTS = {
+    'output_prefix': "Prefixo Parte ",
+    'start_index': 1,
+    'min_duration': 90,
+    'max_duration': 130,
+    'output_directory': "",
+    'chroma_color': "0x00d600",
+    'similarity': 0.30,
+    'blend': 0.35,
+    'speed_profile': "balanced",
+    # Codificador (encoder_registry.ENCODERS), ex.: "libx265" ou "libsvtav1"; None = melhor H.264 disponível
+    'encoder': None,
+    # Qualidade ajustada por entrada a partir de amostras (bitrate_optimizer): True (SSIM 0.98), um número
+    # (meta de SSIM) ou {'metric': "ssim"/"psnr"/"vmaf", 'target': ...}; None = valores fixos do perfil
+    'quality_target': None,
+    'parallel_count': 2,
+    'plan_seed': None,
+    # Escolha dos pontos de corte (cut_planner): None/"random", "scene" (mudanças de cena) ou "silence" (pausas do áudio)
+    'cut_planner': None,
+    # Ordem das partes entre as vagas (segment_scheduler.STRATEGIES): "auto", "fifo", "lpt", "first_part" ou "sequential"
+    'schedule': "auto",
+    'proxy': None,
+    # Governador de recursos (resource_governor): orçamento de threads (None = núcleos disponíveis),
+    # afinidade de núcleos por vaga e baixa prioridade
+    'thread_budget': None,
+    'pin_cores': False,
+    'background_priority': False,
+    # Pools de codificadores com limite de processos por codificador e nova tentativa em outro pool
+    # (resource_governor), ex.: [{'name': "nvenc", 'encoder': "h264_nvenc", 'slots': 2}, {'encoder': "libx264", 'slots': 2}]
+    'encoder_pools': None,
+    # Reempacotar entradas sem índice de busca (input_remux): "auto", True (sempre) ou False (nunca)
+    'remux_input': "auto",
+    # Área temporária local (scratch_staging): pasta, "auto" (pasta temporária do sistema) ou None
+    'scratch_dir': None,
+    'max_movers': 2,
+    # Versões adicionais de cada parte geradas no mesmo processo FFmpeg (segment_render.DEFAULT_RENDITIONS)
+    'renditions': None,
+    # Reenquadrar entradas horizontais para a saída vertical (auto_reframe): True ou {'aspect': "9:16"}
+    'reframe': None,
+    # Saídas auxiliares de cada parte no mesmo processo FFmpeg (segment_render.DEFAULT_SIDE_OUTPUTS), ou True
+    'side_outputs': None,
+    # Saída em HLS/CMAF durante a codificação (hls_packaging), ex.: {'format': "hls", 'segment_duration': 4}
+    'packaging': None,
+    # Cache de partes renderizadas (render_cache): pasta, "auto" (~/.video_cutter/render_cache) ou None
+    'render_cache': None,
+    'render_cache_max_gb': 20,
+    # Gravar o trabalho no histórico local (job_history), usado para prever o tempo restante
+    'record_history': True,
+}
+REQUIRED_FIELDS = ('input_file', 'image_file', 'selo_file')
+
+
+class JobRecord:
+    """Estado e histórico de eventos de um trabalho enviado ao serviço"""
+
+    def __init__(self, job_id, job):
+        self.job_id = job_id
+        self.job = job
+        self.state = "queued"  # queued, running, finished, failed, cancelled
+        self.progress = 0.0
+        self.eta = None  # Tempo restante estimado (s)
+        self.events = collections.deque(maxlen=MAX_EVENTS)
+        self.event_count = 0  # Total de eventos recebidos, inclusive os já descartados
+        self.engine = None
+        self.submitted_at = time.time()
+        self.condition = threading.Condition()
+
+    def add_event(self, event):
+        with self.condition:
+            if event['type'] == 'progress':
+                self.progress = event['value']
+                self.eta = event.get('eta')
+            self.events.append(event)
+            self.event_count += 1
+            self.condition.notify_all()
+
+    def events_since(self, index):
+        """Eventos a partir do índice absoluto index (os já descartados são pulados) e o próximo índice
+
+        Deve ser chamada com condition adquirida.
+        """
+        first = self.event_count - len(self.events)
+        return list(itertools.islice(self.events, max(index - first, 0), None)), self.event_count
+
+    def is_closed(self):
+        return self.state in ("finished", "failed", "cancelled")
+
+    def summary(self):
+        return {'job_id': self.job_id, 'state': self.state, 'progress': self.progress, 'eta': self.eta,
+                'submitted_at': self.submitted_at, 'input_file': self.job['input_file'],
+                'output_prefix': self.job['output_prefix']}
+
+
+class JobService:
+    """Fila de trabalhos processados um após o outro por uma única thread
+
+    Com metrics (metrics_exporter.MetricsRegistry), os eventos de todos os trabalhos alimentam as métricas.
+    """
+
+    def __init__(self, metrics=None):
+        self.metrics = metrics
+        self.jobs = {}
+        self.pending = queue.Queue()
+        self.lock = threading.Lock()
+        self.runner = threading.Thread(target=self._run_jobs, daemon=True)
+        self.is_running = True
+
+    def start(self):
+        # Aquecer o cache de codificadores antes do primeiro trabalho
+        for profile in ("fast", "balanced", "quality"):
+            ffmpeg_utils.get_video_encoder(profile)
+        self.runner.start()
+
+    def submit(self, job):
+        if not isinstance(job, dict):
+            raise ValueError("O trabalho deve ser um objeto JSON.")
+        missing = [field for field in REQUIRED_FIELDS if not job.get(field)]
+        if missing:
+            raise ValueError(f"Campos obrigatórios ausentes: {', '.join(missing)}")
+        full_job = dict(JOB_DEFAULTS)
+        full_job.update(job)
+        if full_job['output_prefix'] and not full_job['output_prefix'].endswith(" "):
+            full_job['output_prefix'] += " "
+        if full_job['min_duration'] >= full_job['max_duration']:
+            raise ValueError("A duração mínima deve ser menor que a duração máxima.")
+
+        record = JobRecord(uuid.uuid4().hex[:12], full_job)
+        with self.lock:
+            self.jobs[record.job_id] = record
+        record.add_event({'type': 'log', 'time': time.time(), 'message': "Trabalho adicionado à fila."})
+        self.pending.put(record)
+        return record
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def list(self):
+        with self.lock:
+            return [record.summary() for record in self.jobs.values()]
+
+    def cancel(self, job_id):
+        record = self.get(job_id)
+        if record is None:
+            return False
+        with self.lock:
+            # Com a trava, o trabalho não passa de "queued" para "running" no meio da decisão
+            removed = record.state == "queued"
+            if removed:
+                record.state = "cancelled"
+            engine = record.engine if record.state == "running" else None
+        if removed:
+            record.add_event({'type': 'cancelled', 'time': time.time(), 'message': "Trabalho removido da fila."})
+        elif engine is not None:
+            engine.stop()
+        return True
+
+    def shutdown(self, timeout=10.0):
+        """Cancela os trabalhos na fila e encerra o trabalho em execução (com os seus processos FFmpeg)"""
+        self.is_running = False
+        with self.lock:
+            job_ids = list(self.jobs)
+        for job_id in job_ids:
+            self.cancel(job_id)
+        self.pending.put(None)
+        if self.runner.is_alive():
+            self.runner.join(timeout)
+
+    def _event_handler(self, record):
+        """Função que recebe os eventos do motor: grava no registro e, com métricas, as atualiza"""
+        if self.metrics is None:
+            return record.add_event
+        observe = self.metrics.track_job()
+
+        def record_and_observe(event):
+            observe(event)
+            record.add_event(event)
+        return record_and_observe
+
+    def _run_jobs(self):
+        while True:
+            record = self.pending.get()
+            if record is None or not self.is_running:
+                return
+            # O motor é criado antes de o estado passar a "running": um cancelamento nunca encontra
+            # um trabalho em execução sem motor para parar
+            engine = ParallelJob(record.job, on_event=self._event_handler(record))
+            with self.lock:
+                if record.state != "queued":
+                    continue
+                record.engine = engine
+                record.state = "running"
+            ok = record.engine.run()
+            if not record.engine.is_running:
+                record.state = "cancelled"
+            else:
+                record.state = "finished" if ok else "failed"
+            # Evento final para que os clientes de SSE encerrem a conexão
+            record.add_event({'type': 'state', 'time': time.time(), 'state': record.state})
+
+
+class JobRequestHandler(BaseHTTPRequestHandler):
+    service = None  # Definido por create_server
+
+    def log_message(self, format, *args):
+        print(f"[{time.strftime('%H:%M:%S')}] {self.address_string()} {format % args}")
+
+    def _send_json(self, status, data):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _path_parts(self):
+        return [part for part in self.path.split("?")[0].split("/") if part]
+
+    def do_GET(self):
+        parts = self._path_parts()
+        if parts == ["jobs"]:
+            self._send_json(200, self.service.list())
+        elif len(parts) == 2 and parts[0] == "jobs":
+            record = self.service.get(parts[1])
+            if record is None:
+                self._send_json(404, {'error': "Trabalho não encontrado"})
+            else:
+                data = record.summary()
+                data['job'] = record.job
+                self._send_json(200, data)
+        elif len(parts) == 3 and parts[0] == "jobs" and parts[2] == "events":
+            record = self.service.get(parts[1])
+            if record is None:
+                self._send_json(404, {'error': "Trabalho não encontrado"})
+            else:
+                self._stream_events(record)
+        else:
+            self._send_json(404, {'error': "Endpoint não encontrado"})
+
+    def _reject_post(self):
+        """Motivo para recusar um POST (status, mensagem), ou None
+
+        Navegadores enviam Origin em requisições de outras páginas, e um formulário não consegue
+        enviar application/json sem passar pela verificação de CORS.
+        """
+        origin = self.headers.get("Origin")
+        if origin is not None:
+            allowed = {f"http://{host}:{self.server.server_port}" for host in ALLOWED_ORIGIN_HOSTS}
+            if origin.rstrip("/") not in allowed:
+                return 403, "Origem não permitida"
+        content_type = self.headers.get("Content-Type", "").split(";")[0].strip().lower()
+        if content_type != "application/json":
+            return 415, "Content-Type deve ser application/json"
+        return None
+
+    def do_POST(self):
+        parts = self._path_parts()
+        rejected = self._reject_post()
+        if rejected is not None:
+            self._send_json(rejected[0], {'error': rejected[1]})
+        elif parts == ["jobs"]:
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                job = json.loads(self.rfile.read(length) or b"{}")
+                record = self.service.submit(job)
+                self._send_json(201, {'job_id': record.job_id})
+            except (ValueError, TypeError) as e:
+                self._send_json(400, {'error': str(e)})
+        elif len(parts) == 3 and parts[0] == "jobs" and parts[2] == "cancel":
+            if self.service.cancel(parts[1]):
+                self._send_json(200, {'job_id': parts[1], 'cancelled': True})
+            else:
+                self._send_json(404, {'error': "Trabalho não encontrado"})
+        else:
+            self._send_json(404, {'error': "Endpoint não encontrado"})
+
+    def _stream_events(self, record):
+        """Envia o histórico de eventos e depois os novos eventos até o trabalho terminar"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+
+        index = 0
+        try:
+            while True:
+                with record.condition:
+                    while index >= record.event_count and not record.is_closed():
+                        # Timeout para enviar comentários de keep-alive periodicamente
+                        if not record.condition.wait(timeout=15):
+                            break
+                    events, index = record.events_since(index)
+                    closed = record.is_closed()
+
+                if not events and not closed:
+                    self.wfile.write(b": keep-alive\n\n")
+                for event in events:
+                    self.wfile.write(f"event: {event['type']}\ndata: {json.dumps(event)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+                if closed and index >= record.event_count:
+                    return
+        except (BrokenPipeError, ConnectionResetError):
+            # O cliente se desanexou; o trabalho continua em execução
+            return
+
+
+def create_server(host=DEFAULT_HOST, port=DEFAULT_PORT, service=None):
+    service = service or JobService()
+    handler = type("BoundJobRequestHandler", (JobRequestHandler,), {'service': service})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server, service
+
+
+# Funções de cliente usadas pela interface gráfica e por scripts
+
+def _request(method, path, data=None, host=DEFAULT_HOST, port=DEFAULT_PORT, timeout=10):
+    body = json.dumps(data).encode("utf-8") if data is not None else None
+    request = urllib.request.Request(f"http://{host}:{port}{path}", data=body, method=method,
+                                     headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read().decode("utf-8"))
+
+
+def is_service_running(host=DEFAULT_HOST, port=DEFAULT_PORT):
+    try:
+        _request("GET", "/jobs", host=host, port=port, timeout=1)
+        return True
+    except OSError:
+        return False
+
+
+def submit_job(job, host=DEFAULT_HOST, port=DEFAULT_PORT):
+    return _request("POST", "/jobs", job, host, port)['job_id']
+
+
+def list_jobs(host=DEFAULT_HOST, port=DEFAULT_PORT):
+    return _request("GET", "/jobs", host=host, port=port)
+
+
+def cancel_job(job_id, host=DEFAULT_HOST, port=DEFAULT_PORT):
+    return _request("POST", f"/jobs/{job_id}/cancel", {}, host, port)
+
+
+def iter_events(job_id, host=DEFAULT_HOST, port=DEFAULT_PORT, should_stop=None):
+    """Lê os eventos de um trabalho (SSE), retornando cada evento como dicionário"""
+    request = urllib.request.Request(f"http://{host}:{port}/jobs/{job_id}/events")
+    with urllib.request.urlopen(request, timeout=60) as response:
+        for raw_line in response:
+            if should_stop and should_stop():
+                return
+            line = raw_line.decode("utf-8").strip()
+            if line.startswith("data: "):
+                yield json.loads(line[len("data: "):])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serviço local de trabalhos do Video Cutter")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = subparsers.add_parser("serve", help="Inicia o serviço")
+    serve_parser.add_argument("--metrics-port", type=int, help="Expõe as métricas do Prometheus em localhost nesta porta")
+    serve_parser.add_argument("--metrics-textfile", help="Arquivo .prom para o textfile collector do node_exporter")
+
+    submit_parser = subparsers.add_parser("submit", help="Envia um trabalho para o serviço")
+    submit_parser.add_argument("--input", required=True)
+    submit_parser.add_argument("--image", required=True)
+    submit_parser.add_argument("--selo", required=True)
+    submit_parser.add_argument("--prefix", default=JOB_DEFAULTS['output_prefix'])
+    submit_parser.add_argument("--start-index", type=int, default=JOB_DEFAULTS['start_index'])
+    submit_parser.add_argument("--min-duration", type=int, default=JOB_DEFAULTS['min_duration'])
+    submit_parser.add_argument("--max-duration", type=int, default=JOB_DEFAULTS['max_duration'])
+    submit_parser.add_argument("--output-dir", default="")
+    submit_parser.add_argument("--chroma-color", default=JOB_DEFAULTS['chroma_color'])
+    submit_parser.add_argument("--similarity", type=float, default=JOB_DEFAULTS['similarity'])
+    submit_parser.add_argument("--blend", type=float, default=JOB_DEFAULTS['blend'])
+    submit_parser.add_argument("--speed-profile", choices=["fast", "balanced", "quality"], default=JOB_DEFAULTS['speed_profile'])
+    submit_parser.add_argument("--encoder", choices=sorted(encoder_registry.ENCODERS), default=JOB_DEFAULTS['encoder'])
+    submit_parser.add_argument("--parallel-count", type=int, default=JOB_DEFAULTS['parallel_count'])
+    submit_parser.add_argument("--schedule", choices=segment_scheduler.STRATEGIES, default=JOB_DEFAULTS['schedule'])
+
+    subparsers.add_parser("list", help="Lista os trabalhos do serviço")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        service = None
+        if args.metrics_port or args.metrics_textfile:
+            metrics = metrics_exporter.MetricsRegistry()
+            metrics_exporter.start_exporter(metrics, args.metrics_port, args.metrics_textfile)
+            service = JobService(metrics)
+        server, service = create_server(args.host, args.port, service)
+        service.start()
+        print(f"Serviço de trabalhos escutando em http://{args.host}:{args.port}")
+        ffmpeg_utils.handle_termination_signal()
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            print("Encerrando o serviço e os processos FFmpeg em andamento...")
+        finally:
+            service.shutdown()
+            server.server_close()
+        return 0
+
+    if args.command == "submit":
+        job = {
+            'input_file': os.path.abspath(args.input),
+            'image_file': os.path.abspath(args.image),
+            'selo_file': os.path.abspath(args.selo),
+            'output_prefix': args.prefix,
+            'start_index': args.start_index,
+            'min_duration': args.min_duration,
+            'max_duration': args.max_duration,
+            'output_directory': os.path.abspath(args.output_dir) if args.output_dir else "",
+            'chroma_color': args.chroma_color,
+            'similarity': args.similarity,
+            'blend': args.blend,
+            'speed_profile': args.speed_profile,
+            'encoder': args.encoder,
+            'parallel_count': args.parallel_count,
+            'schedule': args.schedule,
+        }
+        print(submit_job(job, args.host, args.port))
+        return 0
+
+    for summary in list_jobs(args.host, args.port):
+        eta = job_history.format_duration(summary['eta']) if summary.get('eta') is not None else "-"
+        print(f"{summary['job_id']}  {summary['state']:<10} {summary['progress']:5.1f}%  {eta:>9}  {summary['input_file']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,215 @@
+"""Métricas no formato de exposição do Prometheus para os trabalhos em execução
+
+As métricas são calculadas a partir dos eventos do motor (job_engine.ParallelJob), os mesmos
+entregues à interface e ao serviço local. Cada evento custa apenas algumas operações de
+dicionário sob uma trava; o texto de exposição só é montado quando alguém lê as métricas.
+
+Exposição:
+- endpoint HTTP em localhost (GET /metrics), para o Prometheus coletar diretamente;
+- arquivo para o textfile collector do node_exporter, regravado periodicamente.
+
+Uso:
+    registry = MetricsRegistry()
+    start_exporter(registry, port=9464, textfile="/var/lib/node_exporter/video_cutter.prom")
+    job = ParallelJob(job_config, on_event=registry.track_job())
+"""
+import bisect
+import os
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import segment_render
+
+DEFAULT_METRICS_PORT = 9464
+# Intervalo de regravação do arquivo do textfile collector
+TEXTFILE_INTERVAL = 15
+# Janela da taxa instantânea de segundos de vídeo codificados por segundo
+THROUGHPUT_WINDOW = 60
+# Limites do histograma de latência das partes (s), do início da codificação até a parte concluída
+LATENCY_BUCKETS = (10, 30, 60, 120, 300, 600, 1200, 1800, 3600)
+
+
+class JobMetrics:
+    """Estado de um trabalho usado pelo registro; é o on_event do ParallelJob"""
+
+    def __init__(self, registry):
+        self.registry = registry
+        self.queued = 0
+        self.processed = 0.0
+        self.started = set()
+        self.part_started_at = {}
+
+    def __call__(self, event):
+        self.registry.observe(self, event)
+
+
+class MetricsRegistry:
+    """Agrega as métricas de todos os trabalhos do processo"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.jobs = set()
+        self.active_slots = 0
+        self.parts_done = 0
+        self.parts_failed = 0
+        self.media_seconds = 0.0
+        self.throughput_samples = deque()  # (tempo, segundos de vídeo)
+        self.slot_fps = {}  # número da vaga -> fps médio da última parte
+        self.ffmpeg_spawns = 0
+        self.ffmpeg_failures = 0
+        self.latency_counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.latency_sum = 0.0
+
+    def track_job(self):
+        """Retorna o callback de eventos de um novo trabalho"""
+        job_metrics = JobMetrics(self)
+        with self.lock:
+            self.jobs.add(job_metrics)
+        return job_metrics
+
+    def observe(self, job, event):
+        event_type = event['type']
+        now = event.get('time', time.time())
+        with self.lock:
+            if event_type == 'planned':
+                job.queued = event['parts']
+            elif event_type == 'render_started':
+                self.active_slots += 1
+                self.ffmpeg_spawns += 1
+                if event['part_number'] not in job.started:
+                    job.started.add(event['part_number'])
+                    job.queued = max(job.queued - 1, 0)
+                    job.part_started_at[event['part_number']] = now
+            elif event_type == 'render_finished':
+                self.active_slots = max(self.active_slots - 1, 0)
+                if not event['ok'] and not event.get('cancelled'):
+                    self.ffmpeg_failures += 1
+                if event.get('fps') is not None and event.get('slot') is not None:
+                    self.slot_fps[event['slot']] = event['fps']
+            elif event_type == 'progress':
+                processed = event.get('processed')
+                if processed is not None:
+                    # Novas tentativas podem reduzir o total processado; só os avanços contam
+                    delta = processed - job.processed
+                    job.processed = processed
+                    if delta > 0:
+                        self.media_seconds += delta
+                        self.throughput_samples.append((now, delta))
+            elif event_type in ('part_done', 'part_failed'):
+                if event_type == 'part_done':
+                    self.parts_done += 1
+                else:
+                    self.parts_failed += 1
+                started_at = job.part_started_at.pop(event['part_number'], None)
+                if started_at is not None:
+                    latency = now - started_at
+                    self.latency_counts[bisect.bisect_left(LATENCY_BUCKETS, latency)] += 1
+                    self.latency_sum += latency
+            elif event_type in ('finished', 'cancelled', 'error'):
+                self.jobs.discard(job)
+
+    def _throughput(self, now):
+        """Segundos de vídeo codificados por segundo na janela recente"""
+        while self.throughput_samples and self.throughput_samples[0][0] < now - THROUGHPUT_WINDOW:
+            self.throughput_samples.popleft()
+        return sum(seconds for _, seconds in self.throughput_samples) / THROUGHPUT_WINDOW
+
+    def render(self):
+        """Texto no formato de exposição do Prometheus (versão 0.0.4)"""
+        lines = []
+
+        def metric(name, metric_type, help_text, samples):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for labels, value in samples:
+                lines.append(f"{name}{labels} {value}")
+
+        with self.lock:
+            now = time.time()
+            queued = sum(job.queued for job in self.jobs)
+            metric("video_cutter_active_slots", "gauge", "Processos FFmpeg em execução", [("", self.active_slots)])
+            metric("video_cutter_parts_queued", "gauge", "Partes aguardando uma vaga", [("", queued)])
+            metric("video_cutter_parts_done_total", "counter", "Partes concluídas", [("", self.parts_done)])
+            metric("video_cutter_parts_failed_total", "counter", "Partes com erro", [("", self.parts_failed)])
+            metric("video_cutter_media_seconds_total", "counter", "Segundos de vídeo codificados",
+                   [("", round(self.media_seconds, 3))])
+            metric("video_cutter_media_seconds_per_second", "gauge",
+                   f"Segundos de vídeo codificados por segundo (últimos {THROUGHPUT_WINDOW}s)",
+                   [("", round(self._throughput(now), 3))])
+            metric("video_cutter_slot_fps", "gauge", "fps médio da última parte de cada vaga",
+                   [(f'{{slot="{slot}"}}', fps) for slot, fps in sorted(self.slot_fps.items())])
+            metric("video_cutter_ffmpeg_spawns_total", "counter", "Processos FFmpeg iniciados", [("", self.ffmpeg_spawns)])
+            metric("video_cutter_ffmpeg_failures_total", "counter", "Processos FFmpeg que terminaram com erro",
+                   [("", self.ffmpeg_failures)])
+
+            hits, misses = segment_render.probe_cache_stats['hits'], segment_render.probe_cache_stats['misses']
+            metric("video_cutter_probe_cache_requests_total", "counter", "Consultas ao cache do FFprobe",
+                   [('{result="hit"}', hits), ('{result="miss"}', misses)])
+            metric("video_cutter_probe_cache_hit_ratio", "gauge", "Fração das consultas atendidas pelo cache do FFprobe",
+                   [("", round(hits / (hits + misses), 4) if hits + misses else 0)])
+
+            buckets = []
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS + ("+Inf",), self.latency_counts):
+                cumulative += count
+                buckets.append((f'_bucket{{le="{bound}"}}', cumulative))
+            buckets.append(("_sum", round(self.latency_sum, 3)))
+            buckets.append(("_count", cumulative))
+            metric("video_cutter_part_latency_seconds", "histogram",
+                   "Tempo do início da codificação até a parte concluída", buckets)
+        return "\n".join(lines) + "\n"
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    registry = None  # Definido por start_exporter
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def write_textfile(registry, path):
+    """Grava as métricas para o textfile collector (renomeação atômica, nunca um arquivo parcial)"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(registry.render())
+    os.replace(tmp_path, path)
+
+
+def start_exporter(registry, port=None, textfile=None, host="127.0.0.1", interval=TEXTFILE_INTERVAL):
+    """Inicia a exposição das métricas em threads de segundo plano
+
+    Returns:
+        ThreadingHTTPServer: o servidor HTTP, ou None sem porta configurada
+    """
+    server = None
+    if port:
+        handler = type("BoundMetricsRequestHandler", (MetricsRequestHandler,), {'registry': registry})
+        server = ThreadingHTTPServer((host, int(port)), handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        print(f"Métricas disponíveis em http://{host}:{port}/metrics")
+    if textfile:
+        def write_periodically():
+            while True:
+                try:
+                    write_textfile(registry, textfile)
+                except OSError as e:
+                    print(f"Aviso: não foi possível gravar as métricas em {textfile}: {str(e)}")
+                time.sleep(interval)
+
+        threading.Thread(target=write_periodically, daemon=True).start()
+        print(f"Métricas gravadas a cada {interval}s em {textfile}")
+    return server
@@ -0,0 +1,186 @@
+"""Verificação rápida das partes geradas, sem decodificar o arquivo inteiro
+
+Cada parte é verificada com:
+- duração do container comparada com a duração planejada;
+- presença dos fluxos de vídeo e áudio e contagem de pacotes (apenas demux, sem decodificação);
+- presença do átomo moov no MP4 (ou playlist finalizada, nas partes HLS/CMAF);
+- decodificação apenas do primeiro frame.
+
+As verificações rodam em um pool de threads limitado, em paralelo com as codificações em andamento.
+"""
+import json
+import os
+import struct
+from concurrent.futures import ThreadPoolExecutor
+
+import ffmpeg_utils
+
+# Diferença máxima aceita entre a duração do arquivo e a duração planejada (segundos)
+DEFAULT_DURATION_TOLERANCE = 1.0
+# Fração mínima de pacotes de vídeo esperados (duração planejada x taxa de quadros)
+MIN_PACKET_RATIO = 0.95
+
+
+def read_top_level_boxes(path):
+    """Retorna a lista de tipos dos átomos de primeiro nível de um arquivo MP4"""
+    boxes = []
+    file_size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        offset = 0
+        while offset + 8 <= file_size:
+            f.seek(offset)
+            header = f.read(8)
+            if len(header) < 8:
+                break
+            size, box_type = struct.unpack(">I4s", header)
+            if size == 1:
+                # Tamanho de 64 bits logo após o cabeçalho
+                size = struct.unpack(">Q", f.read(8))[0]
+            elif size == 0:
+                # O átomo vai até o final do arquivo
+                size = file_size - offset
+            if size < 8:
+                break
+            boxes.append(box_type.decode("latin-1"))
+            offset += size
+        if offset > file_size:
+            # O último átomo declara um tamanho maior que o arquivo: arquivo truncado
+            boxes.append("<truncado>")
+    return boxes
+
+
+def _parse_rate(rate):
+    try:
+        num, den = rate.split("/")
+        return float(num) / float(den) if float(den) else 0.0
+    except (ValueError, AttributeError):
+        return 0.0
+
+
+def probe_streams(path):
+    """Obtém a duração do container e a contagem de pacotes de cada fluxo (sem decodificar)"""
+    cmd = ["ffprobe", "-v", "error", "-count_packets",
+           "-show_entries", "format=duration:stream=codec_type,nb_read_packets,avg_frame_rate",
+           "-of", "json", path]
+    result = ffmpeg_utils.run_ffprobe_command(cmd)
+    if result.returncode != 0:
+        return None
+    try:
+        return json.loads(result.stdout)
+    except ValueError:
+        return None
+
+
+def decode_first_frame(path):
+    """Decodifica apenas o primeiro frame de vídeo; retorna True se foi decodificado sem erros"""
+    ffmpeg_path = ffmpeg_utils.get_ffmpeg_path()
+    if not ffmpeg_path:
+        return False
+    cmd = [ffmpeg_path, "-v", "error", "-i", path, "-map", "0:v:0", "-frames:v", "1", "-f", "null", "-"]
+    result = ffmpeg_utils.run_hidden_command(cmd)
+    return result.returncode == 0 and not result.stderr.strip()
+
+
+def verify_output(path, planned_duration, tolerance=DEFAULT_DURATION_TOLERANCE):
+    """Verifica uma parte gerada e retorna a lista de problemas encontrados (vazia se estiver correta)"""
+    errors = []
+    if not os.path.isfile(path):
+        return ["arquivo de saída não encontrado"]
+    if os.path.getsize(path) == 0:
+        return ["arquivo de saída vazio"]
+
+    if path.endswith(".m3u8"):
+        # Parte empacotada em HLS/CMAF: a playlist só é finalizada (ENDLIST) quando a codificação termina
+        with open(path, "r", encoding="utf-8", errors="ignore") as f:
+            if "#EXT-X-ENDLIST" not in f.read():
+                return ["playlist incompleta (sem #EXT-X-ENDLIST)"]
+    else:
+        try:
+            boxes = read_top_level_boxes(path)
+        except OSError as e:
+            return [f"erro ao ler o arquivo: {str(e)}"]
+        if "moov" not in boxes:
+            errors.append("átomo moov ausente")
+        if "<truncado>" in boxes:
+            errors.append("arquivo truncado (átomo incompleto)")
+        if errors:
+            # Sem moov o FFprobe não consegue ler o arquivo
+            return errors
+
+    info = probe_streams(path)
+    if info is None:
+        return ["FFprobe não conseguiu ler o arquivo"]
+
+    try:
+        duration = float(info.get('format', {}).get('duration', 0))
+    except (TypeError, ValueError):
+        duration = 0.0
+    if abs(duration - planned_duration) > tolerance:
+        errors.append(f"duração {duration:.2f}s diferente da planejada ({planned_duration:.2f}s)")
+
+    streams = {stream.get('codec_type'): stream for stream in info.get('streams', [])}
+    video = streams.get('video')
+    audio = streams.get('audio')
+    if video is None:
+        errors.append("fluxo de vídeo ausente")
+    else:
+        video_packets = int(video.get('nb_read_packets') or 0)
+        expected_packets = planned_duration * _parse_rate(video.get('avg_frame_rate'))
+        if video_packets == 0:
+            errors.append("fluxo de vídeo sem pacotes")
+        elif expected_packets and video_packets < expected_packets * MIN_PACKET_RATIO:
+            errors.append(f"pacotes de vídeo insuficientes ({video_packets} de ~{int(expected_packets)})")
+    if audio is None:
+        errors.append("fluxo de áudio ausente")
+    elif int(audio.get('nb_read_packets') or 0) == 0:
+        errors.append("fluxo de áudio sem pacotes")
+
+    if video is not None and not decode_first_frame(path):
+        errors.append("falha ao decodificar o primeiro frame")
+
+    return errors
+
+
+class OutputVerifier:
+    """Pool limitado de verificações que roda em paralelo com as codificações"""
+
+    def __init__(self, max_workers=2, tolerance=DEFAULT_DURATION_TOLERANCE):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="verificador")
+        self.tolerance = tolerance
+        self.results = {}  # part_number -> lista de erros da última verificação
+
+    def submit(self, segment, output_file, callback=None, extra_files=()):
+        """Agenda a verificação de uma parte; callback(segment, output_file, errors) é chamado ao terminar
+
+        extra_files são as versões adicionais da mesma parte, verificadas na mesma tarefa.
+        """
+        def task():
+            errors = []
+            for path in [output_file] + list(extra_files):
+                try:
+                    file_errors = verify_output(path, segment['duration'], self.tolerance)
+                except Exception as e:
+                    file_errors = [f"erro na verificação: {str(e)}"]
+                if path != output_file:
+                    file_errors = [f"{os.path.basename(path)}: {error}" for error in file_errors]
+                errors.extend(file_errors)
+            self.results[segment['part_number']] = errors
+            if callback:
+                callback(segment, output_file, errors)
+            return errors
+        return self.executor.submit(task)
+
+    def failures(self):
+        """Retorna as partes cuja última verificação falhou"""
+        return {part: errors for part, errors in sorted(self.results.items()) if errors}
+
+    def report_lines(self):
+        """Linhas do relatório de verificação do trabalho"""
+        failures = self.failures()
+        lines = [f"Relatório de verificação: {len(self.results) - len(failures)} de {len(self.results)} partes válidas."]
+        for part_number, errors in failures.items():
+            lines.append(f"- Parte {part_number}: {'; '.join(errors)}")
+        return lines
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait=wait)
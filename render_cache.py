@@ -0,0 +1,290 @@
+"""Cache de partes renderizadas, indexado pelo conteúdo de tudo o que define a parte
+
+Chave completa: identidade da entrada, trecho (início e duração), filter_complex (que inclui o
+texto "Parte N" e o chroma key), conteúdo da capa e do selo e parâmetros do codificador. Uma parte
+com a mesma chave é reaproveitada por cópia (reflink quando o disco permite), sem codificar nada;
+mudar apenas o prefixo dos arquivos, por exemplo, reaproveita todas as partes.
+
+Capa, texto e selo só aparecem no início da parte (capa e texto no primeiro frame, o selo de
+SELO_START até o fim do vídeo do selo). Cada parte codificada com o cache recebe um quadro-chave
+forçado no fim desse trecho inicial (a "cabeça"), e o restante (o "corpo") é guardado separadamente,
+com uma chave que não depende da capa, do selo nem da numeração. Se só a cabeça mudou, apenas ela
+é codificada e o corpo é copiado sem recodificação (concat demuxer, -c copy).
+
+O tamanho do cache é limitado; as entradas usadas há mais tempo são removidas primeiro (LRU,
+pela data de modificação, atualizada a cada uso).
+
+Opções do trabalho:
+    'render_cache': pasta do cache, "auto" (~/.video_cutter/render_cache) ou None
+    'render_cache_max_gb': tamanho máximo do cache (padrão 20)
+
+Não se aplica aos trabalhos com saídas auxiliares ('side_outputs') nem com pools de codificadores
+('encoder_pools').
+"""
+import csv
+import hashlib
+import json
+import math
+import os
+import shutil
+import threading
+import uuid
+
+import analysis_cache
+import ffmpeg_utils
+import segment_render
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".video_cutter", "render_cache")
+DEFAULT_MAX_GB = 20
+# Incrementar ao mudar a forma de renderizar para invalidar as partes salvas
+CACHE_VERSION = 2
+# Início do selo na parte (tpad=start_duration do build_filter_complex)
+SELO_START = 10
+# A cabeça é arredondada para cima neste múltiplo (s), para que pequenas mudanças na duração do
+# selo não mudem a chave do corpo
+HEAD_GRANULARITY = 5
+# Duração mínima do corpo para valer a pena separá-lo da cabeça
+MIN_BODY_DURATION = 10
+
+
+def resolve_cache_dir(render_cache):
+    if not render_cache:
+        return None
+    return DEFAULT_CACHE_DIR if render_cache == "auto" else render_cache
+
+
+def _digest(data):
+    return hashlib.sha1(json.dumps(data, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+# ioctl FICLONE do Linux (linux/fs.h): cópia por reflink em Btrfs, XFS e similares
+FICLONE = 0x40049409
+
+
+def _reflink(source, destination):
+    """Clona o conteúdo sem duplicar os blocos; falha com OSError onde não há suporte"""
+    import fcntl
+
+    with open(source, "rb") as src, open(destination, "wb") as dst:
+        fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+
+
+def copy_file(source, destination):
+    """Cópia independente: reflink quando o sistema de arquivos permite; senão, cópia dos dados
+
+    Nunca hardlink: a parte entregue e a entrada do cache não podem compartilhar o mesmo arquivo,
+    senão uma escrita na parte entregue (uma ferramenta de tags, um novo FFmpeg -y na mesma pasta)
+    corromperia o cache sob a chave antiga.
+    """
+    tmp_destination = f"{destination}.{uuid.uuid4().hex[:6]}.tmp"
+    try:
+        try:
+            _reflink(source, tmp_destination)
+        except (OSError, ImportError):
+            shutil.copyfile(source, tmp_destination)
+        os.replace(tmp_destination, destination)
+    except BaseException:
+        ffmpeg_utils.remove_partial_output(tmp_destination)
+        raise
+
+
+class CacheKeys:
+    """Chaves de uma parte: a da parte inteira e, quando há corpo, a do corpo e a duração da cabeça"""
+
+    def __init__(self, full, body=None, head_duration=None):
+        self.full = full
+        self.body = body
+        self.head_duration = head_duration
+
+
+class RenderCache:
+    """Cache de partes em uma pasta, com tamanho máximo e remoção LRU"""
+
+    def __init__(self, cache_dir=None, max_gb=DEFAULT_MAX_GB, log=print):
+        self.cache_dir = cache_dir or DEFAULT_CACHE_DIR
+        self.max_bytes = int(float(max_gb) * 1024 ** 3)
+        self.log = log
+        self.lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def is_cacheable(job):
+        # Prévias, versões adicionais, saídas auxiliares e HLS/CMAF geram outros arquivos por parte;
+        # com pools de codificadores, o codificador só é conhecido ao reservar a vaga
+        return not job.get('proxy') and not job.get('renditions') and not job.get('packaging') \
+            and not job.get('side_outputs') and not job.get('encoder_pools')
+
+    def get_keys(self, job, segment):
+        """Chaves da parte, ou None se o trabalho não usa o cache"""
+        if not self.is_cacheable(job):
+            return None
+        input_res = segment_render.get_video_resolution(job['input_file']) or segment_render.DEFAULT_RESOLUTION
+        cover_res = segment_render.get_video_resolution(job['image_file']) or segment_render.DEFAULT_RESOLUTION
+        selo_res = segment_render.get_video_resolution(job['selo_file']) or segment_render.DEFAULT_RESOLUTION
+        resolution_info = segment_render.check_resolution_compatibility(input_res, cover_res, selo_res)
+        filter_complex = segment_render.build_filter_complex(
+            segment['start_time'], segment['duration'], segment['part_number'], resolution_info,
+            job.get('chroma_color', "0x00d600"), job.get('similarity', 0.30), job.get('blend', 0.35))
+        encoder_name, encoder_params = segment_render.get_slot_encoder(job)
+        common = {
+            'version': CACHE_VERSION,
+            'input': analysis_cache.file_sample_hash(job['input_file']),
+            'start': round(segment['start_time'], 3),
+            'duration': round(segment['duration'], 3),
+            'encoder': [encoder_name] + list(encoder_params),
+        }
+        if job.get('reframe'):
+            # O caminho do recorte depende só do conteúdo da entrada, do trecho e da opção
+            common['reframe'] = job['reframe']
+        full = _digest(dict(common, filter=filter_complex,
+                            cover=analysis_cache.file_content_hash(job['image_file']),
+                            selo=analysis_cache.file_content_hash(job['selo_file'])))
+
+        selo_duration = max(segment_render.get_video_duration(job['selo_file']), 0)
+        head_duration = math.ceil((SELO_START + selo_duration) / HEAD_GRANULARITY) * HEAD_GRANULARITY
+        if segment['duration'] - head_duration < MIN_BODY_DURATION:
+            return CacheKeys(full)
+        body = _digest(dict(common, head=head_duration, resolution=list(input_res)))
+        return CacheKeys(full, body, head_duration)
+
+    def _path(self, name):
+        return os.path.join(self.cache_dir, name)
+
+    def _touch(self, path):
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def fetch(self, keys, output_file):
+        """Copia a parte inteira do cache para output_file; retorna False se não estiver no cache"""
+        cached = self._path(f"{keys.full}.mp4")
+        if not os.path.isfile(cached):
+            return False
+        self._touch(cached)
+        copy_file(cached, output_file)
+        return True
+
+    def get_body(self, keys):
+        """(arquivo do corpo, início do corpo na parte) ou None"""
+        if keys.body is None:
+            return None
+        body_file = self._path(f"{keys.body}.corpo.mp4")
+        try:
+            with open(self._path(f"{keys.body}.json"), "r", encoding="utf-8") as f:
+                head_end = json.load(f)['head_end']
+        except (OSError, ValueError, KeyError):
+            return None
+        if not os.path.isfile(body_file):
+            return None
+        self._touch(body_file)
+        return body_file, head_end
+
+    def render(self, keys, segment, output_file, render, use_body=True, should_stop=None):
+        """Renderiza a parte usando o corpo do cache quando possível
+
+        Args:
+            render (callable): render(segmento, arquivo, tempo do quadro-chave forçado ou None) -> bool
+            should_stop (callable): Retorna True quando o trabalho foi cancelado
+        """
+        body = self.get_body(keys) if use_body else None
+        if body is not None:
+            body_file, head_end = body
+            head_file = f"{os.path.splitext(output_file)[0]}.cabeca.mp4"
+            try:
+                if render(dict(segment, duration=head_end, part_duration=segment['duration']), head_file, None) and \
+                        self.concat([head_file, body_file], output_file):
+                    self.log(f"Parte {segment['part_number']}: apenas os {head_end:.1f}s iniciais foram codificados; "
+                             f"o restante veio do cache.")
+                    return True
+            finally:
+                ffmpeg_utils.remove_partial_output(head_file)
+            if should_stop and should_stop():
+                return False
+            self.log(f"Parte {segment['part_number']}: falha ao montar a parte com o corpo do cache; codificando inteira.")
+        return render(segment, output_file, keys.head_duration)
+
+    def concat(self, files, output_file):
+        """Junta arquivos com os mesmos parâmetros de codificação sem recodificar"""
+        list_file = f"{output_file}.lista.txt"
+        with open(list_file, "w", encoding="utf-8") as f:
+            for path in files:
+                escaped = os.path.abspath(path).replace("'", "'\\''")
+                f.write(f"file '{escaped}'\n")
+        try:
+            result = ffmpeg_utils.run_hidden_command([
+                ffmpeg_utils.get_ffmpeg_path(), "-y", "-v", "error", "-f", "concat", "-safe", "0", "-i", list_file,
+                "-map", "0", "-c", "copy", "-movflags", "+faststart", output_file])
+        finally:
+            os.remove(list_file)
+        if result.returncode != 0:
+            ffmpeg_utils.remove_partial_output(output_file)
+            return False
+        return True
+
+    def store(self, keys, output_file):
+        """Guarda uma parte verificada (e o seu corpo, se houver) e aplica o limite de tamanho"""
+        try:
+            copy_file(output_file, self._path(f"{keys.full}.mp4"))
+            if keys.body is not None and not os.path.isfile(self._path(f"{keys.body}.corpo.mp4")):
+                self._store_body(keys, output_file)
+        except OSError as e:
+            self.log(f"Aviso: não foi possível gravar a parte no cache: {str(e)}")
+            return
+        self.evict()
+
+    def _store_body(self, keys, output_file):
+        """Separa o corpo da parte no quadro-chave forçado no fim da cabeça (segment muxer, -c copy)"""
+        work_dir = self._path(f"tmp_{uuid.uuid4().hex[:8]}")
+        os.makedirs(work_dir)
+        try:
+            list_file = os.path.join(work_dir, "lista.csv")
+            result = ffmpeg_utils.run_hidden_command([
+                ffmpeg_utils.get_ffmpeg_path(), "-v", "error", "-i", output_file, "-map", "0", "-c", "copy",
+                "-f", "segment", "-segment_times", f"{keys.head_duration:.3f}", "-reset_timestamps", "1",
+                "-segment_list", list_file, "-segment_list_type", "csv",
+                os.path.join(work_dir, "trecho_%d.mp4")])
+            if result.returncode != 0:
+                return
+            with open(list_file, "r", encoding="utf-8", newline="") as f:
+                rows = list(csv.reader(f))
+            if len(rows) != 2:
+                return
+            # O corte ocorre no quadro-chave forçado: o corpo começa exatamente onde a cabeça termina
+            head_end = float(rows[1][1])
+            os.replace(os.path.join(work_dir, rows[1][0]), self._path(f"{keys.body}.corpo.mp4"))
+            tmp_json = self._path(f"{keys.body}.json.tmp")
+            with open(tmp_json, "w", encoding="utf-8") as f:
+                json.dump({'head_end': head_end}, f)
+            os.replace(tmp_json, self._path(f"{keys.body}.json"))
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    def evict(self):
+        """Remove as entradas usadas há mais tempo até o cache caber no tamanho máximo"""
+        with self.lock:
+            entries = []
+            for name in os.listdir(self.cache_dir):
+                path = self._path(name)
+                if name.endswith(".mp4") and os.path.isfile(path):
+                    stat = os.stat(path)
+                    entries.append((stat.st_mtime, stat.st_size, path))
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    if path.endswith(".corpo.mp4"):
+                        os.remove(path[:-len(".corpo.mp4")] + ".json")
+                except OSError:
+                    pass
+                total -= size
+
+
+def create_render_cache(job, log=print):
+    """Cria o cache a partir das opções do trabalho, ou None se não estiver ativado"""
+    cache_dir = resolve_cache_dir(job.get('render_cache'))
+    if not cache_dir or not RenderCache.is_cacheable(job):
+        return None
+    return RenderCache(cache_dir, job.get('render_cache_max_gb') or DEFAULT_MAX_GB, log=log)
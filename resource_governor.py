@@ -0,0 +1,360 @@
+"""Divisão dos recursos da CPU entre os processos FFmpeg simultâneos
+
+Sem limites, cada processo FFmpeg dimensiona as threads do codificador, do decodificador e
+dos filtros pelo número total de núcleos. Com vários processos em paralelo isso gera muito
+mais threads do que núcleos (troca de contexto e disputa de cache). O governador divide um
+orçamento global de threads entre as vagas de processamento e, opcionalmente:
+- fixa cada vaga em um conjunto de núcleos disjunto (afinidade);
+- roda os processos em baixa prioridade (nice/ionice, ou prioridade abaixo do normal no Windows);
+- associa as vagas a codificadores diferentes (pools), cada um com o seu limite de processos
+  simultâneos, por exemplo 2 vagas NVENC e 2 vagas libx264:
+
+    'encoder_pools': [
+        {'name': "nvenc", 'encoder': "h264_nvenc", 'slots': 2},
+        {'name': "x264", 'encoder': "libx264", 'slots': 2, 'speed_profile': "fast"},
+    ]
+
+  Uma parte que falha em um pool (por exemplo, ao atingir o limite de sessões simultâneas do
+  NVENC) é renderizada novamente em uma vaga de outro pool. Para testar sem GPU, dois pools de
+  libx264 com perfis diferentes funcionam como pools distintos. Cada pool aceita 'params' (os
+  parâmetros do codificador, em vez dos de get_encoder_params). Qualquer codificador do
+  encoder_registry pode formar um pool, inclusive libx265 e libsvtav1. As versões adicionais
+  ('renditions') com 'speed_profile' próprio usam esse perfil com o codificador do pool.
+
+Uso:
+    governor = ResourceGovernor(4, pin_cores=True)
+    with governor.slot() as slot:
+        cmd = segment_render.build_ffmpeg_command(..., threads=slot.threads)
+        process = ffmpeg_utils.run_ffmpeg_command(cmd, **slot.popen_kwargs())
+        slot.apply(process)
+
+Benchmark (vazão agregada com e sem o governador):
+    python resource_governor.py benchmark --input video.mp4 --image capa.png --selo selo.mp4 --parallel 1,2,4
+"""
+import ctypes
+import os
+import platform
+import threading
+from contextlib import contextmanager
+
+import encoder_registry
+
+# Prioridade reduzida no modo em segundo plano
+BACKGROUND_NICE = 10
+# ioprio_set(2): classe "idle" para o disco
+IOPRIO_CLASS_IDLE = 3
+IOPRIO_CLASS_SHIFT = 13
+IOPRIO_WHO_PROCESS = 1
+_IOPRIO_SET_SYSCALL = {'x86_64': 251, 'i386': 289, 'i686': 289, 'aarch64': 30, 'armv7l': 314}
+# Windows
+BELOW_NORMAL_PRIORITY_CLASS = 0x00004000
+
+
+def available_cores():
+    """Núcleos que este processo pode usar"""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def ffmpeg_thread_args(threads, encoder_name, resolution=None):
+    """Parâmetros de threads do FFmpeg para uma vaga com o orçamento informado
+
+    Os parâmetros do codificador seguem o registro (encoder_registry): codificadores de hardware
+    não recebem cota, e a resolução da saída limita as threads úteis e define os tiles.
+
+    Returns:
+        tuple: (parâmetros globais, parâmetros do decodificador da entrada principal,
+                parâmetros do codificador)
+    """
+    if not threads:
+        return [], [], []
+    # O codificador recebe a cota inteira; decodificação e filtros ficam com metade,
+    # pois esperam pelo codificador a maior parte do tempo
+    helper_threads = str(max(1, threads // 2))
+    global_args = ["-filter_threads", helper_threads, "-filter_complex_threads", helper_threads]
+    decoder_args = ["-threads", helper_threads]
+    encoder_args = encoder_registry.get_thread_args(encoder_name, threads, resolution)
+    return global_args, decoder_args, encoder_args
+
+
+def _set_io_idle(thread_id):
+    """Coloca a thread na classe de E/S ociosa (Linux, equivalente a ionice -c3)"""
+    syscall_number = _IOPRIO_SET_SYSCALL.get(platform.machine())
+    if syscall_number is None:
+        return
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        libc.syscall(syscall_number, IOPRIO_WHO_PROCESS, thread_id, IOPRIO_CLASS_IDLE << IOPRIO_CLASS_SHIFT)
+    except (OSError, AttributeError):
+        pass
+
+
+def _thread_ids(pid):
+    """Threads de um processo (Linux: /proc/<pid>/task); nos outros sistemas, apenas o próprio pid"""
+    try:
+        return [int(name) for name in os.listdir(f"/proc/{pid}/task")]
+    except (OSError, ValueError):
+        return [pid]
+
+
+class EncoderPool:
+    """Grupo de vagas associadas ao mesmo codificador"""
+
+    def __init__(self, name, encoder, params, slots=1):
+        self.name = name
+        self.encoder = encoder
+        self.params = list(params)
+        self.slots = max(1, int(slots))
+
+
+def parse_encoder_pools(pools, speed_profile="balanced"):
+    """Cria os pools a partir da opção 'encoder_pools' do trabalho (None se não houver pools)"""
+    if not pools:
+        return None
+    import ffmpeg_utils
+
+    result = []
+    for config in pools:
+        encoder = config['encoder']
+        if not config.get('params') and encoder_registry.get_entry(encoder) is None:
+            raise ValueError(f"Codificador desconhecido no pool: {encoder}")
+        params = config.get('params') or ffmpeg_utils.get_encoder_params(
+            encoder, config.get('speed_profile', speed_profile))
+        name = config.get('name') or encoder
+        if any(pool.name == name for pool in result):
+            raise ValueError(f"Pool de codificadores repetido: {name}")
+        result.append(EncoderPool(name, encoder, params, config.get('slots', 1)))
+    return result
+
+
+class Slot:
+    """Vaga de processamento: cota de threads, núcleos e prioridade de um processo FFmpeg
+
+    Com pools de codificadores, pool é o EncoderPool da vaga; sem pools, o codificador é o do trabalho.
+    """
+
+    def __init__(self, index, threads, cores=None, background=False, pool=None):
+        self.index = index
+        self.threads = threads
+        self.cores = cores
+        self.background = background
+        self.pool = pool
+
+    def popen_kwargs(self):
+        """Parâmetros extras do subprocess.Popen (prioridade no Windows)
+
+        Nada é executado no processo filho entre o fork e o exec (preexec_fn), o que não é
+        seguro com as várias threads do motor; os demais ajustes são feitos por apply().
+        """
+        if os.name == 'nt' and self.background:
+            return {'creationflags': BELOW_NORMAL_PRIORITY_CLASS}
+        return {}
+
+    def apply(self, process):
+        """Aplica a afinidade e a baixa prioridade ao processo recém-iniciado, pelo pid
+
+        Chamado logo após o Popen, antes de o FFmpeg abrir a entrada e criar as threads de
+        codificação, que herdam os ajustes da thread principal; as threads já existentes
+        também são ajustadas.
+        """
+        if os.name == 'nt':
+            if not self.cores:
+                return
+            try:
+                mask = 0
+                for core in self.cores:
+                    mask |= 1 << core
+                ctypes.windll.kernel32.SetProcessAffinityMask(int(process._handle), mask)
+            except (OSError, AttributeError, ValueError):
+                pass
+            return
+        if not self.cores and not self.background:
+            return
+        for thread_id in _thread_ids(process.pid):
+            try:
+                if self.cores and hasattr(os, "sched_setaffinity"):
+                    os.sched_setaffinity(thread_id, self.cores)
+                if self.background:
+                    os.setpriority(os.PRIO_PROCESS, thread_id, BACKGROUND_NICE)
+                    _set_io_idle(thread_id)
+            except OSError:
+                # O processo (ou a thread) já terminou
+                pass
+
+    def describe(self):
+        text = f"vaga {self.index + 1}: {self.threads} threads"
+        if self.cores:
+            text += f", núcleos {self.cores[0]}-{self.cores[-1]}"
+        if self.background:
+            text += ", baixa prioridade"
+        if self.pool is not None:
+            text += f", {self.pool.name} ({self.pool.encoder})"
+        return text
+
+
+class ResourceGovernor:
+    """Distribui o orçamento de threads entre slot_count vagas e limita os processos simultâneos
+
+    Também funciona como o semáforo de vagas: slot() bloqueia até haver uma vaga livre. Com pools
+    de codificadores, o número de vagas é a soma das vagas dos pools (slot_count é ignorado).
+    """
+
+    def __init__(self, slot_count, thread_budget=None, pin_cores=False, background=False, pools=None):
+        self.pools = pools or []
+        # Pool de cada vaga, na ordem da configuração (vagas dos primeiros pools têm preferência)
+        self.slot_pools = [pool for pool in self.pools for _ in range(pool.slots)]
+        self.slot_count = len(self.slot_pools) if self.pools else max(1, int(slot_count))
+        if not self.pools:
+            self.slot_pools = [None] * self.slot_count
+        cores = available_cores()
+        self.thread_budget = int(thread_budget) if thread_budget else len(cores)
+        self.background = background
+
+        # Núcleos disjuntos por vaga, apenas se houver pelo menos um núcleo por vaga
+        self.core_sets = [None] * self.slot_count
+        if pin_cores and len(cores) >= self.slot_count:
+            per_slot = len(cores) // self.slot_count
+            self.core_sets = [cores[i * per_slot:(i + 1) * per_slot] for i in range(self.slot_count)]
+        elif pin_cores:
+            print(f"Aviso: {len(cores)} núcleos para {self.slot_count} vagas; afinidade desativada.")
+
+        self.condition = threading.Condition()
+        self.free_slots = list(range(self.slot_count))
+
+    def threads_per_slot(self, index):
+        threads = max(1, self.thread_budget // self.slot_count)
+        cores = self.core_sets[index]
+        return min(threads, len(cores)) if cores else threads
+
+    def acquire(self, exclude_pools=()):
+        """Reserva uma vaga livre (bloqueia até haver uma)
+
+        Args:
+            exclude_pools: Nomes dos pools que não devem ser usados (já falharam para a parte)
+
+        Returns:
+            Slot: a vaga, ou None se todos os pools foram excluídos
+        """
+        with self.condition:
+            while True:
+                allowed = [index for index in self.free_slots
+                           if self.slot_pools[index] is None or self.slot_pools[index].name not in exclude_pools]
+                if allowed:
+                    index = allowed[0]
+                    self.free_slots.remove(index)
+                    break
+                if not self.has_pool(exclude_pools):
+                    return None
+                self.condition.wait()
+        return Slot(index, self.threads_per_slot(index), self.core_sets[index], self.background,
+                    self.slot_pools[index])
+
+    def release(self, slot):
+        with self.condition:
+            self.free_slots.append(slot.index)
+            self.free_slots.sort()
+            self.condition.notify_all()
+
+    def has_pool(self, exclude_pools=()):
+        """True se há vagas fora dos pools excluídos"""
+        return any(pool is None or pool.name not in exclude_pools for pool in self.slot_pools)
+
+    @contextmanager
+    def slot(self):
+        slot = self.acquire()
+        try:
+            yield slot
+        finally:
+            self.release(slot)
+
+    def describe(self):
+        text = f"{self.slot_count} vagas, orçamento de {self.thread_budget} threads ({self.threads_per_slot(0)} por vaga)"
+        if self.pools:
+            text += "; pools: " + ", ".join(f"{pool.name} ({pool.encoder}, {pool.slots} vagas)" for pool in self.pools)
+        return text
+
+
+def get_slot_count(job, parallel_count):
+    """Número de vagas do trabalho: a soma das vagas dos pools de codificadores, se houver"""
+    pools = job.get('encoder_pools')
+    if pools:
+        return sum(max(1, int(pool.get('slots', 1))) for pool in pools)
+    return parallel_count
+
+
+def create_governor(job, slot_count):
+    """Cria o governador a partir das opções do trabalho"""
+    pools = parse_encoder_pools(job.get('encoder_pools'), job.get('speed_profile', "balanced"))
+    return ResourceGovernor(slot_count, job.get('thread_budget'),
+                            pin_cores=job.get('pin_cores', False), background=job.get('background_priority', False),
+                            pools=pools)
+
+
+def run_benchmark(input_file, image_file, selo_file, parallel_counts, segment_duration=20.0, pin_cores=False):
+    """Mede a vazão agregada (segundos de vídeo por segundo) com e sem o governador"""
+    import shutil
+    import tempfile
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+
+    import segment_render
+
+    total_duration = segment_render.get_video_duration(input_file)
+    if total_duration <= 0:
+        raise RuntimeError(f"Não foi possível obter a duração de {input_file}")
+
+    results = []
+    for parallel_count in parallel_counts:
+        # Duas partes por vaga, para medir a vazão com todas as vagas ocupadas
+        part_count = parallel_count * 2
+        duration = min(segment_duration, total_duration / part_count)
+        segments = [{'part_number': i + 1, 'start_time': i * duration, 'duration': duration}
+                    for i in range(part_count)]
+
+        for governed in (False, True):
+            output_directory = tempfile.mkdtemp(prefix="video_cutter_benchmark_")
+            job = {'input_file': input_file, 'image_file': image_file, 'selo_file': selo_file,
+                   'output_prefix': "bench ", 'output_directory': output_directory}
+            governor = ResourceGovernor(parallel_count, pin_cores=pin_cores) if governed else None
+
+            def render(segment):
+                if governor is None:
+                    return segment_render.render_segment(job, segment, log=lambda message: None)
+                with governor.slot() as slot:
+                    return segment_render.render_segment(job, segment, log=lambda message: None, slot=slot)
+
+            started = time.time()
+            try:
+                with ThreadPoolExecutor(max_workers=parallel_count) as executor:
+                    ok = all(executor.map(render, segments))
+            finally:
+                shutil.rmtree(output_directory, ignore_errors=True)
+            elapsed = time.time() - started
+            throughput = duration * part_count / elapsed if elapsed > 0 else 0.0
+            results.append((parallel_count, governed, throughput, ok))
+            print(f"{parallel_count} processos, governador {'ativo' if governed else 'desativado'}: "
+                  f"{throughput:.2f} s de vídeo/s ({elapsed:.1f}s){'' if ok else ' (com erros)'}")
+    return results
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Governador de recursos do Video Cutter")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    bench_parser = subparsers.add_parser("benchmark", help="Compara a vazão com e sem o governador")
+    bench_parser.add_argument("--input", required=True)
+    bench_parser.add_argument("--image", required=True)
+    bench_parser.add_argument("--selo", required=True)
+    bench_parser.add_argument("--parallel", default="1,2,4", help="Números de processos paralelos (ex.: 1,2,4)")
+    bench_parser.add_argument("--segment-duration", type=float, default=20.0)
+    bench_parser.add_argument("--pin-cores", action="store_true")
+    args = parser.parse_args(argv)
+
+    parallel_counts = [int(value) for value in args.parallel.split(",") if value.strip()]
+    run_benchmark(args.input, args.image, args.selo, parallel_counts, args.segment_duration, args.pin_cores)
+
+
+if __name__ == "__main__":
+    main()
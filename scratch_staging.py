@@ -0,0 +1,171 @@
+"""Área temporária local para entradas e saídas em armazenamento lento (NAS, compartilhamento de rede)
+
+- O vídeo de entrada é copiado para o disco local em segundo plano, antes dos codificadores
+  precisarem dele; as partes iniciadas depois da cópia leem a cópia local.
+- A capa e o selo (arquivos pequenos, lidos por todas as partes) são copiados imediatamente.
+- As partes são gravadas no disco local (inclusive a reescrita do +faststart) e movidas para a
+  pasta de saída por um pool limitado de threads, sem ocupar as vagas de codificação.
+
+Uso:
+    stager = ScratchStager("D:/Temp")
+    job = stager.stage_job(job)
+    local_file = stager.local_output(output_file)
+    ... renderizar em local_file ...
+    stager.commit(local_file, output_file, callback)
+    stager.close()
+"""
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# Tamanho dos blocos copiados do compartilhamento
+COPY_CHUNK_SIZE = 8 * 1024 * 1024
+# Número padrão de transferências simultâneas para a pasta de saída
+DEFAULT_MAX_MOVERS = 2
+
+
+def resolve_scratch_dir(scratch_dir):
+    """Converte a opção do trabalho em uma pasta: "auto" usa a pasta temporária do sistema"""
+    if not scratch_dir:
+        return None
+    if scratch_dir == "auto":
+        return tempfile.gettempdir()
+    return scratch_dir
+
+
+def copy_file(source, destination, should_stop=None):
+    """Copia em blocos grandes para um nome temporário e renomeia ao final (nunca deixa cópias parciais)
+
+    Pastas (partes empacotadas em HLS/CMAF) são copiadas inteiras e substituem a pasta de destino.
+    """
+    tmp_destination = f"{destination}.{uuid.uuid4().hex[:6]}.tmp"
+    if os.path.isdir(source):
+        try:
+            shutil.copytree(source, tmp_destination)
+            if os.path.isdir(destination):
+                shutil.rmtree(destination)
+            os.replace(tmp_destination, destination)
+            return True
+        finally:
+            shutil.rmtree(tmp_destination, ignore_errors=True)
+    try:
+        with open(source, "rb") as src, open(tmp_destination, "wb") as dst:
+            while True:
+                if should_stop and should_stop():
+                    return False
+                chunk = src.read(COPY_CHUNK_SIZE)
+                if not chunk:
+                    break
+                dst.write(chunk)
+        shutil.copystat(source, tmp_destination)
+        os.replace(tmp_destination, destination)
+        return True
+    finally:
+        if os.path.exists(tmp_destination):
+            os.remove(tmp_destination)
+
+
+class ScratchStager:
+    """Gerencia as cópias locais de um trabalho e a transferência das partes para a pasta de saída"""
+
+    def __init__(self, scratch_dir, max_movers=DEFAULT_MAX_MOVERS, log=print):
+        os.makedirs(scratch_dir, exist_ok=True)
+        self.work_dir = tempfile.mkdtemp(prefix="video_cutter_", dir=scratch_dir)
+        self.log = log
+        self.movers = ThreadPoolExecutor(max_workers=max(1, max_movers), thread_name_prefix="transferencia")
+        self.pending_moves = []
+        self.lock = threading.Lock()
+        self.is_running = True
+
+        self.input_file = None
+        self.local_input = None
+        self.input_ready = threading.Event()
+        self.prefetch_thread = None
+
+    def _local_path(self, path, role=None):
+        """Caminho na área temporária; as entradas levam o seu papel no nome ("capa_", "selo_",
+        "entrada_"), para que arquivos com o mesmo nome em pastas diferentes não colidam"""
+        name = os.path.basename(path)
+        return os.path.join(self.work_dir, f"{role}_{name}" if role else name)
+
+    def stage_job(self, job, prefetch=True):
+        """Retorna uma cópia do trabalho com capa e selo locais e inicia a pré-carga da entrada
+
+        Com prefetch=False (entrada já local), as partes leem a entrada do próprio trabalho.
+        """
+        staged = dict(job)
+        for key, role in (('image_file', "capa"), ('selo_file', "selo")):
+            local_path = self._local_path(job[key], role)
+            if not os.path.exists(local_path):
+                copy_file(job[key], local_path)
+            staged[key] = local_path
+        self.input_file = job['input_file']
+        if prefetch:
+            self.prefetch_input(job['input_file'])
+        return staged
+
+    def prefetch_input(self, input_file):
+        """Copia o vídeo de entrada para o disco local em segundo plano"""
+        self.input_file = input_file
+        self.local_input = self._local_path(input_file, "entrada")
+
+        def prefetch():
+            try:
+                if copy_file(input_file, self.local_input, should_stop=lambda: not self.is_running):
+                    self.input_ready.set()
+                    self.log("Vídeo de entrada copiado para a área temporária local.")
+            except OSError as e:
+                self.log(f"Aviso: não foi possível copiar a entrada para a área temporária: {str(e)}")
+
+        self.prefetch_thread = threading.Thread(target=prefetch, daemon=True)
+        self.prefetch_thread.start()
+
+    def input_path(self):
+        """Caminho a ser lido por uma parte que vai começar agora: a cópia local, se já estiver pronta"""
+        return self.local_input if self.input_ready.is_set() else self.input_file
+
+    def local_output(self, output_file):
+        """Caminho local onde a parte deve ser gravada antes de ir para a pasta de saída"""
+        return self._local_path(output_file)
+
+    def commit(self, local_file, output_file, callback=None):
+        """Agenda a transferência da parte; callback(ok) é chamado ao terminar"""
+        def move():
+            ok = False
+            try:
+                os.makedirs(os.path.dirname(output_file) or ".", exist_ok=True)
+                ok = copy_file(local_file, output_file)
+            except OSError as e:
+                self.log(f"Erro ao mover {os.path.basename(output_file)} para a pasta de saída: {str(e)}")
+            finally:
+                if os.path.isdir(local_file):
+                    shutil.rmtree(local_file, ignore_errors=True)
+                elif os.path.exists(local_file):
+                    os.remove(local_file)
+            if callback:
+                callback(ok)
+            return ok
+
+        future = self.movers.submit(move)
+        with self.lock:
+            self.pending_moves.append(future)
+        return future
+
+    def wait(self):
+        """Aguarda todas as transferências agendadas"""
+        with self.lock:
+            pending = list(self.pending_moves)
+        return all(future.result() for future in pending)
+
+    def close(self, wait=True):
+        """Finaliza as transferências (ou cancela, com wait=False) e remove a área temporária"""
+        self.is_running = False
+        if wait:
+            self.wait()
+        self.movers.shutdown(wait=wait, cancel_futures=not wait)
+        if self.prefetch_thread is not None:
+            self.prefetch_thread.join(timeout=1.0)
+        shutil.rmtree(self.work_dir, ignore_errors=True)
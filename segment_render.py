@@ -0,0 +1,749 @@
+import os
+import random
+import re
+import shutil
+import threading
+
+import auto_reframe
+import encoder_registry
+import ffmpeg_utils
+import hls_packaging
+import resource_governor
+
+# Resolução usada quando não é possível obter a resolução de um arquivo
+DEFAULT_RESOLUTION = (1080, 1920)
+
+# Configuração padrão do modo de prévia (proxy): altura do lado menor e taxa de quadros
+PROXY_DEFAULTS = {'height': 360, 'fps': 12}
+# Subpasta (dentro da pasta de saída) onde as prévias são gravadas
+PROXY_SUBFOLDER = "previa"
+
+# Escada de versões adicionais padrão (opção 'renditions' do trabalho): cada versão é gerada no
+# mesmo processo FFmpeg da parte principal, a partir do mesmo vídeo decodificado e sobreposto.
+#   suffix: acrescentado ao nome da parte ("Prefixo Parte 3_720p.mp4")
+#   short_side: lado menor da versão (a proporção é mantida)
+#   speed_profile: perfil de codificação (get_encoder_params); padrão: o do trabalho
+#   bitrate: taxa máxima opcional do vídeo (ex.: "3M")
+DEFAULT_RENDITIONS = [
+    {'suffix': "_720p", 'short_side': 720, 'speed_profile': "fast", 'bitrate': "3M"},
+]
+
+# Saídas auxiliares de cada parte (opção 'side_outputs' do trabalho), geradas no mesmo processo
+# FFmpeg a partir do vídeo e do áudio já decodificados e sobrepostos (sem decodificar a parte de novo):
+#   thumbnail: miniatura JPEG no instante 'offset' (s) da parte
+#   preview: clipe curto sem áudio a partir de 'start' (s), com 'duration' s, lado menor 'short_side' e 'fps'
+#   waveform: imagem PNG da forma de onda do áudio da parte, com tamanho 'size'
+# Cada chave pode ser omitida (ou None) para não gerar a saída.
+DEFAULT_SIDE_OUTPUTS = {
+    'thumbnail': {'offset': 15, 'short_side': 720},
+    'preview': {'start': 15, 'duration': 6, 'short_side': 360, 'fps': 15},
+    'waveform': {'size': "1280x240", 'color': "white"},
+}
+# Sufixo e extensão do arquivo de cada saída auxiliar ("Prefixo Parte 3_thumb.jpg")
+SIDE_OUTPUT_SUFFIXES = {'thumbnail': "_thumb.jpg", 'preview': "_preview.mp4", 'waveform': "_waveform.png"}
+
+# Cache de resultados do FFprobe, indexado por (tipo, caminho, tamanho, mtime)
+# Em processos de longa duração (como o serviço local) evita sondar os mesmos arquivos a cada trabalho
+_probe_cache = {}
+_probe_cache_lock = threading.Lock()
+probe_cache_stats = {'hits': 0, 'misses': 0}
+
+
+def _cached_probe(kind, video_file, probe_func):
+    """Executa probe_func(video_file) usando o cache enquanto o arquivo não for modificado"""
+    try:
+        stat = os.stat(video_file)
+        key = (kind, os.path.abspath(video_file), stat.st_size, stat.st_mtime)
+    except OSError:
+        return probe_func(video_file)
+
+    with _probe_cache_lock:
+        if key in _probe_cache:
+            probe_cache_stats['hits'] += 1
+            return _probe_cache[key]
+        probe_cache_stats['misses'] += 1
+
+    value = probe_func(video_file)
+    # Não armazenar falhas para que uma nova tentativa possa sondar novamente
+    if value is not None and value != -1:
+        with _probe_cache_lock:
+            _probe_cache[key] = value
+    return value
+
+
+def get_video_duration(video_file):
+    """Obtém a duração de um arquivo de vídeo usando FFprobe (retorna -1 em caso de erro)"""
+    return _cached_probe('duration', video_file, _probe_duration)
+
+
+def get_video_resolution(video_file):
+    """Obtém a resolução de um vídeo ou imagem usando FFprobe (retorna None em caso de erro)"""
+    return _cached_probe('resolution', video_file, _probe_resolution)
+
+
+def _probe_duration(video_file):
+    try:
+        cmd = ["ffprobe", "-i", video_file, "-show_entries", "format=duration", "-v", "quiet", "-of", "csv=p=0"]
+        result = ffmpeg_utils.run_ffprobe_command(cmd)
+        if result.returncode == 0 and result.stdout.strip():
+            return float(result.stdout.strip())
+        return -1
+    except Exception as e:
+        print(f"Erro ao obter duração do vídeo: {str(e)}")
+        return -1
+
+
+def _probe_resolution(video_file):
+    try:
+        cmd = ["ffprobe", "-v", "error", "-select_streams", "v:0", "-show_entries", "stream=width,height", "-of", "csv=s=x:p=0", video_file]
+        result = ffmpeg_utils.run_ffprobe_command(cmd)
+        if result.returncode == 0 and result.stdout.strip():
+            # O formato da saída é "width x height", por exemplo "1920x1080"
+            dimensions = result.stdout.strip().split('x')
+            if len(dimensions) == 2:
+                return int(dimensions[0]), int(dimensions[1])
+        return None
+    except Exception as e:
+        print(f"Erro ao obter resolução: {str(e)}")
+        return None
+
+
+def check_resolution_compatibility(input_res, cover_res, selo_res):
+    """Verifica a compatibilidade entre as resoluções e determina quais arquivos precisam ser redimensionados"""
+    input_width, input_height = input_res
+    cover_width, cover_height = cover_res
+    selo_width, selo_height = selo_res
+
+    # Calcular a proporção (aspect ratio) do vídeo de entrada
+    input_aspect_ratio = input_width / input_height
+
+    # Inicializar o dicionário de resultado
+    result = {
+        'input_resolution': input_res,
+        'cover_needs_resize': False,
+        'selo_needs_resize': False,
+        'aspect_ratio': input_aspect_ratio,
+        'is_vertical': input_height > input_width,
+        'resize_filters': {}
+    }
+
+    # Verificar se a imagem de capa precisa ser redimensionada
+    if cover_width != input_width or cover_height != input_height:
+        result['cover_needs_resize'] = True
+        result['resize_filters']['cover'] = f"scale={input_width}:{input_height}"
+
+    # Verificar se o vídeo do selo precisa ser redimensionado
+    if selo_width != input_width or selo_height != input_height:
+        result['selo_needs_resize'] = True
+        result['resize_filters']['selo'] = f"scale={input_width}:{input_height}"
+
+    return result
+
+
+def create_segments(total_duration, min_duration, max_duration, start_index, seed=None):
+    """Divide o vídeo em segmentos com duração aleatória entre min_duration e max_duration
+
+    Com a mesma semente (seed), o mesmo vídeo gera sempre o mesmo plano, o que permite
+    conferir o plano com uma prévia antes da renderização completa.
+    """
+    rng = random.Random(seed) if seed is not None else random
+    segments = []
+    current_time = 0
+    part_number = start_index
+
+    while current_time < total_duration:
+        # Gerar uma duração aleatória entre min_duration e max_duration
+        duration = rng.randint(min_duration, max_duration)
+
+        # Garantir que não ultrapasse a duração total do vídeo
+        if current_time + duration > total_duration:
+            duration = total_duration - current_time
+
+        # Adicionar o segmento apenas se tiver pelo menos 10 segundos
+        if duration >= 10:
+            segments.append({
+                'start_time': current_time,
+                'duration': duration,
+                'part_number': part_number
+            })
+            part_number += 1
+
+        current_time += duration
+
+        # Se o tempo restante for menor que a duração mínima, ajustar o último segmento
+        if total_duration - current_time < min_duration and total_duration - current_time > 0:
+            # Ajustar o último segmento para incluir o tempo restante
+            if segments:
+                last_segment = segments[-1]
+                last_segment['duration'] += total_duration - current_time
+            current_time = total_duration
+
+    return segments
+
+
+def get_output_file(output_directory, output_prefix, part_number):
+    """Constrói o nome do arquivo de saída de uma parte"""
+    return os.path.join(output_directory, f"{output_prefix}{part_number}.mp4")
+
+
+def get_part_output_file(job, output_directory, part_number):
+    """Saída principal de uma parte: o MP4 ou, com a opção 'packaging', a playlist HLS/CMAF da parte"""
+    if hls_packaging.get_packaging(job):
+        return hls_packaging.get_part_playlist(output_directory, job['output_prefix'], part_number)
+    return get_output_file(output_directory, job['output_prefix'], part_number)
+
+
+def remove_part_outputs(output_file, job):
+    """Remove tudo o que foi gerado para uma parte (arquivos incompletos ou reprovados)"""
+    if hls_packaging.get_packaging(job):
+        # A parte empacotada é uma pasta com playlists e segmentos
+        shutil.rmtree(hls_packaging.get_part_directory(output_file), ignore_errors=True)
+        return
+    for path in get_output_files(output_file, job) + list(get_side_output_files(output_file, job).values()):
+        ffmpeg_utils.remove_partial_output(path)
+
+
+def write_master_playlists(job, segments):
+    """Grava a playlist mestre de cada parte empacotada (com as suas versões) e o índice do trabalho
+
+    Returns:
+        str: caminho do índice do trabalho (JSON)
+    """
+    output_directory = get_job_output_directory(job)
+    input_res = get_video_resolution(job['input_file']) or DEFAULT_RESOLUTION
+    renditions = job.get('renditions') or []
+    parts = []
+    for segment in segments:
+        playlist = get_part_output_file(job, output_directory, segment['part_number'])
+        entries = [(playlist, input_res)]
+        for rendition in renditions:
+            entries.append((get_rendition_file(playlist, rendition),
+                            get_scaled_resolution(input_res, rendition['short_side'])))
+        master_file = hls_packaging.write_master_playlist(
+            hls_packaging.get_master_playlist(playlist), entries, segment['duration'])
+        if master_file:
+            parts.append((segment['part_number'], segment['duration'], master_file))
+    index_file = hls_packaging.get_job_index(output_directory, job['output_prefix'])
+    return hls_packaging.write_job_index(index_file, parts)
+
+
+def get_rendition_file(output_file, rendition):
+    """Nome do arquivo de uma versão adicional: o nome da parte com o sufixo da versão"""
+    base, extension = os.path.splitext(output_file)
+    return f"{base}{rendition['suffix']}{extension}"
+
+
+def get_output_files(output_file, job):
+    """Todos os arquivos gerados para uma parte: a saída principal e as versões adicionais"""
+    if job.get('proxy'):
+        # A prévia gera apenas a saída principal
+        return [output_file]
+    return [output_file] + [get_rendition_file(output_file, rendition) for rendition in job.get('renditions') or []]
+
+
+def get_side_outputs(job):
+    """Configuração das saídas auxiliares do trabalho, completada com os valores padrão"""
+    side_outputs = job.get('side_outputs')
+    if not side_outputs or job.get('proxy'):
+        return {}
+    if side_outputs is True:
+        side_outputs = DEFAULT_SIDE_OUTPUTS
+    return {kind: dict(DEFAULT_SIDE_OUTPUTS[kind], **(options if isinstance(options, dict) else {}))
+            for kind, options in side_outputs.items() if options and kind in DEFAULT_SIDE_OUTPUTS}
+
+
+def get_side_output_files(output_file, job):
+    """Arquivos das saídas auxiliares de uma parte, indexados pelo tipo"""
+    base = os.path.splitext(output_file)[0]
+    return {kind: base + SIDE_OUTPUT_SUFFIXES[kind] for kind in get_side_outputs(job)}
+
+
+def check_side_outputs(output_file, job):
+    """Erros das saídas auxiliares de uma parte (arquivos ausentes ou vazios)"""
+    errors = []
+    for path in get_side_output_files(output_file, job).values():
+        if not os.path.isfile(path) or os.path.getsize(path) == 0:
+            errors.append(f"{os.path.basename(path)}: saída auxiliar ausente ou vazia")
+    return errors
+
+
+def get_job_output_directory(job):
+    """Retorna a pasta de saída de um trabalho (por padrão, a pasta do vídeo de entrada)"""
+    return job.get('output_directory') or os.path.dirname(job['input_file']) or os.getcwd()
+
+
+def get_drawtext_font_option():
+    """Retorna a opção de fonte do drawtext para o sistema atual"""
+    if os.name == 'nt':
+        return r"fontfile='C\:/Windows/Fonts/arial.ttf':"
+    # Em outros sistemas, deixar o FFmpeg usar a fonte padrão do fontconfig
+    return ""
+
+
+def build_filter_complex(current_time, duration, part_number, resolution_info,
+                         chroma_color="0x00d600", similarity=0.30, blend=0.35,
+                         target_resolution=None, fps=None, crop=None):
+    """Constrói o filter_complex de uma parte (corte, selo com chroma key, capa e texto)
+
+    target_resolution e fps permitem gerar a saída em resolução/taxa de quadros reduzidas
+    (modo de prévia); nesse caso o vídeo é reduzido antes das sobreposições.
+    crop é o filtro de recorte do reenquadramento (auto_reframe), aplicado logo após o corte;
+    nesse caso resolution_info deve ter sido calculado com a resolução recortada.
+    """
+    input_res = resolution_info['input_resolution']
+    scale_output = target_resolution is not None and tuple(target_resolution) != tuple(input_res)
+    output_width, output_height = target_resolution if scale_output else input_res
+
+    segment_filters = f"trim=start={current_time}:duration={duration},setpts=PTS-STARTPTS"
+    if crop:
+        segment_filters += f",{crop}"
+    if scale_output:
+        segment_filters += f",scale={output_width}:{output_height}"
+    if fps:
+        segment_filters += f",fps={fps}"
+    filter_complex = [
+        f"[0:v]{segment_filters}[segment];"
+    ]
+
+    # Adicionar redimensionamento para o selo se necessário
+    if scale_output:
+        filter_complex.append(f"[2:v]format=rgba,scale={output_width}:{output_height},setpts=PTS-STARTPTS[selo_rgba];")
+    elif resolution_info['selo_needs_resize']:
+        filter_complex.append(f"[2:v]format=rgba,{resolution_info['resize_filters']['selo']},setpts=PTS-STARTPTS[selo_rgba];")
+    else:
+        filter_complex.append(f"[2:v]format=rgba,setpts=PTS-STARTPTS[selo_rgba];")
+
+    # Aplicar chroma key ao selo
+    filter_complex.append(f"[selo_rgba]colorkey=color={chroma_color}:similarity={similarity}:blend={blend}[selo_chroma];")
+    filter_complex.append(f"[selo_chroma]tpad=start_duration=10:color=black@0.0[selo_padded];")
+
+    # Sobrepor o selo ao segmento de vídeo
+    filter_complex.append(f"[segment][selo_padded]overlay=(W-w)/2:(H-h)/2:eof_action=pass[main_with_selo];")
+
+    # Adicionar redimensionamento para a imagem de capa se necessário
+    if scale_output or resolution_info['cover_needs_resize']:
+        cover_scale = f"scale={output_width}:{output_height}" if scale_output else resolution_info['resize_filters']['cover']
+        # Primeiro redimensionar a imagem de capa
+        filter_complex.append(f"[1:v]{cover_scale}[cover_resized];")
+        # Depois sobrepor a imagem redimensionada
+        filter_complex.append(f"[main_with_selo][cover_resized]overlay=(W-w)/2:(H-h)/2:enable='eq(n,0)'[with_image];")
+    else:
+        # Usar a imagem original se não precisar de redimensionamento
+        filter_complex.append(f"[main_with_selo][1:v]overlay=(W-w)/2:(H-h)/2:enable='eq(n,0)'[with_image];")
+
+    # Calcular um tamanho de fonte proporcional à resolução
+    # Para 1080x1920, usamos fonte 150. Para outras resoluções, ajustamos proporcionalmente
+    font_size = int(min(output_width, output_height) * 0.14)  # 150 / 1080 ≈ 0.14
+
+    filter_complex.append(f"[with_image]drawtext=text='Parte {part_number}':{get_drawtext_font_option()}fontsize={font_size}:fontcolor=white:borderw={font_size//7}:bordercolor=black:x=(w-text_w)/2:y=(h-text_h)/2:enable='eq(n,0)'[final_v];")
+    filter_complex.append(f"[0:a]atrim=start={current_time}:duration={duration},asetpts=PTS-STARTPTS[final_a]")
+
+    return "".join(filter_complex)
+
+
+def get_scaled_resolution(input_res, short_side):
+    """Reduz a resolução até o lado menor informado, mantendo a proporção (dimensões pares, exigidas pelo H.264)"""
+    input_width, input_height = input_res
+    # Para vídeos verticais, limitar a largura (lado menor) em vez da altura
+    current_short_side = min(input_width, input_height)
+    if current_short_side <= short_side:
+        return input_width - input_width % 2, input_height - input_height % 2
+    factor = short_side / current_short_side
+    return int(round(input_width * factor / 2)) * 2, int(round(input_height * factor / 2)) * 2
+
+
+def get_proxy_resolution(input_res, proxy_height):
+    """Calcula a resolução da prévia mantendo a proporção"""
+    return get_scaled_resolution(input_res, proxy_height)
+
+
+def add_rendition_outputs(filter_complex_str, rendition_resolutions):
+    """Divide o vídeo e o áudio finais entre a saída principal e as versões adicionais
+
+    O vídeo é decodificado e sobreposto uma única vez; cada versão recebe apenas o seu scale.
+
+    Returns:
+        tuple: (filter_complex, lista de pares (rótulo de vídeo, rótulo de áudio), um por saída)
+    """
+    count = len(rendition_resolutions) + 1
+    if count == 1:
+        return filter_complex_str, [("[final_v]", "[final_a]")]
+
+    video_labels = [f"[v{i}]" for i in range(count)]
+    audio_labels = [f"[a{i}]" for i in range(count)]
+    filters = [filter_complex_str,
+               f";[final_v]split={count}{''.join(video_labels)}",
+               f";[final_a]asplit={count}{''.join(audio_labels)}"]
+    outputs = [(video_labels[0], audio_labels[0])]
+    for i, (width, height) in enumerate(rendition_resolutions, start=1):
+        filters.append(f";{video_labels[i]}scale={width}:{height}[v{i}_scaled]")
+        outputs.append((f"[v{i}_scaled]", audio_labels[i]))
+    return "".join(filters), outputs
+
+
+def add_side_outputs(filter_complex_str, side_outputs, side_files, input_res, duration):
+    """Acrescenta as saídas auxiliares ao filter_complex de uma parte
+
+    O vídeo e o áudio finais ([final_v] e [final_a]) são divididos entre a saída principal, que
+    continua usando os mesmos rótulos, e as saídas auxiliares. Deve ser aplicado antes de
+    add_rendition_outputs.
+
+    Returns:
+        tuple: (filter_complex, lista de parâmetros do FFmpeg de cada saída auxiliar)
+    """
+    if not side_outputs:
+        return filter_complex_str, []
+    video_kinds = [kind for kind in ('thumbnail', 'preview') if kind in side_outputs]
+    filters = [filter_complex_str.replace("[final_v]", "[composed_v]").replace("[final_a]", "[composed_a]")]
+    if video_kinds:
+        labels = "".join(f"[side_{kind}]" for kind in video_kinds)
+        filters.append(f";[composed_v]split={len(video_kinds) + 1}[final_v]{labels}")
+    else:
+        filters.append(";[composed_v]null[final_v]")
+    if 'waveform' in side_outputs:
+        filters.append(";[composed_a]asplit=2[final_a][side_waveform]")
+    else:
+        filters.append(";[composed_a]anull[final_a]")
+
+    output_args = []
+    if 'thumbnail' in side_outputs:
+        options = side_outputs['thumbnail']
+        # Instante limitado à duração da parte
+        offset = max(0.0, min(float(options['offset']), duration - 1.0))
+        width, height = get_scaled_resolution(input_res, options['short_side'])
+        filters.append(f";[side_thumbnail]trim=start={offset:.3f},select='eq(n,0)',scale={width}:{height}[thumbnail_v]")
+        output_args.append(["-map", "[thumbnail_v]", "-frames:v", "1", "-q:v", "3", "-update", "1",
+                            side_files['thumbnail']])
+    if 'preview' in side_outputs:
+        options = side_outputs['preview']
+        start = max(0.0, min(float(options['start']), duration - float(options['duration'])))
+        width, height = get_scaled_resolution(input_res, options['short_side'])
+        filters.append(f";[side_preview]trim=start={start:.3f}:duration={options['duration']},setpts=PTS-STARTPTS,"
+                       f"fps={options['fps']},scale={width}:{height}[preview_v]")
+        output_args.append(["-map", "[preview_v]", "-an"] + get_proxy_encoder_params() +
+                           ["-movflags", "+faststart", side_files['preview']])
+    if 'waveform' in side_outputs:
+        options = side_outputs['waveform']
+        filters.append(f";[side_waveform]showwavespic=s={options['size']}:split_channels=0:colors={options['color']}[waveform_v]")
+        output_args.append(["-map", "[waveform_v]", "-frames:v", "1", "-update", "1", side_files['waveform']])
+    return "".join(filters), output_args
+
+
+def get_rendition_encoder_params(encoder_params, encoder_name, bitrate=None):
+    """Acrescenta o limite de taxa de uma versão aos parâmetros do codificador"""
+    if not bitrate:
+        return list(encoder_params)
+    value = float(bitrate.rstrip("kKmM")) * (1000 if bitrate[-1] in "kK" else 1000000 if bitrate[-1] in "mM" else 1)
+    limit = ["-maxrate", bitrate, "-bufsize", str(int(value * 2))]
+    if not encoder_registry.uses_crf(encoder_name):
+        # Codificadores de hardware usam -b:v como alvo do modo vbr
+        limit = ["-b:v", bitrate] + limit
+    return list(encoder_params) + limit
+
+
+def get_proxy_encoder_params():
+    """Parâmetros de codificação da prévia: o mais rápido possível no CPU"""
+    return ["-c:v", "libx264", "-preset", "ultrafast", "-crf", "32", "-pix_fmt", "yuv420p"]
+
+
+def parse_part_list(text):
+    """Converte uma lista de partes como "1-5, 10" em um conjunto de números (vazio = todas)"""
+    parts = set()
+    for item in text.replace(";", ",").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        if "-" in item:
+            first, last = item.split("-", 1)
+            parts.update(range(int(first), int(last) + 1))
+        else:
+            parts.add(int(item))
+    return parts
+
+
+def get_hwaccel_args(encoder_name, gpu_vendor):
+    """Retorna os parâmetros de aceleração de hardware para a decodificação"""
+    # Configurar o acelerador de hardware com base no fabricante da GPU e no codificador
+    hwaccel_args = encoder_registry.get_hwaccel_args(encoder_name)
+    if hwaccel_args:
+        return hwaccel_args
+    elif gpu_vendor == "amd":
+        # Fallback para AMD se o codificador não for específico
+        return ["-hwaccel", "d3d11va"]
+    elif gpu_vendor == "nvidia":
+        # Fallback para NVIDIA se o codificador não for específico
+        return ["-hwaccel", "cuda"]
+    elif gpu_vendor == "intel":
+        # Fallback para Intel se o codificador não for específico
+        return ["-hwaccel", "qsv"]
+    return []
+
+
+def _build_input_args(input_file, image_file, selo_file, encoder_name, gpu_vendor,
+                      input_seek, global_thread_args, decoder_thread_args):
+    """Parte inicial do comando: opções globais e as três entradas (0=vídeo, 1=capa, 2=selo)"""
+    ffmpeg_cmd = ["ffmpeg"]
+    ffmpeg_cmd.extend(global_thread_args)
+    ffmpeg_cmd.extend(get_hwaccel_args(encoder_name, gpu_vendor))
+
+    if input_seek:
+        ffmpeg_cmd.extend(["-ss", f"{input_seek:.3f}"])
+    ffmpeg_cmd.extend(decoder_thread_args)
+    ffmpeg_cmd.extend([
+        "-i", input_file,
+        "-i", image_file,
+        "-i", selo_file,
+    ])
+    return ffmpeg_cmd
+
+
+def _build_output_args(video_label, audio_label, encoder_params, encoder_thread_args, audio_bitrate, output_file,
+                       packaging=None):
+    """Opções de uma saída (MP4, ou HLS/CMAF com packaging): mapeamento, codificadores e finalização"""
+    output_args = ["-map", video_label, "-map", audio_label]
+
+    # Adicionar parâmetros do codificador de vídeo
+    output_args.extend(encoder_params)
+    output_args.extend(encoder_thread_args)
+
+    # Adicionar parâmetros de áudio e finalização
+    output_args.extend(["-c:a", "aac", "-b:a", audio_bitrate])
+    if packaging:
+        # Segmentos gravados durante a codificação, sem segunda passagem
+        output_args.extend(hls_packaging.get_output_args(packaging, output_file))
+    else:
+        output_args.extend(["-movflags", "+faststart", output_file])
+    return output_args
+
+
+def build_ffmpeg_command(input_file, image_file, selo_file, filter_complex_str,
+                         encoder_name, encoder_params, output_file, gpu_vendor="unknown",
+                         input_seek=None, audio_bitrate="192k", threads=None, packaging=None, side_outputs=(),
+                         resolution=None):
+    """Monta o comando FFmpeg completo de uma parte
+
+    Com input_seek, o vídeo de entrada é posicionado no início do segmento antes da
+    decodificação (o filter_complex deve então cortar a partir do tempo 0).
+    Com threads, o FFmpeg usa essa cota de threads em vez de dimensionar codificador,
+    decodificador e filtros pelo número total de núcleos (ver resource_governor); resolution
+    (largura, altura) da saída ajusta a cota do codificador (encoder_registry.get_thread_args).
+    side_outputs são os parâmetros das saídas auxiliares (add_side_outputs), acrescentados ao final.
+    """
+    global_thread_args, decoder_thread_args, encoder_thread_args = \
+        resource_governor.ffmpeg_thread_args(threads, encoder_name, resolution)
+
+    ffmpeg_cmd = _build_input_args(input_file, image_file, selo_file, encoder_name, gpu_vendor,
+                                   input_seek, global_thread_args, decoder_thread_args)
+    ffmpeg_cmd.extend(["-filter_complex", filter_complex_str])
+    ffmpeg_cmd.extend(_build_output_args("[final_v]", "[final_a]", encoder_params, encoder_thread_args,
+                                         audio_bitrate, output_file, packaging))
+    for output_args in side_outputs:
+        ffmpeg_cmd.extend(output_args)
+    return ffmpeg_cmd
+
+
+def build_rendition_command(input_file, image_file, selo_file, filter_complex_str, encoder_name,
+                            outputs, gpu_vendor="unknown", audio_bitrate="192k", threads=None, packaging=None,
+                            side_outputs=(), resolution=None):
+    """Monta um comando FFmpeg com várias saídas a partir de um único filter_complex
+
+    Args:
+        outputs (list): (rótulo de vídeo, rótulo de áudio, parâmetros do codificador, arquivo) por saída
+        side_outputs (list): parâmetros das saídas auxiliares (add_side_outputs)
+        resolution (tuple): resolução da maior saída, para as dicas de threads do codificador
+    """
+    # A cota de threads do codificador é dividida entre as saídas
+    encoder_threads = max(1, threads // len(outputs)) if threads else None
+    global_thread_args, decoder_thread_args, _ = resource_governor.ffmpeg_thread_args(threads, encoder_name)
+    _, _, encoder_thread_args = resource_governor.ffmpeg_thread_args(encoder_threads, encoder_name, resolution)
+
+    ffmpeg_cmd = _build_input_args(input_file, image_file, selo_file, encoder_name, gpu_vendor,
+                                   None, global_thread_args, decoder_thread_args)
+    ffmpeg_cmd.extend(["-filter_complex", filter_complex_str])
+    for video_label, audio_label, encoder_params, output_file in outputs:
+        ffmpeg_cmd.extend(_build_output_args(video_label, audio_label, encoder_params, encoder_thread_args,
+                                             audio_bitrate, output_file, packaging))
+    for output_args in side_outputs:
+        ffmpeg_cmd.extend(output_args)
+    return ffmpeg_cmd
+
+
+def parse_progress_time(line):
+    """Extrai o tempo processado (em segundos) de uma linha de progresso do FFmpeg"""
+    match = re.search(r'out_time=(\d+):(\d+):(\d+(?:\.\d+)?)', line) or re.search(r'time=(\d+):(\d+):(\d+(?:\.\d+)?)', line)
+    if not match:
+        return None
+    h, m, s = match.groups()
+    return int(h) * 3600 + int(m) * 60 + float(s)
+
+
+def parse_progress_stats(line):
+    """Extrai ('fps' ou 'speed', valor) de uma linha de -progress do FFmpeg, ou None"""
+    match = re.match(r'\s*(fps|speed)=\s*(\d+(?:\.\d+)?)x?\s*$', line)
+    if not match:
+        return None
+    return match.group(1), float(match.group(2))
+
+
+def get_slot_encoder(job, slot=None, speed_profile=None):
+    """Codificador da parte: o do pool da vaga (opção 'encoder_pools'), o pedido pelo trabalho
+    (opção 'encoder') ou o melhor disponível
+
+    Com 'tuned_quality' (bitrate_optimizer), o valor de qualidade ajustado para a entrada substitui
+    o do perfil quando o codificador e o perfil são os mesmos da análise.
+    """
+    if slot is not None and slot.pool is not None:
+        return slot.pool.encoder, list(slot.pool.params)
+    speed_profile = speed_profile or job.get('speed_profile', "balanced")
+    encoder_name, encoder_params = ffmpeg_utils.get_video_encoder(speed_profile, encoder=job.get('encoder'))
+    tuned = job.get('tuned_quality')
+    if tuned and tuned['encoder'] == encoder_name and tuned['speed_profile'] == speed_profile:
+        encoder_params = encoder_registry.set_quality_value(encoder_name, encoder_params, tuned['value'])
+    return encoder_name, encoder_params
+
+
+def render_segment(job, segment, output_file=None, log=print, progress=None, should_stop=None, slot=None,
+                   on_process=None, stats=None, force_keyframe=None):
+    """Renderiza uma parte sem depender da interface gráfica
+
+    Args:
+        job (dict): Configuração do trabalho (mesmos campos do ParallelProcessor)
+        segment (dict): Segmento com 'start_time', 'duration' e 'part_number'
+        output_file (str): Caminho de saída; por padrão segue o esquema {prefixo}{parte}.mp4
+        log (callable): Função usada para mensagens de log
+        progress (callable): Chamada com o tempo processado (s) da parte
+        should_stop (callable): Retorna True quando o processamento deve ser interrompido
+        slot (resource_governor.Slot): Vaga com a cota de threads, núcleos e prioridade do processo
+        on_process (callable): Chamada com o Popen do FFmpeg ao iniciar e com None ao terminar,
+            para que o chamador possa encerrá-lo imediatamente ao cancelar
+        stats (dict): Preenchido com 'fps' e 'speed' médios informados pelo FFmpeg
+        force_keyframe (float): Tempo (s) da parte onde um quadro-chave é forçado (fim da cabeça do render_cache)
+
+    Returns:
+        bool: True se o FFmpeg terminou com sucesso
+    """
+    output_directory = get_job_output_directory(job)
+    proxy = job.get('proxy')
+    if proxy:
+        # As prévias ficam em uma subpasta para não serem confundidas com as partes finais
+        output_directory = os.path.join(output_directory, PROXY_SUBFOLDER)
+    if output_file is None:
+        output_file = get_part_output_file(job, output_directory, segment['part_number'])
+    # Com empacotamento HLS/CMAF, a saída fica na pasta da própria parte
+    os.makedirs(os.path.dirname(output_file) or ".", exist_ok=True)
+    packaging = hls_packaging.get_packaging(job)
+
+    input_res = get_video_resolution(job['input_file']) or DEFAULT_RESOLUTION
+    # Reenquadramento (opção 'reframe'): a parte passa a ter a resolução do recorte vertical
+    crop = None
+    reframe = auto_reframe.get_segment_crop(job, segment, input_res, log=log)
+    if reframe is not None:
+        crop, input_res = reframe
+    cover_res = get_video_resolution(job['image_file']) or DEFAULT_RESOLUTION
+    selo_res = get_video_resolution(job['selo_file']) or DEFAULT_RESOLUTION
+    resolution_info = check_resolution_compatibility(input_res, cover_res, selo_res)
+    chroma_args = (job.get('chroma_color', "0x00d600"), job.get('similarity', 0.30), job.get('blend', 0.35))
+
+    if proxy:
+        # Prévia: busca direta no início do segmento, resolução e fps reduzidos, x264 ultrafast
+        proxy_res = get_proxy_resolution(input_res, proxy.get('height', PROXY_DEFAULTS['height']))
+        filter_complex_str = build_filter_complex(
+            0, segment['duration'], segment['part_number'], resolution_info, *chroma_args,
+            target_resolution=proxy_res, fps=proxy.get('fps', PROXY_DEFAULTS['fps']), crop=crop
+        )
+        ffmpeg_cmd = build_ffmpeg_command(
+            job['input_file'], job['image_file'], job['selo_file'], filter_complex_str,
+            "libx264", get_proxy_encoder_params(), output_file,
+            input_seek=segment['start_time'], audio_bitrate="64k",
+            threads=slot.threads if slot else None, resolution=proxy_res
+        )
+    elif job.get('renditions'):
+        # Versões adicionais: uma decodificação e uma sobreposição, um codificador por versão
+        filter_complex_str, side_args = add_side_outputs(
+            build_filter_complex(segment['start_time'], segment['duration'], segment['part_number'],
+                                 resolution_info, *chroma_args, crop=crop),
+            get_side_outputs(job), get_side_output_files(output_file, job), input_res, segment['duration'])
+        renditions = job['renditions']
+        filter_complex_str, labels = add_rendition_outputs(
+            filter_complex_str, [get_scaled_resolution(input_res, rendition['short_side']) for rendition in renditions])
+        speed_profile = job.get('speed_profile', "balanced")
+        encoder_name, encoder_params = get_slot_encoder(job, slot, speed_profile)
+        outputs = [(labels[0][0], labels[0][1], encoder_params, output_file)]
+        for (video_label, audio_label), rendition in zip(labels[1:], renditions):
+            rendition_profile = rendition.get('speed_profile')
+            if rendition_profile and slot is not None and slot.pool is not None \
+                    and encoder_registry.get_entry(slot.pool.encoder) is not None:
+                # Nas vagas de um pool, o perfil próprio da versão vale para o codificador do pool
+                rendition_params = ffmpeg_utils.get_encoder_params(slot.pool.encoder, rendition_profile)
+            else:
+                _, rendition_params = get_slot_encoder(job, slot, rendition_profile or speed_profile)
+            outputs.append((video_label, audio_label,
+                            get_rendition_encoder_params(rendition_params, encoder_name, rendition.get('bitrate')),
+                            get_rendition_file(output_file, rendition)))
+        ffmpeg_cmd = build_rendition_command(
+            job['input_file'], job['image_file'], job['selo_file'], filter_complex_str,
+            encoder_name, outputs, ffmpeg_utils.detect_gpu_vendor(),
+            threads=slot.threads if slot else None, packaging=packaging, side_outputs=side_args,
+            resolution=input_res
+        )
+    else:
+        # Saídas auxiliares (miniatura, clipe curto, forma de onda) separadas do vídeo já sobreposto
+        filter_complex_str, side_args = add_side_outputs(
+            build_filter_complex(segment['start_time'], segment['duration'], segment['part_number'],
+                                 resolution_info, *chroma_args, crop=crop),
+            get_side_outputs(job), get_side_output_files(output_file, job), input_res, segment['duration'])
+        encoder_name, encoder_params = get_slot_encoder(job, slot)
+        if force_keyframe and encoder_name != "copy":
+            encoder_params = encoder_params + ["-force_key_frames", f"{force_keyframe:.3f}"]
+        ffmpeg_cmd = build_ffmpeg_command(
+            job['input_file'], job['image_file'], job['selo_file'], filter_complex_str,
+            encoder_name, encoder_params, output_file, ffmpeg_utils.detect_gpu_vendor(),
+            threads=slot.threads if slot else None, packaging=packaging, side_outputs=side_args,
+            resolution=input_res
+        )
+
+    log(f"Processando parte {segment['part_number']} (tempo: {segment['start_time']:.2f}s, duração: {segment['duration']:.2f}s)...")
+    process = ffmpeg_utils.run_ffmpeg_command(ffmpeg_cmd, **(slot.popen_kwargs() if slot else {}))
+    if slot:
+        slot.apply(process)
+    if on_process:
+        on_process(process)
+
+    try:
+        # Consumir a saída do FFmpeg para que o pipe nunca fique cheio
+        for raw_line in iter(process.stdout.readline, b''):
+            if should_stop and should_stop():
+                ffmpeg_utils.kill_process_trees([process])
+                break
+            line = raw_line.decode('utf-8', errors='ignore')
+            seconds = parse_progress_time(line)
+            if seconds is not None and progress:
+                progress(seconds)
+            if stats is not None:
+                # O FFmpeg informa as médias desde o início da parte
+                stat = parse_progress_stats(line)
+                if stat:
+                    stats[stat[0]] = stat[1]
+        process.wait()
+    except BaseException:
+        # O FFmpeg roda em uma sessão própria e não recebe o Ctrl+C do terminal: encerrá-lo
+        # antes de propagar a interrupção, para não deixar o processo órfão codificando
+        ffmpeg_utils.kill_process_trees([process])
+        remove_part_outputs(output_file, job)
+        raise
+    finally:
+        if on_process:
+            on_process(None)
+
+    if should_stop and should_stop():
+        # Cancelado: não deixar um MP4 pela metade na pasta de saída
+        remove_part_outputs(output_file, job)
+        log(f"Parte {segment['part_number']} cancelada.")
+        return False
+    if process.returncode != 0:
+        remove_part_outputs(output_file, job)
+        log(f"Erro ao processar parte {segment['part_number']} (código {process.returncode}).")
+        return False
+
+    log(f"Parte {segment['part_number']} processada e salva com sucesso!")
+    return True
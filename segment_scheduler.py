@@ -0,0 +1,160 @@
+"""Ordem em que as partes são entregues às vagas de processamento
+
+Na ordem do plano (FIFO), partes longas que ficam para o final (como a última parte, que recebe
+o restante do vídeo) deixam as outras vagas ociosas enquanto terminam. Estratégias:
+
+    "fifo":        ordem do plano
+    "lpt":         maior custo primeiro (longest processing time), minimiza o tempo total
+    "first_part":  a primeira parte antes de todas, para entregá-la o quanto antes; o resto em LPT
+    "sequential":  o plano é dividido em um trecho contínuo por vaga e os trechos são intercalados,
+                   então cada processo lê a entrada em sequência (favorece a leitura antecipada do disco)
+    "auto":        LPT quando a simulação com os custos estimados indica ganho sobre a ordem do plano
+
+O custo estimado de uma parte é a sua duração mais a decodificação do trecho anterior ao seu
+início: o corte é feito pelo filtro trim, então o FFmpeg decodifica a entrada desde o começo.
+
+Benchmark (tempo total de cada estratégia comparado à ordem do plano):
+    python segment_scheduler.py benchmark --input video.mp4 --image capa.png --selo selo.mp4 --parallel 4
+    python segment_scheduler.py benchmark ... --simulate      (apenas a estimativa, sem renderizar)
+"""
+import heapq
+
+STRATEGIES = ("auto", "fifo", "lpt", "first_part", "sequential")
+# Custo de decodificar (sem codificar) um segundo da entrada, relativo a renderizar um segundo da parte
+DECODE_COST = 0.1
+# O mesmo custo em tempo absoluto: segundos de relógio para decodificar um segundo da entrada. Usado
+# pela calibração, que mede a vazão da codificação e soma a decodificação em segundos de relógio
+DECODE_SECONDS = 0.01
+# Custo fixo de cada parte (início do FFmpeg, sondagem, verificação), em segundos de vídeo equivalentes
+PART_OVERHEAD = 2.0
+# Ganho mínimo estimado para o modo "auto" trocar a ordem do plano pela LPT
+AUTO_MIN_GAIN = 0.02
+
+
+def estimate_costs(segments):
+    """Custo relativo de cada parte, indexado pelo número da parte"""
+    return {segment['part_number']: segment['duration'] + segment['start_time'] * DECODE_COST + PART_OVERHEAD
+            for segment in segments}
+
+
+def simulate_makespan(ordered_segments, costs, slot_count):
+    """Tempo total (em unidades de custo) com as partes entregues em ordem à primeira vaga livre"""
+    slots = [0.0] * max(1, slot_count)
+    for segment in ordered_segments:
+        heapq.heapreplace(slots, slots[0] + costs[segment['part_number']])
+    return max(slots)
+
+
+def _sequential_order(segments, slot_count):
+    plan = sorted(segments, key=lambda segment: segment['start_time'])
+    run_length = -(-len(plan) // max(1, slot_count))
+    runs = [plan[i:i + run_length] for i in range(0, len(plan), run_length)]
+    return [run[index] for index in range(run_length) for run in runs if index < len(run)]
+
+
+def order_segments(segments, strategy="auto", slot_count=1, costs=None):
+    """Retorna as partes na ordem em que devem ser processadas
+
+    Returns:
+        tuple: (partes ordenadas, estratégia usada)
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Estratégia de ordenação inválida: {strategy}")
+    costs = costs or estimate_costs(segments)
+    by_cost = sorted(segments, key=lambda segment: costs[segment['part_number']], reverse=True)
+
+    if strategy == "auto":
+        if len(segments) <= slot_count:
+            return list(segments), "fifo"
+        fifo_makespan = simulate_makespan(segments, costs, slot_count)
+        lpt_makespan = simulate_makespan(by_cost, costs, slot_count)
+        if lpt_makespan < fifo_makespan * (1.0 - AUTO_MIN_GAIN):
+            return by_cost, "lpt"
+        return list(segments), "fifo"
+    if strategy == "lpt":
+        return by_cost, strategy
+    if strategy == "first_part":
+        first = min(segments, key=lambda segment: segment['part_number'])
+        return [first] + [segment for segment in by_cost if segment is not first], strategy
+    if strategy == "sequential":
+        return _sequential_order(segments, slot_count), strategy
+    return list(segments), strategy
+
+
+def describe_order(ordered_segments, strategy, slot_count, costs=None, plan_segments=None):
+    """Resumo da estratégia com o ganho estimado sobre a ordem do plano"""
+    costs = costs or estimate_costs(ordered_segments)
+    makespan = simulate_makespan(ordered_segments, costs, slot_count)
+    fifo_makespan = simulate_makespan(plan_segments or ordered_segments, costs, slot_count)
+    gain = (1.0 - makespan / fifo_makespan) * 100 if fifo_makespan else 0.0
+    return f"Ordem das partes: {strategy} (ganho estimado de {gain:.1f}% no tempo total sobre a ordem do plano)"
+
+
+def run_benchmark(job, parallel_count, strategies, simulate=False):
+    """Renderiza o plano com cada estratégia e compara o tempo total com a ordem do plano (FIFO)"""
+    import shutil
+    import tempfile
+    import time
+
+    import cut_planner
+    import segment_render
+    from job_engine import ParallelJob
+
+    total_duration = segment_render.get_video_duration(job['input_file'])
+    if total_duration <= 0:
+        raise RuntimeError(f"Não foi possível obter a duração de {job['input_file']}")
+    segments = cut_planner.plan_segments(job, total_duration)
+    costs = estimate_costs(segments)
+    fifo_makespan = simulate_makespan(segments, costs, parallel_count)
+
+    results = {}
+    for strategy in ["fifo"] + [name for name in strategies if name != "fifo"]:
+        ordered, used = order_segments(segments, strategy, parallel_count, costs)
+        estimated = simulate_makespan(ordered, costs, parallel_count)
+        line = f"{strategy:<11} estimado: {(1.0 - estimated / fifo_makespan) * 100:+5.1f}%"
+        if not simulate:
+            output_directory = tempfile.mkdtemp(prefix="video_cutter_ordem_")
+            started = time.time()
+            try:
+                ok = ParallelJob(dict(job, schedule=strategy, output_directory=output_directory,
+                                      parallel_count=parallel_count, record_history=False)).run()
+            finally:
+                shutil.rmtree(output_directory, ignore_errors=True)
+            results[strategy] = time.time() - started
+            line += f"   medido: {results[strategy]:.1f}s"
+            if strategy != "fifo":
+                line += f" ({(1.0 - results[strategy] / results['fifo']) * 100:+.1f}% sobre fifo)"
+            if not ok:
+                line += " (com erros)"
+        if used != strategy:
+            line += f"   [{used}]"
+        print(line)
+    return results
+
+
+def main(argv=None):
+    import argparse
+
+    from job_service import JOB_DEFAULTS
+
+    parser = argparse.ArgumentParser(description="Ordenação das partes entre as vagas")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    bench_parser = subparsers.add_parser("benchmark", help="Compara o tempo total de cada estratégia com a ordem do plano")
+    bench_parser.add_argument("--input", required=True)
+    bench_parser.add_argument("--image", required=True)
+    bench_parser.add_argument("--selo", required=True)
+    bench_parser.add_argument("--parallel", type=int, default=JOB_DEFAULTS['parallel_count'])
+    bench_parser.add_argument("--min-duration", type=int, default=JOB_DEFAULTS['min_duration'])
+    bench_parser.add_argument("--max-duration", type=int, default=JOB_DEFAULTS['max_duration'])
+    bench_parser.add_argument("--strategies", default="lpt,first_part,sequential,auto")
+    bench_parser.add_argument("--simulate", action="store_true", help="Apenas a estimativa, sem renderizar")
+    args = parser.parse_args(argv)
+
+    job = dict(JOB_DEFAULTS, input_file=args.input, image_file=args.image, selo_file=args.selo,
+               output_prefix="bench ", min_duration=args.min_duration, max_duration=args.max_duration, plan_seed=1)
+    strategies = [name.strip() for name in args.strategies.split(",") if name.strip()]
+    run_benchmark(job, args.parallel, strategies, args.simulate)
+
+
+if __name__ == "__main__":
+    main()
@@ -11,7 +11,19 @@ import io
 import queue
 import multiprocessing
 from pathlib import Path
+import chroma_estimate
+import chroma_preview
+import cut_planner
 import ffmpeg_utils
+import job_engine
+import job_history
+import hls_packaging
+import input_remux
+import job_service
+import output_verifier
+import resource_governor
+import segment_render
+import segment_scheduler
 import re
 
 print("Iniciando aplicação...")
@@ -21,14 +33,17 @@ try:
                                 QVBoxLayout, QHBoxLayout, QWidget, QFileDialog,
                                 QLineEdit, QSpinBox, QProgressBar, QTextEdit, QGroupBox,
                                 QMessageBox, QColorDialog, QDoubleSpinBox, QFrame, QGridLayout,
-                                QFormLayout, QComboBox, QCheckBox, QScrollArea)
+                                QFormLayout, QComboBox, QCheckBox, QScrollArea, QDialog, QSlider)
     from PyQt5.QtCore import Qt, QThread, pyqtSignal, QProcess, QMutex
-    from PyQt5.QtGui import QColor, QIcon
+    from PyQt5.QtGui import QColor, QIcon, QImage, QPixmap
     print("PyQt5 importado com sucesso!")
 except Exception as e:
     print(f"Erro ao importar PyQt5: {e}")
     traceback.print_exc()
 
+# Número de vezes que uma parte reprovada na verificação é recolocada na fila (o mesmo do motor)
+MAX_VERIFICATION_RETRIES = job_engine.MAX_VERIFICATION_RETRIES
+
 class ParallelProcessor(QThread):
     """Classe que gerencia múltiplos workers para processamento paralelo"""
     progress_signal = pyqtSignal(float)  # Progresso geral
@@ -40,7 +55,8 @@ class ParallelProcessor(QThread):
     def __init__(self, input_file, image_file, selo_file, output_prefix, start_index,
                  min_duration, max_duration, output_directory=None,
                  chroma_color="0x00d600", similarity=0.30, blend=0.35, speed_profile="balanced",
-                 restart_interval=5, parallel_count=2):
+                 restart_interval=5, parallel_count=2, plan_seed=None, pin_cores=False, background_priority=False,
+                 cut_planner_mode=None):
         super().__init__()
         self.input_file = input_file
         self.image_file = image_file
@@ -56,14 +72,22 @@ class ParallelProcessor(QThread):
         self.speed_profile = speed_profile
         self.restart_interval = restart_interval
         self.parallel_count = parallel_count
+        self.plan_seed = plan_seed  # Semente do plano de segmentos (mesma semente = mesmo plano da prévia)
+        self.pin_cores = pin_cores  # Fixar cada processo FFmpeg em núcleos exclusivos
+        self.background_priority = background_priority  # Rodar o FFmpeg em baixa prioridade
+        self.cut_planner_mode = cut_planner_mode  # Escolha dos pontos de corte (cut_planner.PLANNER_MODES)
+        self.render_input = input_file  # Arquivo lido pelas partes (a entrada reempacotada, se necessário)
 
         self.is_running = True
         self.workers = []
         self.active_workers = 0
         self.total_parts = 0
         self.parts_completed = 0
+        self.parts_failed = 0  # Partes com erro ou reprovadas na verificação após todas as tentativas
         self.total_duration = 0
         self.segments = []
+        self.recorder = None  # Histórico do trabalho (job_history)
+        self.processed_duration = 0  # Segundos de vídeo das partes concluídas
 
     def run(self):
         try:
@@ -83,8 +107,16 @@ class ParallelProcessor(QThread):
                 self.error_signal.emit(f"Arquivo de selo não encontrado: {self.selo_file}")
                 return
 
+            # Entrada sem índice de busca (MKV/TS do OBS): reempacotada uma vez e lida por todas as partes
+            remuxed = input_remux.prepare_input({'input_file': self.input_file}, log=self.log_signal.emit,
+                                                should_stop=lambda: not self.is_running)
+            if remuxed:
+                # A pasta de saída padrão continua sendo a da entrada original
+                self.output_directory = self.output_directory or os.path.dirname(self.input_file) or os.getcwd()
+                self.render_input = remuxed
+
             # Obter a duração total do vídeo
-            self.total_duration = self.get_video_duration(self.input_file)
+            self.total_duration = self.get_video_duration(self.render_input)
             if self.total_duration <= 0:
                 self.error_signal.emit("Não foi possível obter a duração do vídeo.")
                 return
@@ -99,75 +131,82 @@ class ParallelProcessor(QThread):
 
             self.log_signal.emit(f"Vídeo dividido em {self.total_parts} segmentos para processamento paralelo.")
 
+            # Registrar o trabalho no histórico e estimar o tempo pelo desempenho anterior
+            self.recorder = job_history.JobRecorder({
+                'input_file': self.input_file, 'speed_profile': self.speed_profile,
+                'parallel_count': self.parallel_count})
+            self.recorder.start(sum(segment['duration'] for segment in self.segments), self.total_parts)
+            self.log_signal.emit(self.recorder.describe_prediction())
+
             # Iniciar o processamento paralelo
             self.process_segments_parallel()
 
             # Verificar se o processo foi cancelado
             if not self.is_running:
+                self.recorder.finish("cancelled")
                 self.log_signal.emit("Processo cancelado pelo usuário.")
                 return
 
             # Finalizar o processamento
-            if self.is_running:
-                self.log_signal.emit(f"Processamento concluído com sucesso! {self.total_parts} vídeos foram gerados.")
+            if self.parts_failed:
+                self.recorder.finish("failed")
+                self.progress_signal.emit(100)
+                self.error_signal.emit(f"Processamento concluído com erros: {self.parts_completed} vídeos gerados, "
+                                       f"{self.parts_failed} com erro. Verifique o log.")
+            elif self.is_running:
+                self.recorder.finish("finished")
+                self.log_signal.emit(f"Processamento concluído com sucesso! {self.parts_completed} vídeos foram gerados.")
                 self.progress_signal.emit(100)
                 self.finished_signal.emit()
 
         except Exception as e:
+            if self.recorder is not None:
+                self.recorder.finish("failed")
             self.error_signal.emit(f"Erro durante o processamento: {str(e)}")
             traceback.print_exc()
+        finally:
+            # Só depois de todas as partes o arquivo reempacotado pode ser removido
+            if self.render_input != self.input_file:
+                input_remux.release_input(self.render_input)
 
     def create_segments(self):
         """Divide o vídeo em segmentos para processamento paralelo"""
-        segments = []
-        current_time = 0
-        part_number = self.start_index
-
-        # Dividir o vídeo em segmentos com duração aleatória
-        while current_time < self.total_duration:
-            # Gerar uma duração aleatória entre min_duration e max_duration
-            duration = random.randint(self.min_duration, self.max_duration)
-
-            # Garantir que não ultrapasse a duração total do vídeo
-            if current_time + duration > self.total_duration:
-                duration = self.total_duration - current_time
-
-            # Adicionar o segmento apenas se tiver pelo menos 10 segundos
-            if duration >= 10:
-                segments.append({
-                    'start_time': current_time,
-                    'duration': duration,
-                    'part_number': part_number
-                })
-                part_number += 1
-
-            current_time += duration
-
-            # Se o tempo restante for menor que a duração mínima, ajustar o último segmento
-            if self.total_duration - current_time < self.min_duration and self.total_duration - current_time > 0:
-                # Ajustar o último segmento para incluir o tempo restante
-                if segments:
-                    last_segment = segments[-1]
-                    last_segment['duration'] += self.total_duration - current_time
-                current_time = self.total_duration
-
-        return segments
+        job = {'input_file': self.input_file, 'min_duration': self.min_duration, 'max_duration': self.max_duration,
+               'start_index': self.start_index, 'plan_seed': self.plan_seed, 'cut_planner': self.cut_planner_mode}
+        return cut_planner.plan_segments(job, self.total_duration, log=self.log_signal.emit)
 
     def process_segments_parallel(self):
         """Processa os segmentos em paralelo"""
         # Fila de segmentos a serem processados
+        # Ordem escolhida pelos custos estimados das partes (segment_scheduler)
+        slot_count = min(self.parallel_count, len(self.segments))
+        ordered, strategy = segment_scheduler.order_segments(self.segments, "auto", slot_count)
+        self.log_signal.emit(segment_scheduler.describe_order(ordered, strategy, slot_count, plan_segments=self.segments))
         segment_queue = queue.Queue()
-        for segment in self.segments:
+        for segment in ordered:
             segment_queue.put(segment)
 
         # Criar e iniciar os workers
         self.workers = []
         self.active_workers = 0
         self.parts_completed = 0
+        self.parts_failed = 0
 
         # Mutex para acesso seguro às variáveis compartilhadas
         self.mutex = QMutex()
 
+        # Divisão das threads da CPU entre os processos FFmpeg simultâneos
+        self.governor = resource_governor.ResourceGovernor(
+            min(self.parallel_count, len(self.segments)), pin_cores=self.pin_cores,
+            background=self.background_priority)
+        self.log_signal.emit(f"Recursos: {self.governor.describe()}")
+
+        # Verificação das partes geradas, em paralelo com as codificações em andamento
+        self.verifier = output_verifier.OutputVerifier(max_workers=2)
+        self.verification_queue = queue.Queue()
+        self.pending_verifications = 0
+        self.verification_attempts = {}
+
         # Iniciar o número especificado de workers
         for i in range(min(self.parallel_count, len(self.segments))):
             if not self.is_running:
@@ -175,80 +214,155 @@ class ParallelProcessor(QThread):
 
             if not segment_queue.empty():
                 segment = segment_queue.get()
-                worker = VideoCutterWorker(
-                    self.input_file, self.image_file, self.selo_file, self.output_prefix,
-                    segment['part_number'], self.min_duration, self.max_duration, self.output_directory,
-                    self.chroma_color, self.similarity, self.blend, self.speed_profile,
-                    self.restart_interval, segment['start_time'], segment['duration']
-                )
-
-                # Conectar os sinais do worker
-                worker.log_signal.connect(self.log_signal.emit)
-                worker.status_signal.connect(self.status_signal.emit)
-                worker.finished_signal.connect(lambda w=worker, q=segment_queue: self.worker_finished(w, q))
-                worker.error_signal.connect(self.worker_error)
+                self.start_worker(segment, segment_queue)
+                self.log_signal.emit(f"Iniciando processamento paralelo da parte {segment['part_number']} (worker {i+1})")
 
-                # Iniciar o worker
-                worker.start()
-                self.workers.append(worker)
-                self.active_workers += 1
+        # Aguardar a conclusão de todos os workers e de todas as verificações
+        while (self.active_workers > 0 or self.pending_verifications > 0 or not segment_queue.empty()) and self.is_running:
+            self.handle_verification_results(segment_queue)
 
-                self.log_signal.emit(f"Iniciando processamento paralelo da parte {segment['part_number']} (worker {i+1})")
+            # Iniciar workers para partes recolocadas na fila após falharem na verificação
+            while self.active_workers < self.parallel_count and not segment_queue.empty() and self.is_running:
+                segment = segment_queue.get()
+                self.start_worker(segment, segment_queue)
+                self.log_signal.emit(f"Iniciando processamento da parte {segment['part_number']}")
 
-        # Aguardar a conclusão de todos os workers
-        while self.active_workers > 0 and self.is_running:
             QApplication.processEvents()
             time.sleep(0.1)
 
-    def worker_finished(self, worker, segment_queue):
-        """Chamado quando um worker termina o processamento"""
-        # Incrementar o contador de partes concluídas
+        self.verifier.shutdown(wait=self.is_running)
+        if self.is_running:
+            for line in self.verifier.report_lines():
+                self.log_signal.emit(line)
+
+    def start_worker(self, segment, segment_queue):
+        """Cria e inicia um worker para um segmento"""
+        # Sempre há uma vaga livre: no máximo parallel_count workers ativos
+        worker = VideoCutterWorker(
+            self.render_input, self.image_file, self.selo_file, self.output_prefix,
+            segment['part_number'], self.min_duration, self.max_duration, self.output_directory,
+            self.chroma_color, self.similarity, self.blend, self.speed_profile,
+            self.restart_interval, segment['start_time'], segment['duration'],
+            slot=self.governor.acquire()
+        )
+        if segment['part_number'] not in self.verification_attempts:
+            # Tempo de relógio da parte contado a partir da primeira tentativa
+            self.recorder.part_started(segment['part_number'])
+
+        # Conectar os sinais do worker
+        worker.log_signal.connect(self.log_signal.emit)
+        worker.status_signal.connect(self.status_signal.emit)
+        worker.finished_signal.connect(lambda w=worker, q=segment_queue, s=segment: self.worker_finished(w, q, s))
+        worker.error_signal.connect(self.worker_error)
+
+        # Iniciar o worker
+        worker.start()
+        self.workers.append(worker)
+        self.mutex.lock()
+        self.active_workers += 1
+        self.mutex.unlock()
+        return worker
+
+    def worker_finished(self, worker, segment_queue, segment):
+        """Chamado quando um worker termina o processamento
+
+        A parte só é gravada no histórico quando o resultado final é conhecido: aqui, se o FFmpeg
+        falhou, ou em handle_verification_results, depois da verificação.
+        """
         self.mutex.lock()
-        self.parts_completed += 1
+        self.active_workers -= 1
+        if worker.completed:
+            # Contada como concluída até a verificação dizer o contrário
+            self.parts_completed += 1
+            self.processed_duration += segment['duration']
+            self.pending_verifications += 1
+        elif self.is_running:
+            self.parts_failed += 1
         progress = (self.parts_completed / self.total_parts) * 100
         self.progress_signal.emit(progress)
         self.mutex.unlock()
+        self.governor.release(worker.slot)
 
         # Remover o worker da lista
         if worker in self.workers:
             self.workers.remove(worker)
 
+        output_file = segment_render.get_output_file(worker.output_directory, self.output_prefix, segment['part_number'])
+        if worker.completed:
+            # Agendar a verificação da parte gerada
+            self.verifier.submit(segment, output_file,
+                                 lambda seg, out, errors: self.verification_queue.put((seg, out, errors)))
+        elif self.is_running:
+            ffmpeg_utils.remove_partial_output(output_file)
+            self.recorder.part_finished(segment, 0.0, False)
+        eta = self.recorder.eta(self.processed_duration)
+        if eta is not None:
+            self.status_signal.emit(f"Tempo restante estimado: {job_history.format_duration(eta)}")
+
         # Verificar se há mais segmentos para processar
         if not segment_queue.empty() and self.is_running:
             segment = segment_queue.get()
-            new_worker = VideoCutterWorker(
-                self.input_file, self.image_file, self.selo_file, self.output_prefix,
-                segment['part_number'], self.min_duration, self.max_duration, self.output_directory,
-                self.chroma_color, self.similarity, self.blend, self.speed_profile,
-                self.restart_interval, segment['start_time'], segment['duration']
-            )
+            self.start_worker(segment, segment_queue)
+            self.log_signal.emit(f"Iniciando processamento da parte {segment['part_number']}")
 
-            # Conectar os sinais do worker
-            new_worker.log_signal.connect(self.log_signal.emit)
-            new_worker.status_signal.connect(self.status_signal.emit)
-            new_worker.finished_signal.connect(lambda w=new_worker, q=segment_queue: self.worker_finished(w, q))
-            new_worker.error_signal.connect(self.worker_error)
+    def handle_verification_results(self, segment_queue):
+        """Processa os resultados das verificações e recoloca na fila as partes com problemas"""
+        while True:
+            try:
+                segment, output_file, errors = self.verification_queue.get_nowait()
+            except queue.Empty:
+                return
 
-            # Iniciar o worker
-            new_worker.start()
-            self.workers.append(new_worker)
+            self.mutex.lock()
+            self.pending_verifications -= 1
+            self.mutex.unlock()
+            if not errors:
+                self.recorder.part_finished(segment, segment['duration'], True, [output_file])
+                continue
 
-            self.log_signal.emit(f"Iniciando processamento da parte {segment['part_number']}")
-        else:
-            # Decrementar o contador de workers ativos
+            part_number = segment['part_number']
+            attempts = self.verification_attempts.get(part_number, 0) + 1
+            self.verification_attempts[part_number] = attempts
+            self.log_signal.emit(f"Parte {part_number} falhou na verificação: {'; '.join(errors)}")
+
+            # Remover a saída inválida: para o FFmpeg gravá-la novamente ou para não entregá-la
+            ffmpeg_utils.remove_partial_output(output_file)
             self.mutex.lock()
-            self.active_workers -= 1
+            self.parts_completed -= 1
+            self.processed_duration -= segment['duration']
+            retry = attempts <= MAX_VERIFICATION_RETRIES and self.is_running
+            if not retry:
+                self.parts_failed += 1
             self.mutex.unlock()
+            if retry:
+                self.log_signal.emit(f"Recolocando a parte {part_number} na fila (nova tentativa {attempts} de {MAX_VERIFICATION_RETRIES})")
+                segment_queue.put(segment)
+            elif self.is_running:
+                self.log_signal.emit(f"Parte {part_number} descartada: reprovada na verificação após {MAX_VERIFICATION_RETRIES} novas tentativas.")
+                self.recorder.part_finished(segment, segment['duration'], False)
 
     def worker_error(self, error_message):
         """Chamado quando ocorre um erro em um worker"""
         self.error_signal.emit(error_message)
 
-    def stop(self):
-        """Para o processamento de todos os workers"""
+    def stop(self, timeout=1.0):
+        """Para o processamento de todos os workers
+
+        Os processos FFmpeg de todos os workers são encerrados juntos (com seus filhos), as threads
+        de supervisão são aguardadas até o prazo e as partes incompletas são removidas.
+
+        Returns:
+            int: Número de arquivos incompletos removidos
+        """
+        deadline = time.time() + timeout
         self.is_running = False
-        for worker in self.workers:
-            worker.stop()
+        workers = list(self.workers)
+        for worker in workers:
+            worker.stop(kill=False)
+        ffmpeg_utils.kill_process_trees([worker.process for worker in workers])
+        for worker in workers:
+            worker.join(deadline)
+        return sum(1 for worker in workers if worker.remove_partial_output())
 
     def get_video_duration(self, video_file):
         """Obtém a duração de um arquivo de vídeo usando FFmpeg"""
@@ -272,7 +386,7 @@ class VideoCutterWorker(QThread):
     def __init__(self, input_file, image_file, selo_file, output_prefix, part_number,
                  min_duration, max_duration, output_directory=None,
                  chroma_color="0x00d600", similarity=0.30, blend=0.35, speed_profile="balanced",
-                 restart_interval=5, start_time=None, duration=None):
+                 restart_interval=5, start_time=None, duration=None, slot=None):
         super().__init__()
         self.input_file = input_file
         self.image_file = image_file
@@ -290,8 +404,12 @@ class VideoCutterWorker(QThread):
         self.parts_processed = 0  # Contador de partes processadas desde a última reinicialização
         self.start_time = start_time  # Tempo de início do segmento a ser processado
         self.segment_duration = duration  # Duração do segmento a ser processado
+        self.slot = slot  # Vaga do governador de recursos (threads, núcleos e prioridade)
         self.is_running = True
         self.process = None
+        self.output_file = None  # Arquivo da parte em processamento (removido se cancelada)
+        self.completed = False  # True quando o FFmpeg terminou a parte com sucesso
+        self.supervisor_threads = []  # Threads de leitura da saída e de monitoramento do status
 
         # Variáveis para controle de progresso (acessíveis pela interface)
         self.current_duration = 0  # Duração da parte atual sendo processada
@@ -412,48 +530,16 @@ class VideoCutterWorker(QThread):
                     self.log_signal.emit(f"Aviso: A duração do clipe ({duration} s) é menor que 10s + duração do selo ({selo_duration} s). O selo pode não ser exibido completamente neste clipe (Parte {part_number}).")
 
                 # Construir o nome do arquivo de saída
-                output_file = os.path.join(self.output_directory, f"{self.output_prefix}{part_number}.mp4")
+                output_file = segment_render.get_output_file(self.output_directory, self.output_prefix, part_number)
+                self.output_file = output_file
 
                 self.log_signal.emit(f"Processando parte {part_number} (tempo: {current_time:.2f}s, duração: {duration:.2f}s)...")
 
-                # Construir o comando FFmpeg com base nas informações de resolução
-                filter_complex = [
-                    f"[0:v]trim=start={current_time}:duration={duration},setpts=PTS-STARTPTS[segment];"
-                ]
-
-                # Adicionar redimensionamento para o selo se necessário
-                if resolution_info['selo_needs_resize']:
-                    filter_complex.append(f"[2:v]format=rgba,{resolution_info['resize_filters']['selo']},setpts=PTS-STARTPTS[selo_rgba];")
-                else:
-                    filter_complex.append(f"[2:v]format=rgba,setpts=PTS-STARTPTS[selo_rgba];")
-
-                # Aplicar chroma key ao selo
-                filter_complex.append(f"[selo_rgba]colorkey=color={self.chroma_color}:similarity={self.similarity}:blend={self.blend}[selo_chroma];")
-                filter_complex.append(f"[selo_chroma]tpad=start_duration=10:color=black@0.0[selo_padded];")
-
-                # Sobrepor o selo ao segmento de vídeo
-                filter_complex.append(f"[segment][selo_padded]overlay=(W-w)/2:(H-h)/2:eof_action=pass[main_with_selo];")
-
-                # Adicionar redimensionamento para a imagem de capa se necessário
-                if resolution_info['cover_needs_resize']:
-                    # Primeiro redimensionar a imagem de capa
-                    filter_complex.append(f"[1:v]{resolution_info['resize_filters']['cover']}[cover_resized];")
-                    # Depois sobrepor a imagem redimensionada
-                    filter_complex.append(f"[main_with_selo][cover_resized]overlay=(W-w)/2:(H-h)/2:enable='eq(n,0)'[with_image];")
-                else:
-                    # Usar a imagem original se não precisar de redimensionamento
-                    filter_complex.append(f"[main_with_selo][1:v]overlay=(W-w)/2:(H-h)/2:enable='eq(n,0)'[with_image];")
-
-                # Ajustar o tamanho da fonte com base na resolução do vídeo
-                input_width, input_height = resolution_info['input_resolution']
-                # Calcular um tamanho de fonte proporcional à resolução
-                # Para 1080x1920, usamos fonte 150. Para outras resoluções, ajustamos proporcionalmente
-                font_size = int(min(input_width, input_height) * 0.14)  # 150 / 1080 ≈ 0.14
-
-                filter_complex.append(f"[with_image]drawtext=text='Parte {part_number}':fontfile='C\:/Windows/Fonts/arial.ttf':fontsize={font_size}:fontcolor=white:borderw={font_size//7}:bordercolor=black:x=(w-text_w)/2:y=(h-text_h)/2:enable='eq(n,0)'[final_v];")
-                filter_complex.append(f"[0:a]atrim=start={current_time}:duration={duration},asetpts=PTS-STARTPTS[final_a]")
-
-                filter_complex_str = "".join(filter_complex)
+                # Construir o filter_complex com base nas informações de resolução
+                filter_complex_str = segment_render.build_filter_complex(
+                    current_time, duration, part_number, resolution_info,
+                    self.chroma_color, self.similarity, self.blend
+                )
 
                 # Verificar qual codificador usar (hardware ou software) com o perfil de velocidade selecionado
                 encoder_name, encoder_params = ffmpeg_utils.get_video_encoder(self.speed_profile)
@@ -469,49 +555,12 @@ class VideoCutterWorker(QThread):
                 # A área será preenchida com informações reais de codificação quando o processo começar
                 self.status_signal.emit("")
 
-                # Configurar parâmetros base do comando
-                ffmpeg_cmd = [
-                    "ffmpeg"
-                ]
-
-                # Adicionar acelerador de hardware apropriado com base no codificador
-                # Detectar o fabricante da GPU
-                gpu_vendor = ffmpeg_utils.detect_gpu_vendor()
-
-                # Configurar o acelerador de hardware com base no fabricante da GPU e no codificador
-                if encoder_name == "h264_nvenc":
-                    ffmpeg_cmd.extend(["-hwaccel", "cuda"])
-                elif encoder_name == "h264_amf":
-                    ffmpeg_cmd.extend(["-hwaccel", "d3d11va"])
-                elif encoder_name == "h264_qsv":
-                    ffmpeg_cmd.extend(["-hwaccel", "qsv"])
-                elif gpu_vendor == "amd":
-                    # Fallback para AMD se o codificador não for específico
-                    ffmpeg_cmd.extend(["-hwaccel", "d3d11va"])
-                elif gpu_vendor == "nvidia":
-                    # Fallback para NVIDIA se o codificador não for específico
-                    ffmpeg_cmd.extend(["-hwaccel", "cuda"])
-                elif gpu_vendor == "intel":
-                    # Fallback para Intel se o codificador não for específico
-                    ffmpeg_cmd.extend(["-hwaccel", "qsv"])
-
-                # Adicionar o resto dos parâmetros
-                ffmpeg_cmd.extend([
-                    "-i", self.input_file,
-                    "-i", self.image_file,
-                    "-i", self.selo_file,
-                    "-filter_complex", filter_complex_str,
-                    "-map", "[final_v]", "-map", "[final_a]"
-                ])
-
-                # Adicionar parâmetros do codificador de vídeo
-                ffmpeg_cmd.extend(encoder_params)
-
-                # Adicionar parâmetros de áudio e finalização
-                ffmpeg_cmd.extend([
-                    "-c:a", "aac", "-b:a", "192k", "-movflags", "+faststart",
-                    output_file
-                ])
+                # Montar o comando FFmpeg com o acelerador de hardware apropriado
+                ffmpeg_cmd = segment_render.build_ffmpeg_command(
+                    self.input_file, self.image_file, self.selo_file, filter_complex_str,
+                    encoder_name, encoder_params, output_file, ffmpeg_utils.detect_gpu_vendor(),
+                    threads=self.slot.threads if self.slot else None
+                )
 
                 # Executar o comando FFmpeg
                 try:
@@ -519,7 +568,9 @@ class VideoCutterWorker(QThread):
                     # para garantir que sejam aplicados a todos os comandos FFmpeg
 
                     # Iniciar o processo FFmpeg
-                    self.process = ffmpeg_utils.run_ffmpeg_command(ffmpeg_cmd)
+                    self.process = ffmpeg_utils.run_ffmpeg_command(ffmpeg_cmd, **(self.slot.popen_kwargs() if self.slot else {}))
+                    if self.slot:
+                        self.slot.apply(self.process)
 
                     # Criar uma thread para ler a saída do FFmpeg e mostrar no log
                     def read_output():
@@ -681,6 +732,7 @@ class VideoCutterWorker(QThread):
                     read_thread = threading.Thread(target=read_output)
                     read_thread.daemon = True
                     read_thread.start()
+                    self.supervisor_threads.append(read_thread)
 
                     # Criar uma thread separada para monitorar o status e garantir que ele continue sendo atualizado
                     def monitor_status():
@@ -701,6 +753,7 @@ class VideoCutterWorker(QThread):
                     monitor_thread = threading.Thread(target=monitor_status)
                     monitor_thread.daemon = True
                     monitor_thread.start()
+                    self.supervisor_threads.append(monitor_thread)
 
                     # Aguardar a conclusão do processo, mas verificando periodicamente
                     # para garantir que a interface seja atualizada
@@ -710,6 +763,11 @@ class VideoCutterWorker(QThread):
                         # Forçar a atualização da interface
                         QApplication.processEvents()
 
+                    if not self.is_running:
+                        # Cancelado: o processo já foi encerrado por stop(); não há saída a aguardar
+                        self.log_signal.emit(f"Parte {part_number} cancelada.")
+                        return
+
                     # Aguardar um pouco para garantir que todas as mensagens de progresso sejam exibidas
                     time.sleep(0.5)
                     QApplication.processEvents()
@@ -729,6 +787,7 @@ class VideoCutterWorker(QThread):
                     if self.process.returncode != 0:
                         self.log_signal.emit(f"Erro ao processar parte {part_number}. Verifique o vídeo de entrada e tente novamente.")
                     else:
+                        self.completed = True
                         self.log_signal.emit(f"Parte {part_number} processada e salva com sucesso!")
                         # Incrementar o contador de partes processadas
                         self.parts_processed += 1
@@ -812,47 +871,171 @@ class VideoCutterWorker(QThread):
 
     def check_resolution_compatibility(self, input_res, cover_res, selo_res):
         """Verifica a compatibilidade entre as resoluções e determina quais arquivos precisam ser redimensionados"""
-        input_width, input_height = input_res
-        cover_width, cover_height = cover_res
-        selo_width, selo_height = selo_res
-
-        # Calcular a proporção (aspect ratio) do vídeo de entrada
-        input_aspect_ratio = input_width / input_height
-
-        # Inicializar o dicionário de resultado
-        result = {
-            'input_resolution': input_res,
-            'cover_needs_resize': False,
-            'selo_needs_resize': False,
-            'aspect_ratio': input_aspect_ratio,
-            'is_vertical': input_height > input_width,
-            'resize_filters': {}
-        }
+        return segment_render.check_resolution_compatibility(input_res, cover_res, selo_res)
 
-        # Verificar se a imagem de capa precisa ser redimensionada
-        if cover_width != input_width or cover_height != input_height:
-            result['cover_needs_resize'] = True
-            result['resize_filters']['cover'] = f"scale={input_width}:{input_height}"
+    def stop(self, kill=True):
+        """Para o processamento; com kill=False apenas sinaliza (o chamador encerra os processos em lote)"""
+        self.is_running = False
+        if kill:
+            ffmpeg_utils.kill_process_trees([self.process])
+
+    def join(self, deadline):
+        """Aguarda as threads de supervisão e o próprio worker terminarem, até o prazo (time.time())"""
+        for thread in self.supervisor_threads:
+            thread.join(max(0.0, deadline - time.time()))
+        self.wait(max(0, int((deadline - time.time()) * 1000)))
+
+    def remove_partial_output(self):
+        """Remove a saída da parte se o FFmpeg não terminou de gravá-la"""
+        if self.completed:
+            return False
+        return ffmpeg_utils.remove_partial_output(self.output_file)
+
+class EngineJobThread(QThread):
+    """Executa um trabalho do motor sem interface (job_engine) com os mesmos sinais do ParallelProcessor"""
+    progress_signal = pyqtSignal(float)
+    log_signal = pyqtSignal(str)
+    status_signal = pyqtSignal(str)
+    finished_signal = pyqtSignal()
+    error_signal = pyqtSignal(str)
 
-        # Verificar se o vídeo do selo precisa ser redimensionado
-        if selo_width != input_width or selo_height != input_height:
-            result['selo_needs_resize'] = True
-            result['resize_filters']['selo'] = f"scale={input_width}:{input_height}"
+    def __init__(self, job):
+        super().__init__()
+        self.engine = job_engine.ParallelJob(job, on_event=self.handle_event)
+        self.final_message = None  # Mensagem do evento 'finished' ou 'cancelled'
+        self.error_reported = False
 
-        return result
+    def run(self):
+        # Sempre termina com finished_signal ou error_signal, para a interface liberar os botões
+        if self.engine.run():
+            self.finished_signal.emit()
+        elif not self.error_reported:
+            self.error_signal.emit(self.final_message or "O trabalho terminou com erros. Verifique o log.")
+
+    def handle_event(self, event):
+        event_type = event['type']
+        if event_type == 'progress':
+            self.progress_signal.emit(event['value'])
+            if event.get('eta') is not None:
+                self.status_signal.emit(f"Tempo restante estimado: {job_history.format_duration(event['eta'])}")
+        elif event_type == 'error':
+            self.error_reported = True
+            self.error_signal.emit(event['message'])
+        elif event_type in ('finished', 'cancelled'):
+            # Com partes com erro ou cancelado, run() repassa a mensagem pelo error_signal
+            self.final_message = event['message']
+            self.log_signal.emit(event['message'])
+        elif event_type == 'part_done':
+            self.log_signal.emit(f"Parte {event['part_number']} concluída.")
+        elif event_type == 'part_failed':
+            self.log_signal.emit(f"Erro ao processar parte {event['part_number']}.")
+        elif 'message' in event:
+            self.log_signal.emit(event['message'])
 
     def stop(self):
-        """Para o processamento"""
-        self.is_running = False
-        if self.process:
-            try:
-                self.process.terminate()
-            except:
-                pass
+        self.engine.stop()
+
+class ServiceJobClient(QThread):
+    """Acompanha um trabalho executado pelo serviço local, com os mesmos sinais do ParallelProcessor"""
+    progress_signal = pyqtSignal(float)
+    log_signal = pyqtSignal(str)
+    status_signal = pyqtSignal(str)
+    finished_signal = pyqtSignal()
+    error_signal = pyqtSignal(str)
+
+    def __init__(self, job_id):
+        super().__init__()
+        self.job_id = job_id
+        self.detached = False
+
+    def run(self):
+        error_reported = False
+        try:
+            for event in job_service.iter_events(self.job_id, should_stop=lambda: self.detached):
+                if self.detached:
+                    return
+                event_type = event['type']
+                if event_type == 'progress':
+                    self.progress_signal.emit(event['value'])
+                    if event.get('eta') is not None:
+                        self.status_signal.emit(f"Tempo restante estimado: {job_history.format_duration(event['eta'])}")
+                elif event_type in ('log', 'part_done', 'part_failed', 'cancelled'):
+                    if 'message' in event:
+                        self.log_signal.emit(event['message'])
+                    elif event_type == 'part_done':
+                        self.log_signal.emit(f"Parte {event['part_number']} processada e salva com sucesso!")
+                    elif event_type == 'part_failed':
+                        self.log_signal.emit(f"Erro ao processar parte {event['part_number']}.")
+                elif event_type == 'finished':
+                    self.log_signal.emit(event['message'])
+                elif event_type == 'error':
+                    error_reported = True
+                    self.error_signal.emit(event['message'])
+                elif event_type == 'state':
+                    if event['state'] == 'finished':
+                        self.finished_signal.emit()
+                    elif event['state'] == 'failed' and not error_reported:
+                        self.error_signal.emit("O trabalho terminou com erros. Verifique o log.")
+                    return
+        except Exception as e:
+            if not self.detached:
+                self.error_signal.emit(f"Conexão com o serviço local perdida: {str(e)}")
+
+    def detach(self):
+        """Para de acompanhar o trabalho sem interrompê-lo no serviço"""
+        self.detached = True
+
+    def stop(self):
+        """Cancela o trabalho no serviço"""
+        try:
+            job_service.cancel_job(self.job_id)
+        except Exception as e:
+            self.log_signal.emit(f"Erro ao cancelar o trabalho no serviço: {str(e)}")
+        self.detached = True
+
+class ChromaPreviewDialog(QDialog):
+    """Janela de prévia do chroma key, atualizada ao alterar os parâmetros na janela principal"""
+
+    def __init__(self, parent, preview_cache):
+        super().__init__(parent)
+        self.setWindowTitle("Prévia do Chroma Key")
+        self.preview_cache = preview_cache
+        self.app = parent
+
+        layout = QVBoxLayout(self)
+        self.image_label = QLabel()
+        self.image_label.setAlignment(Qt.AlignCenter)
+        layout.addWidget(self.image_label)
+
+        # Seletor do frame do selo usado na prévia
+        frame_layout = QHBoxLayout()
+        frame_layout.addWidget(QLabel("Frame do selo:"))
+        self.frame_slider = QSlider(Qt.Horizontal)
+        self.frame_slider.setRange(0, len(preview_cache.selo_frames) - 1)
+        self.frame_slider.valueChanged.connect(self.update_preview)
+        frame_layout.addWidget(self.frame_slider)
+        layout.addLayout(frame_layout)
+
+        self.update_preview()
+
+    def update_preview(self, *args):
+        """Recalcula a prévia com os valores atuais de cor, similaridade e suavidade"""
+        try:
+            color = chroma_preview.parse_hex_color(self.app.chroma_color.text())
+        except ValueError:
+            # Cor incompleta enquanto o usuário digita: manter a prévia anterior
+            return
+        frame = self.preview_cache.render(color, self.app.similarity.value(), self.app.blend.value(),
+                                          self.frame_slider.value())
+        height, width, _ = frame.shape
+        image = QImage(frame.data, width, height, width * 3, QImage.Format_RGB888).copy()
+        self.image_label.setPixmap(QPixmap.fromImage(image))
 
 class VideoCutterApp(QMainWindow):
     def __init__(self):
         super().__init__()
+        # Semente do plano de segmentos: a prévia e o corte completo usam o mesmo plano
+        self.plan_seed = random.randrange(1 << 30)
         # Verificar se o FFmpeg está disponível
         self.check_ffmpeg()
         self.initUI()
@@ -1037,6 +1220,20 @@ class VideoCutterApp(QMainWindow):
         speed_profile_layout.addWidget(self.speed_profile)
         config_layout.addLayout(speed_profile_layout)
 
+        # Codificador: automático (H.264) ou HEVC/AV1 por software, para arquivos menores
+        encoder_layout = QHBoxLayout()
+        encoder_label = QLabel("Codificador:")
+        self.encoder = QComboBox()
+        self.encoder.addItem("Automático (H.264)", None)
+        self.encoder.addItem("HEVC (libx265)", "libx265")
+        self.encoder.addItem("AV1 (libsvtav1)", "libsvtav1")
+        self.encoder.setMinimumWidth(150)
+        self.encoder.setToolTip("Automático: o melhor codificador H.264 disponível (GPU ou libx264)\n"
+                                "HEVC e AV1: arquivos menores para o mesmo perfil, com codificação mais lenta no CPU")
+        encoder_layout.addWidget(encoder_label)
+        encoder_layout.addWidget(self.encoder)
+        config_layout.addLayout(encoder_layout)
+
         # Opções avançadas de otimização
         advanced_layout = QHBoxLayout()
 
@@ -1053,8 +1250,92 @@ class VideoCutterApp(QMainWindow):
         advanced_layout.addWidget(parallel_label)
         advanced_layout.addWidget(self.parallel_count)
 
+        # Opção de enviar o trabalho para o serviço local (continua rodando ao fechar a janela)
+        self.use_service = QCheckBox("Usar serviço local")
+        self.use_service.setToolTip("Envia o trabalho para o serviço local (python job_service.py serve).\nO processamento continua mesmo se a janela for fechada.")
+        advanced_layout.addWidget(self.use_service)
+
+        # Opções do governador de recursos
+        self.pin_cores = QCheckBox("Fixar núcleos")
+        self.pin_cores.setToolTip("Fixa cada processo paralelo em um conjunto exclusivo de núcleos da CPU.")
+        advanced_layout.addWidget(self.pin_cores)
+        self.background_priority = QCheckBox("Baixa prioridade")
+        self.background_priority.setToolTip("Executa o FFmpeg em baixa prioridade de CPU e disco,\npara não atrapalhar o uso do computador.")
+        advanced_layout.addWidget(self.background_priority)
+
+        # Área temporária local para entradas e saídas em rede (NAS)
+        self.use_scratch = QCheckBox("Área temporária local")
+        self.use_scratch.setToolTip("Copia a entrada para o disco local e grava as partes localmente antes de movê-las\npara a pasta de saída. Útil quando os arquivos estão em uma pasta de rede.")
+        advanced_layout.addWidget(self.use_scratch)
+
+        # Versões adicionais (ex.: 720p) geradas junto com cada parte
+        self.use_renditions = QCheckBox("Gerar versão 720p")
+        self.use_renditions.setToolTip("Gera também uma versão 720p com taxa de bits menor de cada parte,\nno mesmo processo FFmpeg (o vídeo é decodificado e sobreposto uma única vez).")
+        advanced_layout.addWidget(self.use_renditions)
+
+        # Cache de partes renderizadas: reaproveita partes iguais e o corpo das partes cuja cabeça mudou
+        self.use_render_cache = QCheckBox("Cache de renderização")
+        self.use_render_cache.setToolTip("Reaproveita partes já renderizadas com as mesmas configurações.\n"
+                                         "Se apenas a capa, o selo ou a numeração mudarem, só o início de cada parte é codificado.")
+        advanced_layout.addWidget(self.use_render_cache)
+
+        # Qualidade constante ajustada a cada entrada (menos bits em cenas simples)
+        self.use_quality_target = QCheckBox("Ajustar a qualidade ao vídeo")
+        self.use_quality_target.setToolTip("Codifica amostras curtas do vídeo em vários níveis de qualidade, mede o SSIM\n"
+                                           "e usa o de menor taxa de bits que ainda atinge a meta (arquivos menores em\n"
+                                           "cenas simples). O resultado fica salvo para o mesmo vídeo.")
+        advanced_layout.addWidget(self.use_quality_target)
+
+        # Recorte vertical que acompanha a ação em entradas horizontais
+        self.use_reframe = QCheckBox("Reenquadrar para vertical (9:16)")
+        self.use_reframe.setToolTip("Em vídeos horizontais (16:9), recorta uma janela vertical que acompanha o movimento\n"
+                                    "e os pontos de destaque do quadro. Requer o NumPy (sem ele, o recorte fica no centro).")
+        advanced_layout.addWidget(self.use_reframe)
+
+        # Miniatura, clipe curto e forma de onda gerados no mesmo processo FFmpeg de cada parte
+        self.use_side_outputs = QCheckBox("Miniatura e prévia para o CMS")
+        self.use_side_outputs.setToolTip("Gera para cada parte uma miniatura JPEG, um clipe curto em baixa resolução\n"
+                                         "e a forma de onda do áudio em PNG, sem decodificar a parte novamente.")
+        advanced_layout.addWidget(self.use_side_outputs)
+
         config_layout.addLayout(advanced_layout)
 
+        # Partes incluídas na prévia em baixa resolução
+        preview_layout = QHBoxLayout()
+        preview_label = QLabel("Partes da prévia:")
+        self.preview_parts = QLineEdit()
+        self.preview_parts.setPlaceholderText("Todas (ex.: 1-5, 10)")
+        self.preview_parts.setToolTip("Partes do plano renderizadas pelo botão 'Pré-visualizar'.\nDeixe vazio para gerar a prévia de todas as partes.")
+        preview_layout.addWidget(preview_label)
+        preview_layout.addWidget(self.preview_parts)
+        config_layout.addLayout(preview_layout)
+
+        # Formato de saída: MP4 ou apresentação segmentada (HLS/CMAF) gerada durante a codificação
+        format_layout = QHBoxLayout()
+        format_label = QLabel("Formato de saída:")
+        self.output_format = QComboBox()
+        self.output_format.addItems(["MP4", "HLS", "CMAF"])
+        self.output_format.setToolTip("HLS/CMAF: cada parte é gravada como playlist e segmentos, com uma playlist mestre do trabalho.")
+        segment_length_label = QLabel("Segmento (s):")
+        self.segment_length = QSpinBox()
+        self.segment_length.setRange(1, 30)
+        self.segment_length.setValue(hls_packaging.PACKAGING_DEFAULTS['segment_duration'])
+        self.segment_length.setToolTip("Duração dos segmentos HLS/CMAF (quadros-chave forçados em cada limite)")
+        format_layout.addWidget(format_label)
+        format_layout.addWidget(self.output_format)
+        format_layout.addWidget(segment_length_label)
+        format_layout.addWidget(self.segment_length)
+        # Pontos de corte das partes (cut_planner)
+        cut_planner_label = QLabel("Pontos de corte:")
+        self.cut_planner_mode = QComboBox()
+        self.cut_planner_mode.addItems(["Aleatórios", "Mudanças de cena", "Pausas no áudio"])
+        self.cut_planner_mode.setToolTip("Mudanças de cena: cada parte termina em uma troca de cena dentro das durações mínima e máxima.\n"
+                                         "Pausas no áudio: cada parte termina no trecho mais silencioso desse intervalo.\n"
+                                         "A análise da entrada é rápida e fica salva para os próximos planos. Requer o NumPy.")
+        format_layout.addWidget(cut_planner_label)
+        format_layout.addWidget(self.cut_planner_mode)
+        config_layout.addLayout(format_layout)
+
 
 
         config_group.setLayout(config_layout)
@@ -1095,9 +1376,16 @@ class VideoCutterApp(QMainWindow):
         self.similarity.setValue(0.30)
         self.similarity.setToolTip("Quanto maior o valor, mais tons da cor serão removidos (0.01-1.0)")
 
+        # Botão de estimativa automática da cor a partir do selo
+        estimate_button = QPushButton("Estimar Cor")
+        estimate_button.setFixedWidth(100)
+        estimate_button.setToolTip("Analisa o vídeo do selo e propõe cor, similaridade e suavidade")
+        estimate_button.clicked.connect(self.estimate_chroma_color)
+
         # Adicionar ao grid layout (linha 1)
         chroma_layout.addWidget(similarity_label, 1, 0)
         chroma_layout.addWidget(self.similarity, 1, 1)
+        chroma_layout.addWidget(estimate_button, 1, 2)
 
         # Suavidade de borda (linha 2)
         blend_label = QLabel("Suavidade de borda:")
@@ -1112,6 +1400,19 @@ class VideoCutterApp(QMainWindow):
         chroma_layout.addWidget(blend_label, 2, 0)
         chroma_layout.addWidget(self.blend, 2, 1)
 
+        # Botão da prévia interativa do chroma key (linha 3)
+        chroma_preview_button = QPushButton("Prévia")
+        chroma_preview_button.setFixedWidth(100)
+        chroma_preview_button.setToolTip("Mostra o selo com o chroma key aplicado sobre um frame do vídeo.\nA prévia é atualizada ao alterar a cor, a similaridade ou a suavidade.")
+        chroma_preview_button.clicked.connect(self.open_chroma_preview)
+        chroma_layout.addWidget(chroma_preview_button, 3, 2)
+
+        # Atualizar a prévia (se estiver aberta) sempre que os parâmetros mudarem
+        self.chroma_preview_dialog = None
+        self.chroma_color.textChanged.connect(self.refresh_chroma_preview)
+        self.similarity.valueChanged.connect(self.refresh_chroma_preview)
+        self.blend.valueChanged.connect(self.refresh_chroma_preview)
+
         # Definir o layout do grupo de Chroma Key
         chroma_group.setLayout(chroma_layout)
         main_layout.addWidget(chroma_group)
@@ -1172,13 +1473,26 @@ class VideoCutterApp(QMainWindow):
 
         self.cancel_button = QPushButton("Cancelar")
         self.cancel_button.setEnabled(False)
+        # Conectado uma única vez; cada início de trabalho apenas habilita o botão
+        self.cancel_button.clicked.connect(self.cancel_process)
         button_layout.addWidget(self.cancel_button)
 
+        # Botão para gerar a prévia em baixa resolução do plano
+        self.preview_button = QPushButton("Pré-visualizar")
+        self.preview_button.setToolTip("Renderiza as partes em baixa resolução (com capa, texto e selo)\npara conferir o plano antes do corte completo.")
+        self.preview_button.clicked.connect(self.start_preview)
+        button_layout.addWidget(self.preview_button)
+
         # Botão para abrir a pasta de saída
         self.open_folder_button = QPushButton("Abrir Pasta")
         self.open_folder_button.clicked.connect(self.open_output_folder)
         button_layout.addWidget(self.open_folder_button)
 
+        # Botão para anexar/desanexar de um trabalho do serviço local
+        self.attach_button = QPushButton("Anexar ao Serviço")
+        self.attach_button.clicked.connect(self.toggle_service_attach)
+        button_layout.addWidget(self.attach_button)
+
         main_layout.addLayout(button_layout)
 
         # Configurar o scroll area
@@ -1230,6 +1544,60 @@ class VideoCutterApp(QMainWindow):
             hex_color = color.name().replace("#", "0x")
             self.chroma_color.setText(hex_color)
 
+    def estimate_chroma_color(self):
+        """Estima os parâmetros do chroma key a partir do vídeo do selo"""
+        selo_file = self.selo_path.text()
+        if not os.path.isfile(selo_file):
+            QMessageBox.warning(self, "Aviso", "Selecione o vídeo do selo para estimar a cor.")
+            return
+
+        QApplication.setOverrideCursor(Qt.WaitCursor)
+        try:
+            estimate = chroma_estimate.estimate_chroma_key(selo_file)
+        except Exception as e:
+            QMessageBox.warning(self, "Erro", f"Não foi possível estimar a cor do chroma key:\n{str(e)}")
+            return
+        finally:
+            QApplication.restoreOverrideCursor()
+
+        self.chroma_color.setText(estimate['chroma_color'])
+        self.similarity.setValue(estimate['similarity'])
+        self.blend.setValue(estimate['blend'])
+        self.log(f"Chroma key estimado: cor {estimate['chroma_color']}, similaridade {estimate['similarity']:.2f}, "
+                 f"suavidade {estimate['blend']:.2f} ({estimate['coverage'] * 100:.0f}% do selo transparente, "
+                 f"{estimate['border_coverage'] * 100:.0f}% da borda)")
+        if estimate['border_coverage'] < 0.8:
+            self.log("Aviso: a cor estimada cobre pouco da borda do selo; confira o resultado na prévia.")
+
+    def open_chroma_preview(self):
+        """Decodifica os frames do selo e do vídeo uma vez e abre a prévia do chroma key"""
+        input_file = self.input_path.text()
+        selo_file = self.selo_path.text()
+        if not os.path.isfile(input_file) or not os.path.isfile(selo_file):
+            QMessageBox.warning(self, "Aviso", "Selecione o vídeo de entrada e o vídeo do selo para ver a prévia.")
+            return
+
+        QApplication.setOverrideCursor(Qt.WaitCursor)
+        try:
+            # Reaproveitar os frames já decodificados se os arquivos não mudaram
+            cache_key = (input_file, selo_file)
+            if getattr(self, 'chroma_preview_key', None) != cache_key:
+                self.chroma_preview_cache = chroma_preview.ChromaPreviewCache(input_file, selo_file)
+                self.chroma_preview_key = cache_key
+        except Exception as e:
+            QMessageBox.warning(self, "Erro", f"Não foi possível gerar a prévia do chroma key:\n{str(e)}")
+            return
+        finally:
+            QApplication.restoreOverrideCursor()
+
+        self.chroma_preview_dialog = ChromaPreviewDialog(self, self.chroma_preview_cache)
+        self.chroma_preview_dialog.show()
+
+    def refresh_chroma_preview(self, *args):
+        """Atualiza a prévia do chroma key, se estiver aberta"""
+        if self.chroma_preview_dialog is not None and self.chroma_preview_dialog.isVisible():
+            self.chroma_preview_dialog.update_preview()
+
     def log(self, message):
         """Adiciona uma mensagem à área de log"""
         self.log_area.append(message)
@@ -1416,7 +1784,7 @@ class VideoCutterApp(QMainWindow):
         gpu_vendor = ffmpeg_utils.detect_gpu_vendor()
 
         # Mostrar informações sobre o codificador
-        encoder_name, _ = ffmpeg_utils.get_video_encoder(speed_profile)
+        encoder_name, _ = ffmpeg_utils.get_video_encoder(speed_profile, encoder=self.encoder.currentData())
 
         # Exibir informações sobre o hardware e codificador
         if gpu_vendor == "amd" and encoder_name == "h264_amf":
@@ -1464,12 +1832,88 @@ class VideoCutterApp(QMainWindow):
         parallel_count = self.parallel_count.value()
         self.log(f"- Processamento paralelo: {parallel_count} processos simultâneos")
 
+        # Descrição do trabalho, usada pelo serviço local e pelo motor sem interface
+        job = {
+            'input_file': os.path.abspath(input_file),
+            'image_file': os.path.abspath(image_file),
+            'selo_file': os.path.abspath(selo_file),
+            'output_prefix': output_prefix,
+            'start_index': start_index,
+            'min_duration': min_duration,
+            'max_duration': max_duration,
+            'output_directory': os.path.abspath(output_directory) if output_directory else "",
+            'chroma_color': chroma_color,
+            'similarity': similarity,
+            'blend': blend,
+            'speed_profile': speed_profile,
+            'encoder': self.encoder.currentData(),
+            'parallel_count': parallel_count,
+            'plan_seed': self.plan_seed,
+            'cut_planner': self.get_cut_planner_mode(),
+            'pin_cores': self.pin_cores.isChecked(),
+            'background_priority': self.background_priority.isChecked(),
+            'scratch_dir': "auto" if self.use_scratch.isChecked() else None,
+            'renditions': segment_render.DEFAULT_RENDITIONS if self.use_renditions.isChecked() else None,
+            'render_cache': "auto" if self.use_render_cache.isChecked() else None,
+            'side_outputs': segment_render.DEFAULT_SIDE_OUTPUTS if self.use_side_outputs.isChecked() else None,
+            'reframe': True if self.use_reframe.isChecked() else None,
+            'quality_target': True if self.use_quality_target.isChecked() else None,
+            'packaging': None if self.output_format.currentIndex() == 0 else {
+                'format': self.output_format.currentText().lower(),
+                'segment_duration': self.segment_length.value(),
+            },
+        }
+
+        # Enviar o trabalho para o serviço local, se selecionado
+        if self.use_service.isChecked():
+            try:
+                job_id = job_service.submit_job(job)
+            except Exception as e:
+                QMessageBox.warning(self, "Aviso", f"Não foi possível enviar o trabalho ao serviço local:\n{str(e)}\n\n"
+                                    "Inicie o serviço com: python job_service.py serve")
+                self.start_button.setEnabled(True)
+                self.cancel_button.setEnabled(False)
+                return
+            self.log(f"- Trabalho enviado ao serviço local (id: {job_id})")
+            self.attach_to_job(job_id)
+            return
+
+        if self.use_scratch.isChecked() or self.use_renditions.isChecked() or job['packaging'] or job['render_cache'] \
+                or job['side_outputs'] or job['reframe'] or job['encoder'] or job['quality_target']:
+            # A área temporária local, as versões adicionais, o HLS/CMAF, o cache de renderização, as
+            # saídas auxiliares, o reenquadramento, os codificadores HEVC/AV1 e o ajuste de qualidade
+            # são gerenciados pelo motor sem interface (job_engine)
+            if self.use_scratch.isChecked():
+                self.log("- Área temporária local: entrada copiada e partes gravadas no disco local")
+            if self.use_renditions.isChecked():
+                suffixes = ", ".join(rendition['suffix'] for rendition in segment_render.DEFAULT_RENDITIONS)
+                self.log(f"- Versões adicionais de cada parte: {suffixes}")
+            if job['encoder']:
+                self.log(f"- Codificador pedido: {self.encoder.currentText()}")
+            if job['quality_target']:
+                self.log("- Qualidade ajustada ao vídeo por amostras (SSIM)")
+            if job['reframe']:
+                self.log("- Reenquadramento automático para vertical (9:16)")
+            if job['side_outputs']:
+                self.log("- Saídas auxiliares de cada parte: miniatura, clipe curto e forma de onda")
+            if job['packaging']:
+                self.log(f"- Saída em {self.output_format.currentText()} com segmentos de {self.segment_length.value()}s")
+            self.worker = EngineJobThread(job)
+            self.worker.progress_signal.connect(self.update_progress)
+            self.worker.log_signal.connect(self.log)
+            self.worker.status_signal.connect(self.update_status)
+            self.worker.finished_signal.connect(self.process_finished)
+            self.worker.error_signal.connect(self.process_error)
+            self.worker.start()
+            return
+
         # Criar e iniciar o processador paralelo
         self.worker = ParallelProcessor(
             input_file, image_file, selo_file, output_prefix,
             start_index, min_duration, max_duration, output_directory,
             chroma_color, similarity, blend, speed_profile, restart_interval,
-            parallel_count
+            parallel_count, self.plan_seed, self.pin_cores.isChecked(), self.background_priority.isChecked(),
+            job['cut_planner']
         )
 
         # Conectar os sinais
@@ -1479,12 +1923,115 @@ class VideoCutterApp(QMainWindow):
         self.worker.finished_signal.connect(self.process_finished)
         self.worker.error_signal.connect(self.process_error)
 
-        # Conectar o botão de cancelar
-        self.cancel_button.clicked.connect(self.cancel_process)
-
         # Iniciar o thread
         self.worker.start()
 
+    def get_cut_planner_mode(self):
+        """Modo do cut_planner correspondente à opção "Pontos de corte" """
+        return cut_planner.PLANNER_MODES[self.cut_planner_mode.currentIndex()]
+
+    def start_preview(self):
+        """Renderiza a prévia em baixa resolução das partes do plano"""
+        input_file = self.input_path.text()
+        image_file = self.image_path.text()
+        selo_file = self.selo_path.text()
+        if not input_file or not image_file or not selo_file:
+            QMessageBox.warning(self, "Aviso", "Por favor, selecione o vídeo de entrada, a imagem de capa e o vídeo do selo.")
+            return
+        if self.min_duration.value() >= self.max_duration.value():
+            QMessageBox.warning(self, "Aviso", "A duração mínima deve ser menor que a duração máxima.")
+            return
+        try:
+            parts = segment_render.parse_part_list(self.preview_parts.text())
+        except ValueError:
+            QMessageBox.warning(self, "Aviso", "Lista de partes inválida. Use o formato 1-5, 10.")
+            return
+
+        output_prefix = self.output_prefix.text() or "Prefixo Parte "
+        if not output_prefix.endswith(" "):
+            output_prefix += " "
+
+        job = {
+            'input_file': input_file,
+            'image_file': image_file,
+            'selo_file': selo_file,
+            'output_prefix': output_prefix,
+            'start_index': self.start_index.value(),
+            'min_duration': self.min_duration.value(),
+            'max_duration': self.max_duration.value(),
+            'output_directory': self.output_dir.text(),
+            'chroma_color': self.chroma_color.text(),
+            'similarity': self.similarity.value(),
+            'blend': self.blend.value(),
+            'parallel_count': self.parallel_count.value(),
+            'plan_seed': self.plan_seed,
+            'cut_planner': self.get_cut_planner_mode(),
+            'pin_cores': self.pin_cores.isChecked(),
+            'background_priority': self.background_priority.isChecked(),
+            'proxy': dict(segment_render.PROXY_DEFAULTS, parts=sorted(parts)),
+        }
+
+        self.log_area.clear()
+        self.status_area.clear()
+        self.update_progress(0.0)
+        self.log("Gerando prévia em baixa resolução do plano de corte...")
+        self.log(f"As prévias serão salvas na subpasta '{segment_render.PROXY_SUBFOLDER}' da pasta de saída.")
+
+        self.worker = EngineJobThread(job)
+        self.worker.progress_signal.connect(self.update_progress)
+        self.worker.log_signal.connect(self.log)
+        self.worker.status_signal.connect(self.update_status)
+        self.worker.finished_signal.connect(self.process_finished)
+        self.worker.error_signal.connect(self.process_error)
+
+        self.start_button.setEnabled(False)
+        self.cancel_button.setEnabled(True)
+        self.worker.start()
+
+    def attach_to_job(self, job_id):
+        """Passa a acompanhar um trabalho do serviço local"""
+        self.worker = ServiceJobClient(job_id)
+        self.worker.progress_signal.connect(self.update_progress)
+        self.worker.log_signal.connect(self.log)
+        self.worker.status_signal.connect(self.update_status)
+        self.worker.finished_signal.connect(self.process_finished)
+        self.worker.error_signal.connect(self.process_error)
+
+        self.start_button.setEnabled(False)
+        self.cancel_button.setEnabled(True)
+        self.attach_button.setText("Desanexar")
+        self.worker.start()
+
+    def toggle_service_attach(self):
+        """Anexa ao trabalho ativo mais recente do serviço local ou desanexa do trabalho atual"""
+        if isinstance(getattr(self, 'worker', None), ServiceJobClient) and self.worker.isRunning():
+            self.worker.detach()
+            self.log("Desanexado do trabalho. O processamento continua no serviço local.")
+            self.start_button.setEnabled(True)
+            self.cancel_button.setEnabled(False)
+            self.attach_button.setText("Anexar ao Serviço")
+            return
+
+        try:
+            jobs = job_service.list_jobs()
+        except Exception:
+            QMessageBox.information(self, "Informação", "O serviço local não está em execução.\n\n"
+                                    "Inicie o serviço com: python job_service.py serve")
+            return
+
+        active_jobs = [job for job in jobs if job['state'] in ("running", "queued")]
+        if not active_jobs:
+            QMessageBox.information(self, "Informação", "Nenhum trabalho ativo no serviço local.")
+            return
+
+        # Preferir o trabalho em execução; senão o próximo da fila
+        active_jobs.sort(key=lambda job: (job['state'] != "running", job['submitted_at']))
+        job = active_jobs[0]
+        self.log_area.clear()
+        self.status_area.clear()
+        self.log(f"Anexado ao trabalho {job['job_id']} ({os.path.basename(job['input_file'])})")
+        self.attach_to_job(job['job_id'])
+
     def update_progress(self, value):
         """Atualiza a barra de progresso e o rótulo de porcentagem"""
         # Garantir que o valor esteja entre 0 e 100
@@ -1516,6 +2063,7 @@ class VideoCutterApp(QMainWindow):
 
         self.start_button.setEnabled(True)
         self.cancel_button.setEnabled(False)
+        self.attach_button.setText("Anexar ao Serviço")
 
     def process_error(self, error_message):
         """Chamado quando ocorre um erro no processo"""
@@ -1524,6 +2072,7 @@ class VideoCutterApp(QMainWindow):
         self.status_area.clear()  # Limpar a área de status
         self.start_button.setEnabled(True)
         self.cancel_button.setEnabled(False)
+        self.attach_button.setText("Anexar ao Serviço")
 
     def cancel_process(self):
         """Cancela o processo em execução"""
@@ -1534,10 +2083,31 @@ class VideoCutterApp(QMainWindow):
             if reply == QMessageBox.Yes:
                 self.log("Cancelando processo...")
                 self.status_area.clear()  # Limpar a área de status
-                self.worker.stop()  # Isso irá parar todos os workers no ParallelProcessor
+                started = time.time()
+                removed = self.stop_worker()
+                self.log(f"Processo cancelado em {time.time() - started:.2f}s.")
+                if removed:
+                    self.log(f"{removed} arquivo(s) incompleto(s) removido(s).")
                 self.start_button.setEnabled(True)
                 self.cancel_button.setEnabled(False)
 
+    def stop_worker(self, timeout=1.0):
+        """Para o worker atual (e todos os processos FFmpeg) e aguarda sua thread até o prazo"""
+        deadline = time.time() + timeout
+        removed = self.worker.stop()  # Isso irá parar todos os workers no ParallelProcessor
+        self.worker.wait(max(0, int((deadline - time.time()) * 1000)))
+        return removed or 0
+
+    def closeEvent(self, event):
+        """Ao fechar a janela, não deixar processos FFmpeg órfãos ocupando a CPU"""
+        if hasattr(self, 'worker') and self.worker.isRunning():
+            if isinstance(self.worker, ServiceJobClient):
+                # O trabalho continua no serviço local; apenas desanexar
+                self.worker.detach()
+            else:
+                self.stop_worker()
+        event.accept()
+
     def open_output_folder(self):
         """Abre a pasta de saída no explorador de arquivos"""
         # Determinar a pasta de saída
@@ -0,0 +1,350 @@
+"""Modo de pasta monitorada: processa automaticamente os vídeos colocados em pastas configuradas
+
+Usa inotify no Linux (via ctypes, sem dependências extras) e varredura periódica nos demais
+sistemas. Um arquivo só entra na fila quando termina de ser gravado: o tamanho precisa ficar
+estável por alguns segundos ou o inotify precisa informar que o arquivo foi fechado após a escrita.
+
+Arquivo de configuração (JSON):
+
+    {
+        "max_slots": 4,
+        "stable_seconds": 10,
+        "folders": [
+            {
+                "path": "D:/Gravacoes/Canal A",
+                "template": {
+                    "output_prefix": "{name} Parte ",
+                    "image_file": "D:/Modelos/capa.png",
+                    "selo_file": "D:/Modelos/selo.mp4",
+                    "chroma_color": "0x00d600",
+                    "similarity": 0.30,
+                    "blend": 0.35
+                }
+            }
+        ]
+    }
+
+Sem "output_directory" no modelo, as partes são salvas na subpasta "processados" da pasta monitorada.
+A pasta de saída não pode ser uma das pastas monitoradas (a configuração é recusada ao iniciar).
+No prefixo, {name} é o nome do arquivo de entrada sem extensão e {date} a data atual (AAAA-MM-DD).
+O limite "max_slots" é compartilhado entre todas as pastas: é o número máximo de processos FFmpeg
+simultâneos na máquina, independente de quantos arquivos estiverem em processamento. As opções
+opcionais "thread_budget", "pin_cores" e "background_priority" configuram o governador de recursos
+que divide as threads da CPU entre essas vagas (ver resource_governor.py). Com "metrics_port"
+e/ou "metrics_textfile", as métricas de todos os trabalhos são expostas no formato do
+Prometheus (ver metrics_exporter.py).
+
+Uso:
+    python watch_folder.py config.json
+"""
+import ctypes
+import ctypes.util
+import json
+import os
+import select
+import struct
+import sys
+import threading
+import time
+
+import ffmpeg_utils
+import metrics_exporter
+import resource_governor
+from job_engine import ParallelJob
+from job_service import JOB_DEFAULTS
+
+VIDEO_EXTENSIONS = ('.mp4', '.mkv', '.avi', '.mov', '.ts', '.flv')
+# Arquivo em cada pasta monitorada com os vídeos já processados (evita reprocessar após reiniciar)
+STATE_FILE_NAME = ".video_cutter_processados.json"
+# Subpasta de saída usada quando o modelo não define "output_directory"
+OUTPUT_SUBFOLDER = "processados"
+
+# Constantes do inotify (linux/inotify.h)
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_NONBLOCK = os.O_NONBLOCK if hasattr(os, 'O_NONBLOCK') else 0
+
+
+class InotifyWatcher:
+    """Recebe eventos de criação/escrita/fechamento de arquivos nas pastas monitoradas (Linux)"""
+
+    def __init__(self, folders):
+        libc_name = ctypes.util.find_library("c")
+        self.libc = ctypes.CDLL(libc_name, use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 falhou")
+        self.watch_dirs = {}
+        for folder in folders:
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(folder),
+                                             IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE)
+            if wd < 0:
+                raise OSError(ctypes.get_errno(), f"inotify_add_watch falhou para {folder}")
+            self.watch_dirs[wd] = folder
+
+    def wait(self, timeout):
+        """Aguarda eventos por até timeout segundos e retorna [(caminho, fechado)]"""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            buffer = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+
+        events = []
+        offset = 0
+        while offset + 16 <= len(buffer):
+            wd, mask, _cookie, name_len = struct.unpack_from("iIII", buffer, offset)
+            name = buffer[offset + 16:offset + 16 + name_len].rstrip(b"\0")
+            offset += 16 + name_len
+            if wd in self.watch_dirs and name:
+                path = os.path.join(self.watch_dirs[wd], os.fsdecode(name))
+                events.append((path, bool(mask & (IN_CLOSE_WRITE | IN_MOVED_TO))))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    """Alternativa sem inotify: apenas aguarda o intervalo de varredura"""
+
+    def __init__(self, folders):
+        self.folders = folders
+
+    def wait(self, timeout):
+        time.sleep(timeout)
+        return []
+
+    def close(self):
+        pass
+
+
+def create_watcher(folders):
+    """Usa inotify quando disponível e varredura periódica como alternativa"""
+    if sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(folders)
+        except (OSError, AttributeError) as e:
+            print(f"inotify indisponível ({str(e)}), usando varredura periódica.")
+    return PollingWatcher(folders)
+
+
+def is_file_released(path):
+    """Verifica se nenhum outro processo mantém o arquivo aberto para escrita (Windows)"""
+    if os.name != 'nt':
+        return True
+    try:
+        # No Windows, renomear um arquivo para ele mesmo falha enquanto o gravador o mantém aberto
+        os.rename(path, path)
+        return True
+    except OSError:
+        return False
+
+
+class StabilityTracker:
+    """Acompanha o tamanho dos arquivos e informa quando terminaram de ser gravados"""
+
+    def __init__(self, stable_seconds):
+        self.stable_seconds = stable_seconds
+        self.files = {}  # caminho -> {'size', 'mtime', 'since', 'closed'}
+
+    def observe(self, path, closed=False):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            self.files.pop(path, None)
+            return
+        now = time.time()
+        info = self.files.get(path)
+        if info is None or info['size'] != stat.st_size or info['mtime'] != stat.st_mtime:
+            # O arquivo mudou: reiniciar a contagem de estabilidade
+            self.files[path] = {'size': stat.st_size, 'mtime': stat.st_mtime, 'since': now, 'closed': closed}
+        elif closed:
+            info['closed'] = True
+
+    def pop_ready(self):
+        """Retorna (e deixa de acompanhar) os arquivos prontos para processamento"""
+        now = time.time()
+        ready = []
+        for path, info in list(self.files.items()):
+            if info['size'] == 0:
+                continue
+            if (info['closed'] or now - info['since'] >= self.stable_seconds) and is_file_released(path):
+                ready.append(path)
+                del self.files[path]
+        return ready
+
+
+class WatchFolderDaemon:
+    """Monitora várias pastas e processa cada novo vídeo com o modelo de trabalho da pasta"""
+
+    def __init__(self, config):
+        self.folders = {}
+        for folder in config['folders']:
+            path = os.path.abspath(folder['path'])
+            self.folders[path] = folder.get('template', {})
+        for path, template in self.folders.items():
+            # As partes geradas em uma pasta monitorada seriam cortadas de novo, sem fim
+            output_directory = template.get('output_directory')
+            if output_directory and os.path.abspath(output_directory) in self.folders:
+                raise ValueError(f"A pasta de saída do modelo de {path} ({output_directory}) é uma pasta monitorada; "
+                                 f"use outra pasta ou omita \"output_directory\" para usar a subpasta \"{OUTPUT_SUBFOLDER}\".")
+        self.poll_interval = config.get('poll_interval', 2)
+        self.tracker = StabilityTracker(config.get('stable_seconds', 10))
+        # Limite global de processos FFmpeg e das threads de cada um, compartilhado por todos os trabalhos de todas as pastas
+        self.slot_pool = resource_governor.create_governor(config, max(1, int(config.get('max_slots', 2))))
+        self.metrics = None
+        if config.get('metrics_port') or config.get('metrics_textfile'):
+            self.metrics = metrics_exporter.MetricsRegistry()
+            metrics_exporter.start_exporter(self.metrics, config.get('metrics_port'), config.get('metrics_textfile'))
+        self.processed = {path: self._load_state(path) for path in self.folders}
+        self.in_progress = set()
+        self.jobs = {}  # Arquivo de entrada -> ParallelJob em execução
+        self.lock = threading.Lock()
+        self.is_running = True
+        self.threads = []  # Threads dos trabalhos iniciados
+
+    def _state_path(self, folder):
+        return os.path.join(folder, STATE_FILE_NAME)
+
+    def _load_state(self, folder):
+        try:
+            with open(self._state_path(folder), "r", encoding="utf-8") as f:
+                return set(json.load(f))
+        except (OSError, ValueError):
+            return set()
+
+    def _save_state(self, folder):
+        tmp_path = self._state_path(folder) + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(sorted(self.processed[folder]), f, indent=2)
+        os.replace(tmp_path, self._state_path(folder))
+
+    def _is_candidate(self, path):
+        folder = os.path.dirname(path)
+        name = os.path.basename(path)
+        if folder not in self.folders or name.startswith("."):
+            return False
+        if not name.lower().endswith(VIDEO_EXTENSIONS):
+            return False
+        with self.lock:
+            return name not in self.processed[folder] and path not in self.in_progress
+
+    def scan(self):
+        for folder in self.folders:
+            try:
+                names = os.listdir(folder)
+            except OSError as e:
+                print(f"Erro ao listar a pasta {folder}: {str(e)}")
+                continue
+            for name in names:
+                path = os.path.join(folder, name)
+                if self._is_candidate(path):
+                    self.tracker.observe(path)
+
+    def build_job(self, input_file):
+        """Monta a configuração do trabalho a partir do modelo da pasta"""
+        folder = os.path.dirname(input_file)
+        template = self.folders[folder]
+        job = dict(JOB_DEFAULTS)
+        job.update(template)
+        job['input_file'] = input_file
+        job['output_prefix'] = job['output_prefix'].format(
+            name=os.path.splitext(os.path.basename(input_file))[0], date=time.strftime("%Y-%m-%d"))
+        if job['output_prefix'] and not job['output_prefix'].endswith(" "):
+            job['output_prefix'] += " "
+        if not job.get('output_directory'):
+            # Subpasta própria: as partes geradas não são monitoradas como novas entradas
+            job['output_directory'] = os.path.join(folder, OUTPUT_SUBFOLDER)
+        return job
+
+    def process_file(self, input_file):
+        folder = os.path.dirname(input_file)
+        name = os.path.basename(input_file)
+        print(f"[{time.strftime('%H:%M:%S')}] Novo vídeo pronto: {input_file}")
+
+        observe = self.metrics.track_job() if self.metrics is not None else None
+
+        def on_event(event):
+            if observe is not None:
+                observe(event)
+            if 'message' in event:
+                print(f"[{time.strftime('%H:%M:%S')}] {name}: {event['message']}")
+
+        job = ParallelJob(self.build_job(input_file), on_event=on_event, slot_pool=self.slot_pool)
+        with self.lock:
+            if not self.is_running:
+                self.in_progress.discard(input_file)
+                return
+            self.jobs[input_file] = job
+        ok = job.run()
+        with self.lock:
+            self.jobs.pop(input_file, None)
+            self.in_progress.discard(input_file)
+            if not job.is_running:
+                # Interrompido pelo encerramento do monitor: processar de novo na próxima execução
+                return
+            # Registrar também falhas para não reprocessar em loop; basta remover do arquivo de estado para repetir
+            self.processed[folder].add(name)
+            self._save_state(folder)
+        print(f"[{time.strftime('%H:%M:%S')}] {name}: {'concluído' if ok else 'terminou com erros'}")
+
+    def run(self):
+        watcher = create_watcher(list(self.folders))
+        print(f"Monitorando {len(self.folders)} pasta(s) com {type(watcher).__name__}")
+        try:
+            while self.is_running:
+                self.scan()
+                for path, closed in watcher.wait(self.poll_interval):
+                    if self._is_candidate(path):
+                        self.tracker.observe(path, closed)
+                for path in self.tracker.pop_ready():
+                    with self.lock:
+                        self.in_progress.add(path)
+                    thread = threading.Thread(target=self.process_file, args=(path,), daemon=True)
+                    self.threads.append(thread)
+                    thread.start()
+                self.threads = [thread for thread in self.threads if thread.is_alive()]
+        finally:
+            watcher.close()
+
+    def stop(self, timeout=10.0):
+        """Para o monitoramento e encerra os trabalhos em andamento (com os seus processos FFmpeg)"""
+        with self.lock:
+            self.is_running = False
+            jobs = list(self.jobs.values())
+        for job in jobs:
+            job.stop()
+        deadline = time.time() + timeout
+        for thread in list(self.threads):
+            thread.join(max(0.0, deadline - time.time()))
+
+
+def main(argv=None):
+    argv = argv if argv is not None else sys.argv[1:]
+    if len(argv) != 1:
+        print("Uso: python watch_folder.py config.json")
+        return 1
+    with open(argv[0], "r", encoding="utf-8") as f:
+        config = json.load(f)
+    try:
+        daemon = WatchFolderDaemon(config)
+    except ValueError as e:
+        print(f"Configuração inválida: {str(e)}")
+        return 1
+    ffmpeg_utils.handle_termination_signal()
+    try:
+        daemon.run()
+    except KeyboardInterrupt:
+        print("Encerrando o monitor e os processos FFmpeg em andamento...")
+    finally:
+        daemon.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())